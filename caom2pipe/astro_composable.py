@@ -68,8 +68,10 @@
 
 import io
 import logging
+import re
 import requests
 import subprocess
+import sys
 import traceback
 
 from astropy import units
@@ -79,6 +81,7 @@ from astropy.coordinates import EarthLocation
 from astropy.time import Time, TimeDelta
 from astropy.coordinates import SkyCoord
 
+from collections.abc import Mapping
 from datetime import timedelta as dt_timedelta
 from datetime import datetime as dt_datetime
 from enum import Enum
@@ -103,6 +106,8 @@ __all__ = [
     'build_ra_dec_as_deg',
     'check_fits',
     'check_fitsverify',
+    'check_h5_structure',
+    'CompactHeader',
     'convert_time',
     'FilterMetadataCache',
     'get_datetime_mjd',
@@ -111,7 +116,11 @@ __all__ = [
     'get_timedelta_in_s',
     'get_vo_table',
     'get_vo_table_session',
+    'H5Attributes',
+    'H5Headers',
     'is_good_date',
+    'make_compact_headers',
+    'make_h5_headers',
     'make_headers_from_file',
     'read_fits_data',
     'SVO_URL',
@@ -214,6 +223,25 @@ def check_h5(fqn):
     return True
 
 
+def check_h5_structure(fqn):
+    """
+    An in-process alternative to check_h5, for when spawning h5check for
+    every file costs too much. Every group and dataset is visited, and every
+    attribute is read, but no dataset values are read, so this is a check that
+    the file structure is readable, not a format compliance check.
+
+    :param fqn: str fully-qualified file name on local storage
+    :return: bool True if the structure is readable, False otherwise
+    """
+    try:
+        with make_h5_headers(fqn, check=True):
+            pass
+    except mc.CadcException as e:
+        logging.error(f'HDF5 structure check failed with {e} when reading {fqn}')
+        return False
+    return True
+
+
 def convert_time(start_time, exposure):
     """Convert a start time and exposure length into an mjd_start and mjd_end
     time."""
@@ -431,6 +459,82 @@ def make_headers_from_file(fqn):
     return headers
 
 
+def make_compact_headers(fits_header):
+    """Create a list of CompactHeader instances from a string with one card
+    per line, like the fhead output of CADC storage. This follows the rules
+    of data_util.make_headers_from_string for lines that are not cards, and
+    for the separation of HDUs.
+
+    :param fits_header: str of keyword/value pairs, one per line
+    :return: [CompactHeader]
+    """
+    headers = []
+    cards = []
+    first_header_encountered = False
+
+    def _end_hdu():
+        if len(cards) > 0:
+            if any(len(card) > FITS_CARD_BYTES for card in cards):
+                # not a card per line, so leave it to astropy
+                headers.append(fits.Header.fromstring('\n'.join(cards), sep='\n'))
+            else:
+                headers.append(CompactHeader(raw=''.join(card.ljust(FITS_CARD_BYTES) for card in cards)))
+        cards.clear()
+
+    for line in fits_header.split('\n'):
+        if len(line.strip()) == 0:
+            pass
+        elif line.startswith('--- PHU ---'):
+            first_header_encountered = True
+        elif line.startswith('--- HDU 0'):
+            if first_header_encountered:
+                _end_hdu()
+            else:
+                first_header_encountered = True
+        elif line.startswith('--- HDU') or line.strip() == 'END':
+            _end_hdu()
+        elif '=' not in line and not (line.startswith('COMMENT') or line.startswith('HISTORY')):
+            pass
+        else:
+            cards.append(line)
+    _end_hdu()
+    return headers
+
+
+def make_h5_headers(fqn, check=False):
+    """Open an HDF5 file once, and describe its groups and datasets, without
+    reading any attributes until they are used.
+
+    :param fqn: str fully-qualified file name on local storage
+    :param check: bool if True, read every attribute, and the shape and type
+        of every dataset, so that a file with an unreadable structure fails
+        here
+    :return: H5Headers instance, which owns the open h5py.File, so close it,
+        or use it as a context manager, when it is no longer needed
+    """
+    # local import because h5py is not declared as a caom2pipe dependency, as
+    # most collections do not require it
+    import h5py
+
+    h5_file = None
+    try:
+        h5_file = h5py.File(fqn, 'r')
+        headers = H5Headers(h5_file)
+        headers.append(H5Attributes(h5_file))
+        h5_file.visititems(lambda name, h5_object: headers.append(H5Attributes(h5_object)))
+        if check:
+            for header in headers:
+                len(header)
+                if isinstance(header.h5_object, h5py.Dataset):
+                    header.h5_object.shape, header.h5_object.dtype
+        return headers
+    except Exception as e:
+        logging.debug(traceback.format_exc())
+        if h5_file is not None:
+            h5_file.close()
+        raise mc.CadcException(f'Could not read HDF5 structure of {fqn} because {e}')
+
+
 def read_fits_data(fqn):
     """Read a complete fits file, including the data.
     :param fqn a string representing the fully-qualified name of the fits
@@ -441,6 +545,228 @@ def read_fits_data(fqn):
     return hdus
 
 
+# FITS header cards are 80 bytes long, and the keyword is the first 8 bytes. Headers are padded to 2880 bytes.
+FITS_BLOCK_BYTES = 2880
+FITS_CARD_BYTES = 80
+FITS_KEYWORD_BYTES = 8
+# astropy treats these cards differently from the one-card-per-keyword cards
+_COMMENTARY_KEYWORDS = ('', 'COMMENT', 'HISTORY')
+_RECORD_VALUED_CARD = re.compile(r"=\s*'\s*[a-zA-Z_]\w*(\.\w+)*\s*:\s*[+-]?[0-9.]+([eEdD][+-]?\d+)?\s*'")
+
+
+class CompactHeader(fits.Header):
+    """An astropy.io.fits.Header that holds the 80-byte cards of an HDU as a single string, until something other than
+    a keyword lookup needs them as astropy Card instances. Looking up a keyword value with [] or get, checking for a
+    keyword with in, and iterating over the keywords, find the cards in the string, and parse only the card that is
+    asked for.
+
+    Headers with long-string (CONTINUE), HIERARCH, or record-valued cards are always parsed by astropy.
+    """
+
+    def __init__(self, cards=[], copy=False, raw=None):
+        """
+        :param cards: as for astropy.io.fits.Header, if raw is None
+        :param copy: as for astropy.io.fits.Header, if raw is None
+        :param raw: str the cards of one HDU, 80 bytes each, without the END card
+        """
+        if raw is None:
+            super().__init__(cards, copy)
+        else:
+            self._raw = raw
+            self._index = None
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        """
+        :param blocks: str the header blocks of one HDU, as they are in a FITS file
+        :return: CompactHeader instance
+        """
+        for offset in range(0, len(blocks), FITS_CARD_BYTES):
+            if blocks[offset:offset + FITS_KEYWORD_BYTES].rstrip() == 'END':
+                return cls(raw=blocks[:offset])
+        return cls(raw=blocks)
+
+    def __getattr__(self, name):
+        # only called for attributes that are not set, which includes all the astropy Header attributes until the
+        # cards are parsed
+        if name.startswith('__') or self.__dict__.get('_raw') is None:
+            raise AttributeError(name)
+        self._parse()
+        return getattr(self, name)
+
+    def __contains__(self, keyword):
+        index = self._fast_index(keyword)
+        if index is None:
+            return super().__contains__(keyword)
+        return keyword.upper() in index
+
+    def __getitem__(self, key):
+        index = self._fast_index(key)
+        if index is None:
+            return super().__getitem__(key)
+        offset = index.get(key.upper())
+        if offset is None:
+            raise KeyError(f"Keyword '{key}' not found.")
+        value = fits.Card.fromstring(self._raw[offset:offset + FITS_CARD_BYTES]).value
+        if value == fits.card.UNDEFINED:
+            return None
+        return value
+
+    def __iter__(self):
+        if self._keyword_index() is None:
+            yield from super().__iter__()
+        else:
+            for offset in range(0, len(self._raw), FITS_CARD_BYTES):
+                yield self._raw[offset:offset + FITS_KEYWORD_BYTES].rstrip().upper()
+
+    def __len__(self):
+        if self._keyword_index() is None:
+            return super().__len__()
+        return len(self._raw) // FITS_CARD_BYTES
+
+    def keys(self):
+        return self.__iter__()
+
+    def tostring(self, sep='', endcard=True, padding=True):
+        if self.__dict__.get('_raw') is None or sep != '':
+            return super().tostring(sep, endcard, padding)
+        result = self._raw
+        if endcard:
+            result += 'END'.ljust(FITS_CARD_BYTES)
+        if padding:
+            result += ' ' * (-len(result) % FITS_BLOCK_BYTES)
+        return result
+
+    def _fast_index(self, key):
+        """
+        :return: the keyword index, if the key can be looked up without parsing the cards, None otherwise
+        """
+        if (
+            not isinstance(key, str)
+            or key != key.strip()
+            or len(key) > FITS_KEYWORD_BYTES
+            or any(ii in key for ii in '*?.')
+            or key.upper() in _COMMENTARY_KEYWORDS
+        ):
+            return None
+        return self._keyword_index()
+
+    def _keyword_index(self):
+        """
+        :return: dict of keyword: offset of the first card with the keyword, or None if the cards need to be parsed
+        """
+        if self.__dict__.get('_raw') is None:
+            return None
+        if self._index is None:
+            index = {}
+            for offset in range(0, len(self._raw), FITS_CARD_BYTES):
+                card = self._raw[offset:offset + FITS_CARD_BYTES]
+                keyword = card[:FITS_KEYWORD_BYTES].rstrip().upper()
+                if keyword in ('CONTINUE', 'HIERARCH') or (':' in card and _RECORD_VALUED_CARD.match(card, 8)):
+                    self._index = False
+                    break
+                index.setdefault(keyword, offset)
+            else:
+                self._index = index
+        return self._index if self._index is not False else None
+
+    def _parse(self):
+        parsed = fits.Header.fromstring(self._raw)
+        self.__dict__.update(parsed.__dict__)
+        self._raw = None
+        self._index = None
+
+
+class H5Attributes(Mapping):
+    """The attributes of an HDF5 group or dataset, with the keyword lookups
+    of a fits.Header. The attributes are read, and converted to Python values,
+    on first use."""
+
+    def __init__(self, h5_object):
+        """
+        :param h5_object: h5py.Group or h5py.Dataset instance
+        """
+        self.h5_object = h5_object
+        self._attributes = None
+
+    @property
+    def name(self):
+        return self.h5_object.name
+
+    def _read(self):
+        if self._attributes is None:
+            self._attributes = {key: _h5_to_python(value) for key, value in self.h5_object.attrs.items()}
+        return self._attributes
+
+    def __getitem__(self, key):
+        return self._read()[key]
+
+    def __iter__(self):
+        return iter(self._read())
+
+    def __len__(self):
+        return len(self._read())
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.name})'
+
+
+class H5Headers(list):
+    """The H5Attributes of the root group, and of every group and dataset
+    below it, in the order h5py visits them, which is what
+    MetadataReader.headers holds for an HDF5 file. The open h5py.File, for
+    use by an Hdf5Parser, is h5_file.
+
+    The instance owns h5_file. It is closed by close, on leaving a with
+    block, or once the instance is garbage-collected, which, for the
+    MetadataReader content, is once the content is reset or evicted.
+    """
+
+    def __init__(self, h5_file):
+        super().__init__()
+        self.h5_file = h5_file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self.h5_file is not None:
+            self.h5_file.close()
+            self.h5_file = None
+
+    def estimate_bytes(self):
+        """
+        :return: int an estimate of the memory used by the open file, which
+            is the HDF5 metadata cache, and by the attributes, as if each
+            were an 80-byte FITS card, without reading the attributes
+        """
+        if self.h5_file is None or not self.h5_file.id.valid:
+            return sys.getsizeof(self)
+        result = self.h5_file.id.get_mdc_size()[2]
+        for header in self:
+            result += len(header.h5_object.attrs) * FITS_CARD_BYTES
+        return result
+
+
+def _h5_to_python(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    if hasattr(value, 'tolist'):
+        # numpy scalars and arrays
+        value = value.tolist()
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0]
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', errors='replace')
+    return value
+
+
 class FilterMetadataCache:
     """
     Cache the results of calls to the SVO filter service. As part of the
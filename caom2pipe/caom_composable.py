@@ -70,6 +70,7 @@ import logging
 import os
 import traceback
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from caom2 import CoordAxis1D, Axis, RefCoord, CoordRange1D, SpectralWCS
@@ -79,7 +80,7 @@ from caom2 import Instrument, TypedOrderedDict, SimpleObservation, CoordError
 from caom2 import CoordFunction1D, DerivedObservation, Provenance
 from caom2 import CoordBounds1D, TypedList, ProductType
 from caom2.diff import get_differences
-from caom2utils import ObsBlueprint, BlueprintParser, FitsParser
+from caom2utils import ObsBlueprint, BlueprintParser, FitsParser, Hdf5Parser
 from caom2utils import update_artifact_meta, Caom2Exception
 
 from caom2pipe import astro_composable as ac
@@ -1156,6 +1157,11 @@ class Fits2caom2Visitor:
                 f'{self._storage_name.file_uri}'
             )
             parser = BlueprintParser(blueprint, uri)
+        elif isinstance(headers, ac.H5Headers):
+            self._logger.debug(
+                f'Using an Hdf5Parser for {self._storage_name.file_uri}'
+            )
+            parser = Hdf5Parser(blueprint, uri, headers.h5_file)
         else:
             self._logger.debug(
                 f'Using a FitsParser for {self._storage_name.file_uri}'
@@ -1166,46 +1172,83 @@ class Fits2caom2Visitor:
     def _get_mapping(self, headers):
         return TelescopeMapping(self._storage_name, headers, self._clients, self._observable)
 
+    def _prepare(self, uri):
+        """
+        :param uri: Artifact URI
+        :return: (TelescopeMapping, ObsBlueprint, parser) for the uri, or None if there is no TelescopeMapping
+        """
+        self._logger.debug(f'Build observation for {uri}')
+        headers = self._metadata_reader.headers.get(uri)
+        telescope_data = self._get_mapping(headers)
+        if telescope_data is None:
+            self._logger.info(f'Ignoring {uri} because there is no TelescopeMapping.')
+            return None
+        blueprint = self._get_blueprint(telescope_data)
+        telescope_data.accumulate_blueprint(blueprint)
+        if self._dump_config:
+            print(f'Blueprint for {uri}: {blueprint}')
+        parser = self._get_parser(headers, blueprint, uri)
+        return telescope_data, blueprint, parser
+
+    def _prepare_all(self, uris):
+        """Prepare the blueprints and parsers for all the uris, with MetadataReader.workers threads. The
+        Observation is not changed here, so the order the uris are prepared in does not matter.
+
+        :param uris: list of Artifact URIs
+        :return: list of _prepare results, in uris order
+        """
+        with ThreadPoolExecutor(
+            max_workers=min(self._metadata_reader.workers, len(uris)), thread_name_prefix='caom2pipe-visit'
+        ) as pool:
+            return list(pool.map(self._prepare, uris))
+
+    def _augment(self, uri, prepared):
+        """
+        :param uri: Artifact URI
+        :param prepared: _prepare result for the uri
+        """
+        if prepared is None:
+            return
+        telescope_data, blueprint, parser = prepared
+
+        if self._observation is None:
+            if blueprint._get('DerivedObservation.members') is None:
+                self._logger.debug('Build a SimpleObservation')
+                self._observation = SimpleObservation(
+                    collection=self._storage_name.collection,
+                    observation_id=self._storage_name.obs_id,
+                    algorithm=Algorithm('exposure'),
+                )
+            else:
+                self._logger.debug('Build a DerivedObservation')
+                self._observation = DerivedObservation(
+                    collection=self._storage_name.collection,
+                    observation_id=self._storage_name.obs_id,
+                    algorithm=Algorithm('composite'),
+                )
+
+        parser.augment_observation(
+            observation=self._observation,
+            artifact_uri=uri,
+            product_id=self._storage_name.product_id,
+        )
+
+        file_info = self._metadata_reader.file_info.get(uri)
+        self._observation = telescope_data.update(self._observation, file_info)
+
     def visit(self):
         self._logger.debug('Begin visit')
         try:
-            for uri in self._storage_name.destination_uris:
-                self._logger.debug(f'Build observation for {uri}')
-                headers = self._metadata_reader.headers.get(uri)
-                telescope_data = self._get_mapping(headers)
-                if telescope_data is None:
-                    self._logger.info(f'Ignoring {uri} because there is no TelescopeMapping.')
-                    continue
-                blueprint = self._get_blueprint(telescope_data)
-                telescope_data.accumulate_blueprint(blueprint)
-                if self._dump_config:
-                    print(f'Blueprint for {uri}: {blueprint}')
-                parser = self._get_parser(headers, blueprint, uri)
-
-                if self._observation is None:
-                    if blueprint._get('DerivedObservation.members') is None:
-                        self._logger.debug('Build a SimpleObservation')
-                        self._observation = SimpleObservation(
-                            collection=self._storage_name.collection,
-                            observation_id=self._storage_name.obs_id,
-                            algorithm=Algorithm('exposure'),
-                        )
-                    else:
-                        self._logger.debug('Build a DerivedObservation')
-                        self._observation = DerivedObservation(
-                            collection=self._storage_name.collection,
-                            observation_id=self._storage_name.obs_id,
-                            algorithm=Algorithm('composite'),
-                        )
-
-                parser.augment_observation(
-                    observation=self._observation,
-                    artifact_uri=uri,
-                    product_id=self._storage_name.product_id,
-                )
-
-                file_info = self._metadata_reader.file_info.get(uri)
-                self._observation = telescope_data.update(self._observation, file_info)
+            uris = self._storage_name.destination_uris
+            if len(uris) > 1 and self._metadata_reader.workers > 1:
+                # the Observation is changed by one thread, in destination_uris order
+                for uri, prepared in zip(uris, self._prepare_all(uris)):
+                    self._augment(uri, prepared)
+            else:
+                # each file is prepared once the files before it have changed the Observation, for the mappings that
+                # look at it
+                for uri in uris:
+                    self._augment(uri, self._prepare(uri))
         except Caom2Exception as e:
             self._logger.debug(traceback.format_exc())
             self._logger.warning(
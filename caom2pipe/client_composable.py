@@ -78,11 +78,13 @@ Leave out:
 
 import logging
 import os
+import threading
 import traceback
 
 from dataclasses import dataclass
 from datetime import datetime
 from io import BytesIO, StringIO
+from queue import Queue
 from sys import getsizeof
 
 from astropy.table import Table
@@ -90,6 +92,7 @@ from astropy.table import Table
 from cadctap import CadcTapClient
 from cadcutils import net, exceptions
 from cadcdata import FileInfo
+from caom2 import ObservationReader, ObservationWriter
 from caom2utils.data_util import StorageClientWrapper
 from caom2utils.data_util import get_file_encoding, get_file_type
 from caom2pipe import astro_composable as ac
@@ -100,6 +103,7 @@ __all__ = [
     'client_get',
     'client_put_fqn',
     'ClientCollection',
+    'CompactStorageClientWrapper',
     'current',
     'data_get',
     'declare_client',
@@ -132,14 +136,26 @@ class ClientCollection:
 
     Eventually session retries, etc, might be configurable, but that need has
     not yet been demonstrated.
+
+    When config.repo_writers is greater than zero, CAOM2 repository writes
+    can be queued with queue_write, and are done by that many writer threads,
+    while the pipeline goes on to the next entry.
     """
 
     def __init__(self, config):
         self._metadata_client = None
         self._data_client = None
         self._query_client = None
+        self._storage_query_client = None
         self._vo_client = None
         self._metrics = None
+        self._repo_writers = config.repo_writers
+        # the write-behind queue, and its writer threads, are started by the first queue_write call
+        self._write_queue = None
+        self._writer_threads = []
+        # observation ID: the number of queued or in-progress writes for that observation
+        self._pending_writes = {}
+        self._pending_condition = threading.Condition()
         self._logger = logging.getLogger(self.__class__.__name__)
         self._init(config)
 
@@ -165,6 +181,12 @@ class ClientCollection:
     def query_client(self):
         return self._query_client
 
+    @property
+    def storage_query_client(self):
+        """The storage inventory TAP client, for the batch FileInfo retrieval, or None if
+        config.storage_inventory_tap_resource_id is not set."""
+        return self._storage_query_client
+
     @property
     def vo_client(self):
         return self._vo_client
@@ -188,6 +210,131 @@ class ClientCollection:
                 self._query_client = CadcTapClient(
                     subject=subject, resource_id=config.tap_id
                 )
+            if config.storage_inventory_tap_resource_id is not None:
+                self._storage_query_client = CadcTapClient(
+                    subject=subject, resource_id=config.storage_inventory_tap_resource_id
+                )
+
+    def _start_writers(self):
+        if self._write_queue is None:
+            self._logger.debug(f'Start {self._repo_writers} repository writer threads.')
+            self._write_queue = Queue(maxsize=2 * self._repo_writers)
+            self._writer_threads = [
+                threading.Thread(target=self._write, name=f'caom2pipe-repo-writer-{ii}', daemon=True)
+                for ii in range(self._repo_writers)
+            ]
+            for thread in self._writer_threads:
+                thread.start()
+
+    def _write(self):
+        """The writer thread loop."""
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                self._write_queue.task_done()
+                break
+            action, content, obs_id, on_done = item
+            e = None
+            stack_trace = None
+            try:
+                observation = ObservationReader(False).read(BytesIO(content))
+                if action == 'delete_create':
+                    repo_delete(
+                        self._metadata_client, observation.collection, observation.observation_id, self._metrics
+                    )
+                    repo_create(self._metadata_client, observation, self._metrics)
+                elif action == 'update':
+                    repo_update(self._metadata_client, observation, self._metrics)
+                else:
+                    repo_create(self._metadata_client, observation, self._metrics)
+            except Exception as ex:
+                self._logger.warning(f'Repository {action} failed for {obs_id} with {ex}')
+                e = ex
+                stack_trace = traceback.format_exc()
+                self._logger.debug(stack_trace)
+            try:
+                on_done(e, stack_trace)
+            except Exception as ex:
+                self._logger.error(f'Reporting the repository {action} for {obs_id} failed with {ex}')
+                self._logger.debug(traceback.format_exc())
+            with self._pending_condition:
+                self._pending_writes[obs_id] -= 1
+                if self._pending_writes[obs_id] == 0:
+                    del self._pending_writes[obs_id]
+                self._pending_condition.notify_all()
+            self._write_queue.task_done()
+
+    def queue_write(self, action, observation, on_done):
+        """Queue a CAOM2 repository write for a writer thread. The Observation
+        is serialized when it is queued, so changes made to it afterwards are
+        not written.
+
+        :param action: str 'create', 'update', or 'delete_create'
+        :param observation: Observation to write
+        :param on_done: callable(e, stack_trace), called by the writer thread
+            once the write is done, with e None if the write succeeded, and
+            the Exception otherwise
+        """
+        buffer = BytesIO()
+        ObservationWriter().write(observation, buffer)
+        with self._pending_condition:
+            self._start_writers()
+            self._pending_writes[observation.observation_id] = (
+                self._pending_writes.get(observation.observation_id, 0) + 1
+            )
+        # outside the lock, because the put blocks when the writers are behind
+        self._write_queue.put((action, buffer.getvalue(), observation.observation_id, on_done))
+
+    def wait_for_write(self, obs_id):
+        """Block until there are no queued or in-progress writes for an
+        observation, so that a read gets what was last written."""
+        with self._pending_condition:
+            self._pending_condition.wait_for(lambda: obs_id not in self._pending_writes)
+
+    def drain(self):
+        """Block until all the queued writes are done."""
+        if self._write_queue is not None:
+            self._write_queue.join()
+
+    def shut_down(self):
+        """Finish the queued writes, and stop the writer threads."""
+        if self._write_queue is not None:
+            for _ in self._writer_threads:
+                self._write_queue.put(None)
+            for thread in self._writer_threads:
+                thread.join()
+            self._write_queue = None
+            self._writer_threads = []
+
+
+class CompactStorageClientWrapper(StorageClientWrapper):
+    """A StorageClientWrapper that returns FITS headers as ac.CompactHeader
+    instances, which keep the header text until the cards are used."""
+
+    def get_head(self, uri):
+        """
+        Retrieve FITS file header data. This is StorageClientWrapper.get_head, with the header text going straight to
+        ac.make_compact_headers, so no header is parsed by astropy until it is used.
+        :param uri: str that is an Artifact URI, representing the file for which to retrieve headers
+        :return: list of ac.CompactHeader instances
+        """
+        self._logger.debug(f'Begin get_head for {uri}')
+        start = StorageClientWrapper._current()
+        try:
+            b = BytesIO()
+            b.name = uri
+            self._cadc_client.cadcget(uri, b, fhead=True)
+            fits_header = b.getvalue().decode('ascii')
+            b.close()
+            self._add_metric('get_head', uri, start, len(fits_header))
+            temp = ac.make_compact_headers(fits_header)
+            self._logger.debug('End get_head')
+            return temp
+        except Exception as e:
+            self._add_fail_metric('get_header', uri)
+            self._logger.debug(traceback.format_exc())
+            self._logger.error(e)
+            raise exceptions.UnexpectedException(f'Did not retrieve {uri} header because {e}')
 
 
 def client_get(client, working_directory, file_name, source, metrics):
@@ -273,7 +420,7 @@ def declare_client(config, metrics=None):
     """Common code to set the client used for interacting with CADC
     storage."""
     subject = define_subject(config)
-    cadc_client = StorageClientWrapper(
+    cadc_client = CompactStorageClientWrapper(
         resource_id=config.storage_inventory_resource_id, subject=subject, metrics=metrics
     )
     return cadc_client
@@ -536,7 +683,7 @@ def si_client_get_headers(client, storage_name):
 
     :param client: The Client for read access to CADC storage.
     :param storage_name: Artifact URI - where to retrieve the file from.
-    :return: a string of keyword/value pairs.
+    :return: list of ac.CompactHeader instances
     """
     try:
         b = BytesIO()
@@ -544,7 +691,7 @@ def si_client_get_headers(client, storage_name):
         client.cadcget(storage_name, b, fhead=True)
         fits_header = b.getvalue().decode('ascii')
         b.close()
-        return ac.make_headers_from_string(fits_header)
+        return ac.make_compact_headers(fits_header)
     except Exception as e:
         logging.debug(traceback.format_exc())
         raise mc.CadcException(
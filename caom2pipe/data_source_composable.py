@@ -69,12 +69,16 @@
 import logging
 import os
 import shutil
+import sqlite3
+import threading
 import traceback
 
 from collections import deque, defaultdict
+from copy import copy
 from dataclasses import dataclass
 from datetime import datetime
 from dateutil import tz
+from socket import gethostname
 
 from cadctap import CadcTapClient
 from cadcutils import exceptions
@@ -91,6 +95,7 @@ __all__ = [
     'ListDirTimeBoxDataSource',
     'LocalFilesDataSource',
     'QueryTimeBoxDataSource',
+    'QueueDataSource',
     'StateRunnerMeta',
     'TodoFileDataSource',
     'VaultCleanupDataSource',
@@ -126,14 +131,32 @@ class DataSource:
         self._work = deque()
         self._reporter = None
         self._timezone = zone
+        # True if get_time_box_work may be called for the next time-box,
+        # while the entries from the current time-box are being processed
+        self._prefetch_time_box_work = False
+        # for a prefetch_copy, the reporter counts wait here until capture_deferred_todo is called
+        self._deferred_todo = None
         self._logger = logging.getLogger(self.__class__.__name__)
 
-    def _capture_todo(self):
-        self._reporter.capture_todo(len(self._work), self._rejected_files, self._skipped_files)
+    def _capture_todo(self, count=None):
+        """
+        :param count: int number of entries found since the last capture, if not all the entries in self._work
+        """
+        count = len(self._work) if count is None else count
+        if self._deferred_todo is None:
+            self._reporter.capture_todo(count, self._rejected_files, self._skipped_files)
+        else:
+            self._deferred_todo.append((count, self._rejected_files, self._skipped_files))
         # do not need the record of the rejected or skipped files any longer
         self._rejected_files = 0
         self._skipped_files = 0
 
+    def capture_deferred_todo(self):
+        """Give the reporter the counts held by a prefetch_copy, once the time-box they are for is being processed."""
+        for counts in self._deferred_todo:
+            self._reporter.capture_todo(*counts)
+        self._deferred_todo = []
+
     def clean_up(self, entry, execution_result, current_count):
         """Clean up files locally after there has been a storage attempt."""
         pass
@@ -157,6 +180,32 @@ class DataSource:
         """
         return deque()
 
+    def stream_work(self):
+        """
+        Yield the work to be done one entry at a time, so that the processing of the first entry can start before the
+        last entry is found, and the whole list of work is never held in memory. The reporter counts are updated as
+        the entries are found.
+
+        The default implementation yields the entries from get_work.
+        """
+        yield from self.get_work()
+
+    def prefetch_copy(self):
+        """
+        :return: a copy of this instance, for the get_time_box_work calls made from a listing thread while the entries
+            of the current time-box are processed. Implementations that use a client give the copy its own client,
+            because the clients are not thread-safe. The copy holds the reporter counts until capture_deferred_todo
+            is called, so that the counts for a time-box are not reported before it is processed.
+        """
+        result = copy(self)
+        result._work = deque()
+        result._deferred_todo = []
+        return result
+
+    @property
+    def prefetch_time_box_work(self):
+        return self._prefetch_time_box_work
+
     @property
     def reporter(self):
         return self._reporter
@@ -251,25 +300,28 @@ class ListDirSeparateDataSource(DataSource):
 
     def get_work(self):
         self._logger.debug(f'Begin get_work.')
-        for source in self._source_directories:
-            self._logger.info(f'Look in {source} for work.')
-            self._append_work(source)
+        self._work = deque(self.stream_work())
         self._logger.debug('End get_work')
-        self._capture_todo()
         return self._work
 
-    def _append_work(self, entry):
+    def stream_work(self):
+        for source in self._source_directories:
+            self._logger.info(f'Look in {source} for work.')
+            yield from self._find_work(source)
+
+    def _find_work(self, entry):
         with os.scandir(entry) as dir_listing:
             for entry in dir_listing:
                 if entry.is_dir() and self._recursive:
-                    self._append_work(entry.path)
+                    yield from self._find_work(entry.path)
                 else:
                     for extension in self._extensions:
                         if entry.name.endswith(extension):
                             self._logger.debug(
                                 f'Adding {entry.path} to work list.'
                             )
-                            self._work.append(entry.path)
+                            self._capture_todo(1)
+                            yield entry.path
                             break
 
 
@@ -292,6 +344,7 @@ class ListDirTimeBoxDataSource(DataSource):
         self._source_directories = config.data_sources
         self._recursive = config.recurse_data_sources
         self._temp = defaultdict(list)
+        self._prefetch_time_box_work = True
 
     def get_time_box_work(self, prev_exec_dt, exec_dt):
         """
@@ -304,6 +357,9 @@ class ListDirTimeBoxDataSource(DataSource):
         self._logger.debug(
             f'Begin get_time_box_work from {prev_exec_dt} to {exec_dt}.'
         )
+        # the runner may still be consuming the work from the previous
+        # time-box, so start a new listing
+        self._work = deque()
         for source in self._source_directories:
             self._logger.debug(f'Looking for work in {source}')
             self._append_work(prev_exec_dt, exec_dt, source)
@@ -356,6 +412,8 @@ class LocalFilesDataSource(ListDirTimeBoxDataSource):
         self._metadata_reader = metadata_reader
         self._is_connected = config.is_connected
         self._scheme = scheme
+        # clean_up moves files out of the directories that are being listed
+        self._prefetch_time_box_work = False
         if not self._is_connected:
             # assume iterative testing is the objective for SCRAPE'ing,
             # and over-ride the configuration that will undermine that
@@ -469,13 +527,20 @@ class LocalFilesDataSource(ListDirTimeBoxDataSource):
 
     def get_work(self):
         self._logger.debug(f'Begin get_work.')
-        for source in self._source_directories:
-            self._logger.info(f'Look in {source} for work.')
-            self._find_work(source)
+        self._work = deque(self._list_work())
         self._logger.debug('End get_work')
-        self._capture_todo()
         return self._work
 
+    # stream_work is not over-ridden, because clean_up moves files out of the directories being listed, so the
+    # listing is complete before the first entry is processed
+
+    def _list_work(self):
+        for source in self._source_directories:
+            self._logger.info(f'Look in {source} for work.')
+            yield from self._find_work(source)
+        # the rejected and skipped files found after the last entry
+        self._capture_todo(0)
+
     def _append_work(self, prev_exec_dt, exec_dt, entry_path):
         with os.scandir(entry_path) as dir_listing:
             for entry in dir_listing:
@@ -552,13 +617,14 @@ class LocalFilesDataSource(ListDirTimeBoxDataSource):
         with os.scandir(entry_path) as dir_listing:
             for entry in dir_listing:
                 if entry.is_dir() and self._recursive:
-                    self._find_work(entry.path)
+                    yield from self._find_work(entry.path)
                 else:
                     if self.default_filter(entry):
                         self._logger.info(
                             f'Adding {entry.path} to work list.'
                         )
-                        self._work.append(entry.path)
+                        self._capture_todo(1)
+                        yield entry.path
 
     def _move_action(self, fqn, destination):
         # if move when storing is enabled, move to an after-action location
@@ -593,17 +659,161 @@ class TodoFileDataSource(DataSource):
 
     def get_work(self):
         self._logger.debug(f'Begin get_work from {self._config.work_fqn}.')
-        self._work = deque()
+        self._work = deque(self.stream_work())
+        self._logger.debug(f'End get_work.')
+        return self._work
+
+    def stream_work(self):
         with open(self._config.work_fqn) as f:
             for line in f:
                 temp = line.strip()
                 if len(temp) > 0:
                     # ignore empty lines
                     self._logger.debug(f'Adding entry {temp} to work list.')
-                    self._work.append(temp)
-        self._capture_todo()
-        self._logger.debug(f'End get_work.')
-        return self._work
+                    self._capture_todo(1)
+                    yield temp
+
+
+class QueueDataSource(DataSource):
+    """
+    Implements the identification of the work to be done, by leasing entries from a queue in a SQLite database, so
+    that more than one pipeline instance on the same host can work through the same backlog.
+
+    The database is in WAL mode, which needs shared memory between the processes that use it, so the queue must be
+    on a local file system, and is shared only between processes on one host. It must not be on NFS, CephFS, or any
+    other network file system, where WAL mode does not work, and where the leases would not be exclusive.
+
+    The queue is filled from the work file, if it exists. Entries already in the queue are not added again, so every
+    instance can be started with the same work file.
+
+    An entry is leased for config.queue_lease seconds as it is consumed from stream_work. It is acknowledged by
+    clean_up when it succeeds, or when it fails for the last time. An entry whose lease expires, because the instance
+    that leased it stopped, goes back to the queue, so an entry may be processed more than once. An entry that has
+    been leased MAX_ATTEMPTS times, and whose lease expires again, is marked as failed instead, so that an entry that
+    stops every instance that leases it does not go around the queue forever.
+    """
+
+    TODO = 'todo'
+    LEASED = 'leased'
+    DONE = 'done'
+    FAILED = 'failed'
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._retry_count = config.retry_count
+        self._retry_failures = config.retry_failures
+        self._owner = f'{gethostname()}:{os.getpid()}'
+        # the connection is shared by the worker threads of this instance, the database handles the other instances
+        self._connection = sqlite3.connect(
+            config.queue_fqn, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            # WAL mode is why the queue is limited to the processes of one host
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS work ('
+                'entry TEXT PRIMARY KEY, status TEXT NOT NULL, owner TEXT, lease_expiry REAL, '
+                'attempts INTEGER NOT NULL DEFAULT 0)'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS work_status ON work (status, lease_expiry)')
+
+    def add_work(self, entries):
+        """
+        :param entries: iterable of str entries to be added to the queue, if they are not already in it
+        """
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                self._connection.executemany(
+                    'INSERT OR IGNORE INTO work (entry, status) VALUES (?, ?)',
+                    ((entry, QueueDataSource.TODO) for entry in entries),
+                )
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def clean_up(self, entry, execution_result, current_count):
+        """Acknowledge an entry when it succeeds, or when it fails and there are no retries left. Otherwise, the
+        lease is renewed while the retry is pending."""
+        if execution_result == 0:
+            status = QueueDataSource.DONE
+        elif (not self._retry_failures) or current_count >= self._retry_count:
+            status = QueueDataSource.FAILED
+        else:
+            status = QueueDataSource.LEASED
+        self._logger.debug(f'Mark {entry} as {status}.')
+        lease_expiry = datetime.utcnow().timestamp() + self._config.queue_lease
+        with self._lock:
+            count = self._connection.execute(
+                'UPDATE work SET status = ?, lease_expiry = ? WHERE entry = ? AND owner = ?',
+                (status, lease_expiry, entry, self._owner),
+            ).rowcount
+            if count == 0 and status == QueueDataSource.DONE:
+                # the lease expired, and was taken by another instance, or the entry was not leased from the queue,
+                # but the work is done, whoever holds the lease
+                count = self._connection.execute(
+                    'UPDATE work SET status = ?, lease_expiry = ? WHERE entry = ?', (status, lease_expiry, entry)
+                ).rowcount
+        if count == 0:
+            self._logger.warning(
+                f'{entry} is not leased by {self._owner}, so it is not marked as {status} in '
+                f'{self._config.queue_fqn}.'
+            )
+
+    def get_work(self):
+        """The entries are leased as they are consumed, so the work is not a deque, and it is not all leased by the
+        first instance to start."""
+        return self.stream_work()
+
+    def lease(self):
+        """
+        :return: str the next entry in the queue, which is now leased by this instance, or None if there are no
+            entries left to lease
+        """
+        now_s = datetime.utcnow().timestamp()
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                dead = self._connection.execute(
+                    'UPDATE work SET status = ? WHERE status = ? AND lease_expiry < ? AND attempts >= ?',
+                    (QueueDataSource.FAILED, QueueDataSource.LEASED, now_s, QueueDataSource.MAX_ATTEMPTS),
+                ).rowcount
+                row = self._connection.execute(
+                    'SELECT entry FROM work WHERE status = ? OR (status = ? AND lease_expiry < ?) ORDER BY rowid '
+                    'LIMIT 1',
+                    (QueueDataSource.TODO, QueueDataSource.LEASED, now_s),
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        'UPDATE work SET status = ?, owner = ?, lease_expiry = ?, attempts = attempts + 1 '
+                        'WHERE entry = ?',
+                        (QueueDataSource.LEASED, self._owner, now_s + self._config.queue_lease, row[0]),
+                    )
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+        if dead > 0:
+            self._logger.warning(
+                f'Marked {dead} entries as {QueueDataSource.FAILED} after {QueueDataSource.MAX_ATTEMPTS} expired '
+                f'leases.'
+            )
+        return None if row is None else row[0]
+
+    def stream_work(self):
+        if os.path.exists(self._config.work_fqn):
+            with open(self._config.work_fqn) as f:
+                self.add_work(line.strip() for line in f if len(line.strip()) > 0)
+        while True:
+            entry = self.lease()
+            if entry is None:
+                break
+            self._logger.debug(f'Leased entry {entry}.')
+            self._capture_todo(1)
+            yield entry
 
 
 def is_offset_aware(dt):
@@ -640,6 +850,12 @@ class QueryTimeBoxDataSource(DataSource):
         self._preview_suffix = preview_suffix
         subject = clc.define_subject(config)
         self._client = CadcTapClient(subject, resource_id=self._config.tap_id)
+        self._prefetch_time_box_work = True
+
+    def prefetch_copy(self):
+        result = super().prefetch_copy()
+        result._client = CadcTapClient(clc.define_subject(self._config), resource_id=self._config.tap_id)
+        return result
 
     def get_time_box_work(self, prev_exec_dt, exec_dt):
         """
@@ -691,6 +907,18 @@ class VaultDataSource(ListDirTimeBoxDataSource):
         super().__init__(config)
         self._vault_client = vault_client
 
+    def prefetch_copy(self):
+        result = super().prefetch_copy()
+        # a vos.Client with the same credentials
+        result._vault_client = type(self._vault_client)(
+            vospace_certfile=self._vault_client.vospace_certfile,
+            root_node=self._vault_client.rootNode,
+            secure_get=self._vault_client.secure_get,
+            vospace_token=self._vault_client.vospace_token,
+            insecure=self._vault_client.insecure,
+        )
+        return result
+
     def get_work(self):
         self._logger.debug('Begin get_work.')
         self._work = deque()
@@ -784,6 +1012,8 @@ class VaultCleanupDataSource(VaultDataSource):
         self._cadc_client = cadc_client
         self._scheme = config.scheme
         self._metadata_reader = metadata_reader
+        # clean_up moves files out of the directories that are being listed
+        self._prefetch_time_box_work = False
         if mc.TaskType.STORE not in config.task_types:
             # do not clean up files unless the STORE task is configured
             self._cleanup_when_storing = False
@@ -855,13 +1085,20 @@ class VaultCleanupDataSource(VaultDataSource):
 
     def get_work(self):
         self._logger.debug(f'Begin get_work.')
-        for source in self._source_directories:
-            self._logger.info(f'Look in {source} for work.')
-            self._find_work(source)
+        self._work = deque(self._list_work())
         self._logger.debug('End get_work')
-        self._capture_todo()
         return self._work
 
+    # stream_work is not over-ridden, because clean_up moves or deletes files in the directories being listed, so
+    # the listing is complete before the first entry is processed
+
+    def _list_work(self):
+        for source in self._source_directories:
+            self._logger.info(f'Look in {source} for work.')
+            yield from self._find_work(source)
+        # the skipped files found after the last entry
+        self._capture_todo(0)
+
     def _is_remote_different(self, destination_uri):
         """
         :param destination_uri: str CADC storage system URI
@@ -881,11 +1118,12 @@ class VaultCleanupDataSource(VaultDataSource):
         for dir_entry in dir_listing:
             dir_entry_fqn = f'{entry}/{dir_entry}'
             if self._vault_client.isdir(dir_entry_fqn) and self._recursive:
-                self._find_work(dir_entry_fqn)
+                yield from self._find_work(dir_entry_fqn)
             else:
                 if self.default_filter(dir_entry_fqn):
                     self._logger.info(f'Adding {dir_entry_fqn} to work list.')
-                    self._work.append(dir_entry_fqn)
+                    self._capture_todo(1)
+                    yield dir_entry_fqn
 
     def _move_action(self, fqn, destination):
         """
@@ -935,6 +1173,8 @@ def data_source_factory(config, clients, state, reader, reporter):
         else:
             if state:
                 source = QueryTimeBoxDataSource(config)
+            elif config.queue_fqn is not None:
+                source = QueueDataSource(config)
             else:
                 source = TodoFileDataSource(config)
     source.reporter = reporter
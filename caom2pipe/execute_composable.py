@@ -104,6 +104,9 @@ What VISIT means when it comes to an CaomExecute specialization:
 - *DataVisit* executes all data visitors as an implementation of the MODIFY
   task type. These specializations retrieve the data prior to executing the
   visitors.
+- *ProcessDataVisit* executes all data visitors in a pool of worker
+  processes, when config.modify_processes is set. These specializations are
+  for the CPU-bound data visitors (e.g. preview generation, decompression).
 *DataVisit and *MetaVisit specializations don't behave the same way, or have
 the same assumptions about execution environment.
 
@@ -111,12 +114,18 @@ the same assumptions about execution environment.
 
 import bz2
 import gzip
+import importlib
 import logging
 import os
+import threading
 import traceback
 
+from concurrent.futures import Future, ProcessPoolExecutor
+from copy import copy, deepcopy
 from datetime import datetime
+from functools import partial
 from shutil import copyfileobj
+from types import ModuleType
 from urllib.parse import urlparse
 
 from caom2utils.data_util import get_local_file_info
@@ -124,7 +133,61 @@ from caom2pipe import client_composable as clc
 from caom2pipe import manage_composable as mc
 from caom2pipe import transfer_composable as tc
 
-__all__ = ['CaomExecute', 'OrganizeExecutes', 'OrganizeChooser']
+__all__ = ['CaomExecute', 'ObservationRecord', 'OrganizeExecutes', 'OrganizeChooser']
+
+
+class ObservationRecord:
+    """The CAOM2 record of one observation, shared by the executors that
+    handle an entry, or all the entries for that observation, so that the
+    record is read from, and written to, the repository once, instead of once
+    per executor.
+
+    The executors read the record from here once it has been retrieved, and
+    leave it here instead of storing it. OrganizeExecutes writes the record
+    when all the executors are done.
+    """
+
+    def __init__(self):
+        self.observation = None
+        # True once the record has been retrieved from the repository
+        self.retrieved = False
+        # True if the record exists in the repository
+        self.update_needed = False
+        # True if an executor has left an Observation to be written
+        self.store_needed = False
+        # True if the record must be deleted before it is created again
+        self.delete_create_needed = False
+        # the mc.get_obs_fingerprint value of the record as retrieved
+        self.fingerprint = None
+        # the most recent snapshot, and whether its Observation is still the one that may be changed
+        self._snapshot = None
+        self._copy_pending = False
+
+    def checkout(self):
+        """
+        :return: the Observation, for an executor that may change it. If there is a snapshot, the Observation is
+            copied for it first, so an Observation is only copied when it may be changed.
+        """
+        if self._copy_pending:
+            self._snapshot['observation'] = deepcopy(self.observation)
+            self._copy_pending = False
+        return self.observation
+
+    def restore(self, snapshot):
+        """Undo the changes made since the snapshot was taken."""
+        self.__dict__.update(snapshot)
+        self._snapshot = None
+        self._copy_pending = False
+
+    def snapshot(self):
+        """
+        :return: the state of the record, for restore. The Observation is copied by checkout.
+        """
+        self._snapshot = {
+            key: value for key, value in self.__dict__.items() if key not in ['_snapshot', '_copy_pending']
+        }
+        self._copy_pending = self.observation is not None
+        return self._snapshot
 
 
 class CaomExecute:
@@ -181,6 +244,14 @@ class CaomExecute:
         self._observation = None
         # track whether the caom2repo call will be a create or an update
         self._caom2_update_needed = False
+        # ObservationRecord instance when the repository access is shared with other executors
+        self._record = None
+        # the context of the most recent execute call, for the outcomes OrganizeExecutes reports
+        self._context = None
+        # the mc.get_obs_fingerprint value of the observation as retrieved
+        self._fingerprint = None
+        # the Artifact.metaProducer value set by the meta_visitors, if it is known
+        self._meta_producer = None
 
     def __str__(self):
         return (
@@ -212,6 +283,11 @@ class CaomExecute:
 
     def _caom2_read(self):
         """Retrieve the existing observation model metadata."""
+        if self._record is not None and self._record.retrieved:
+            self._logger.debug(f'Use the observation already retrieved for {self._storage_name.obs_id}')
+            self._observation = self._record.checkout()
+            self._caom2_update_needed = self._record.update_needed
+            return
         self._observation = clc.repo_get(
             self.caom_repo_client,
             self._storage_name.collection,
@@ -221,15 +297,30 @@ class CaomExecute:
         self._caom2_update_needed = (
             False if self._observation is None else True
         )
+        self._fingerprint = mc.get_obs_fingerprint(self._observation)
         if self._caom2_update_needed:
             self._logger.debug(
                 f'Found observation {self._observation.observation_id}'
             )
+        if self._record is not None:
+            self._record.observation = self._observation
+            self._record.retrieved = True
+            self._record.update_needed = self._caom2_update_needed
+            self._record.fingerprint = self._fingerprint
 
     def _caom2_store(self):
         """Update an existing observation instance.  Assumes the obs_id
         values are set correctly."""
+        if self._record is not None:
+            self._record.observation = self._observation
+            self._record.store_needed = True
+            return
         if self._caom2_update_needed:
+            if self._fingerprint == mc.get_obs_fingerprint(self._observation):
+                self._logger.info(f'No changes to {self._observation.observation_id}. Skip the update.')
+                if self._context is not None:
+                    self._context['unchanged_observation'] = self._observation.observation_id
+                return
             clc.repo_update(
                 self.caom_repo_client,
                 self._observation,
@@ -244,6 +335,11 @@ class CaomExecute:
 
     def _caom2_delete_create(self):
         """Delete an observation instance based on an input parameter."""
+        if self._record is not None:
+            self._record.observation = self._observation
+            self._record.store_needed = True
+            self._record.delete_create_needed = True
+            return
         if self._caom2_update_needed:
             clc.repo_delete(
                 self.caom_repo_client,
@@ -267,6 +363,40 @@ class CaomExecute:
             interim_file_info = get_local_file_info(interim_fqn)
             self._metadata_reader.file_info[uri] = interim_file_info
 
+    def _files_unchanged(self):
+        """Compare the md5 checksums from the MetadataReader with the
+        content checksums of the matching Artifacts in the existing
+        Observation.
+
+        :return: True if every file for the entry has an Artifact with the
+            same checksum, produced by the same meta_visitors, so there is
+            nothing for the meta_visitors to change
+        """
+        if (
+            self._config.force_reprocess
+            or self._meta_producer is None
+            or self._observation is None
+            or self._metadata_reader is None
+        ):
+            return False
+        artifacts = {}
+        for plane in self._observation.planes.values():
+            artifacts.update(plane.artifacts)
+        for uri in self._storage_name.destination_uris:
+            artifact = artifacts.get(uri)
+            file_info = self._metadata_reader.file_info.get(uri)
+            if (
+                artifact is None
+                or artifact.content_checksum is None
+                or artifact.meta_producer != self._meta_producer
+                or file_info is None
+                or file_info.md5sum is None
+            ):
+                return False
+            if artifact.content_checksum.checksum != file_info.md5sum.replace('md5:', ''):
+                return False
+        return len(self._storage_name.destination_uris) > 0
+
     def _read_model(self):
         """Read an observation into memory from an XML file on disk."""
         self._observation = None
@@ -316,6 +446,8 @@ class CaomExecute:
         self._logger.debug('Begin execute')
         self._logger.debug('the steps:')
         self.storage_name = context.get('storage_name')
+        self._record = context.get('record')
+        self._context = context
 
     @staticmethod
     def _specify_logging_level_param(logging_level):
@@ -345,6 +477,7 @@ class MetaVisitDeleteCreate(CaomExecute):
         observable,
         metadata_reader,
         clients,
+        meta_producer=None,
     ):
         super().__init__(
             config,
@@ -353,6 +486,7 @@ class MetaVisitDeleteCreate(CaomExecute):
             metadata_reader,
             clients=clients,
         )
+        self._meta_producer = meta_producer
 
     def execute(self, context):
         super().execute(context)
@@ -360,6 +494,13 @@ class MetaVisitDeleteCreate(CaomExecute):
         self._logger.debug('retrieve the observation if it exists')
         self._caom2_read()
 
+        if self._files_unchanged():
+            self._logger.info(
+                f'Same checksums for {self._storage_name.file_name}. Skip the metadata visitors.'
+            )
+            context['unchanged_files'] = True
+            return
+
         self._logger.debug('write the observation to disk for next step')
         self._write_model()
 
@@ -388,6 +529,7 @@ class MetaVisit(CaomExecute):
         observable,
         metadata_reader,
         clients,
+        meta_producer=None,
     ):
         super().__init__(
             config,
@@ -396,6 +538,7 @@ class MetaVisit(CaomExecute):
             metadata_reader=metadata_reader,
             clients=clients,
         )
+        self._meta_producer = meta_producer
 
     def execute(self, context):
         super().execute(context)
@@ -403,6 +546,13 @@ class MetaVisit(CaomExecute):
         self._logger.debug('retrieve the observation if it exists')
         self._caom2_read()
 
+        if self._files_unchanged():
+            self._logger.info(
+                f'Same checksums for {self._storage_name.file_name}. Skip the metadata visitors.'
+            )
+            context['unchanged_files'] = True
+            return
+
         self._logger.debug('the metadata visitors')
         self._visit_meta()
 
@@ -516,6 +666,8 @@ class LocalDataVisit(DataVisit):
         self._logger.debug('Begin execute')
         self._logger.debug('the steps:')
         self.storage_name = context.get('storage_name')
+        self._record = context.get('record')
+        self._context = context
 
         self._logger.debug('get the observation for the existing model')
         self._caom2_read()
@@ -532,6 +684,214 @@ class LocalDataVisit(DataVisit):
         self._logger.debug(f'End execute')
 
 
+# the per-process state of a DataVisitorPool worker, set by _init_data_visit_worker
+_data_visit_worker = {}
+
+
+def _init_data_visit_worker(config, data_visitors, storage_name_attributes):
+    """Initialize a DataVisitorPool worker process. Clients, MetadataReader and Observable instances are not shared
+    across processes, so each worker process has its own.
+
+    :param config: mc.Config instance
+    :param data_visitors: list of data visitors, with modules represented by their names
+    :param storage_name_attributes: dict of the mc.StorageName class attributes set by the application
+    """
+    for key, value in storage_name_attributes.items():
+        setattr(mc.StorageName, key, value)
+    logging.getLogger().setLevel(config.logging_level)
+    clients = clc.ClientCollection(config)
+    # avoid the circular import
+    from caom2pipe.reader_composable import reader_factory
+    _data_visit_worker['config'] = config
+    _data_visit_worker['clients'] = clients
+    _data_visit_worker['metadata_reader'] = reader_factory(config, clients)
+    _data_visit_worker['observable'] = mc.Observable(mc.Rejected(config.rejected_fqn), mc.Metrics(config))
+    _data_visit_worker['data_visitors'] = [
+        importlib.import_module(visitor) if isinstance(visitor, str) else visitor for visitor in data_visitors
+    ]
+
+
+def _visit_data_in_worker(observation, storage_name, working_directory, headers, file_info):
+    """Execute the data visitors in a DataVisitorPool worker process.
+
+    :param observation: Observation instance to be visited
+    :param storage_name: mc.StorageName instance
+    :param working_directory: str where the files for storage_name have already been retrieved
+    :param headers: dict of astropy.io.fits.Header lists, indexed by storage_name.destination_uris
+    :param file_info: dict of cadcdata.FileInfo, indexed by storage_name.destination_uris
+    :return: the visited Observation, and a dict of the Rejected entries recorded by the visitors
+    """
+    config = _data_visit_worker['config']
+    metadata_reader = _data_visit_worker['metadata_reader']
+    metadata_reader.reset()
+    metadata_reader.headers.update(headers)
+    metadata_reader.file_info.update(file_info)
+    rejected = _data_visit_worker['observable'].rejected
+    before = {reason: len(entries) for reason, entries in rejected.content.items()}
+    kwargs = {
+        'working_directory': working_directory,
+        'storage_name': storage_name,
+        'log_file_directory': config.log_file_directory,
+        'clients': _data_visit_worker['clients'],
+        'observable': _data_visit_worker['observable'],
+        'metadata_reader': metadata_reader,
+    }
+    for visitor in _data_visit_worker['data_visitors']:
+        observation = visitor.visit(observation, **kwargs)
+    recorded = {reason: entries[before.get(reason, 0):] for reason, entries in rejected.content.items()}
+    return observation, recorded
+
+
+class DataVisitorPool:
+    """Run data visitors in a pool of config.modify_processes worker processes, so that CPU-bound data visitors are
+    not serialized by the interpreter lock, when entries are processed by more than one worker thread.
+
+    The files to be visited are shared with the worker processes by their location in the working directory, so the
+    worker processes must run on the same host. The Observation is sent to a worker process, and the visited
+    Observation is returned.
+
+    The StorageName and the metadata are sent to the worker process as copies, and are not returned, so changes that
+    the data visitors make to the StorageName, or to the MetadataReader content, are lost. Data visitors that make
+    such changes must not be run with a DataVisitorPool.
+
+    The worker processes are started with the first visit, and stopped by shut_down.
+    """
+
+    def __init__(self, config, data_visitors):
+        """
+        :param config: mc.Config instance
+        :param data_visitors: list of data visit methods, which must be modules, or picklable
+        """
+        self._config = config
+        # modules are not picklable, so send the module name, and import the module in the worker process
+        self._data_visitors = [
+            visitor.__name__ if isinstance(visitor, ModuleType) else visitor for visitor in data_visitors
+        ]
+        self._pool = None
+        self._pool_guard = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def _get_pool(self):
+        with self._pool_guard:
+            if self._pool is None:
+                self._logger.debug(f'Start {self._config.modify_processes} data visitor processes.')
+                storage_name_attributes = {
+                    'collection': mc.StorageName.collection,
+                    'collection_pattern': mc.StorageName.collection_pattern,
+                    'preview_scheme': mc.StorageName.preview_scheme,
+                    'scheme': mc.StorageName.scheme,
+                }
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._config.modify_processes,
+                    initializer=_init_data_visit_worker,
+                    initargs=(self._config, self._data_visitors, storage_name_attributes),
+                )
+            return self._pool
+
+    def shut_down(self):
+        with self._pool_guard:
+            if self._pool is not None:
+                self._logger.debug('Stop the data visitor processes.')
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+    def visit(self, observation, storage_name, working_directory, metadata_reader):
+        """
+        :param observation: Observation instance to be visited
+        :param storage_name: mc.StorageName instance
+        :param working_directory: str where the files for storage_name have already been retrieved
+        :param metadata_reader: MetadataReader instance, with the metadata for storage_name already retrieved
+        :return: the visited Observation, and a dict of the Rejected entries recorded by the visitors
+        """
+        headers = {}
+        file_info = {}
+        if metadata_reader is not None:
+            for uri in storage_name.destination_uris:
+                if uri in metadata_reader.headers:
+                    headers[uri] = metadata_reader.headers.get(uri)
+                if uri in metadata_reader.file_info:
+                    file_info[uri] = metadata_reader.file_info.get(uri)
+        future = self._get_pool().submit(
+            _visit_data_in_worker, observation, storage_name, working_directory, headers, file_info
+        )
+        return future.result()
+
+
+def _visit_data_in_pool(executor):
+    """Execute the data visitors for a ProcessDataVisit or a LocalProcessDataVisit, in a worker process.
+
+    :param executor: ProcessDataVisit or LocalProcessDataVisit instance
+    """
+    executor._logger.debug(f'Visit {executor._storage_name.file_name} in a worker process.')
+    try:
+        executor._observation, recorded = executor._data_visitor_pool.visit(
+            executor._observation, executor._storage_name, executor._working_dir, executor._metadata_reader
+        )
+    except Exception as e:
+        raise mc.CadcException(e)
+    for reason, entries in recorded.items():
+        for entry in entries:
+            executor.observable.rejected.record(reason, entry)
+
+
+class ProcessDataVisit(DataVisit):
+    """Defines the pipeline step for all the operations that require access to the file on disk, with the data
+    visitors executed in a DataVisitorPool worker process.
+    """
+
+    def __init__(
+        self,
+        config,
+        data_visitors,
+        observable,
+        transferrer,
+        clients,
+        metadata_reader,
+        data_visitor_pool,
+    ):
+        super().__init__(
+            config,
+            data_visitors,
+            observable,
+            transferrer,
+            clients,
+            metadata_reader,
+        )
+        self._data_visitor_pool = data_visitor_pool
+
+    def _visit_data(self):
+        """Execute the visitors that require access to the full data content of a file, in a worker process."""
+        _visit_data_in_pool(self)
+
+
+class LocalProcessDataVisit(LocalDataVisit):
+    """Defines the pipeline step for all the operations that require access to the file on disk, with the data
+    visitors executed in a DataVisitorPool worker process. This class assumes it has access to the files on disk.
+    """
+
+    def __init__(
+        self,
+        config,
+        data_visitors,
+        observable,
+        clients,
+        metadata_reader,
+        data_visitor_pool,
+    ):
+        super().__init__(
+            config,
+            data_visitors,
+            observable,
+            clients,
+            metadata_reader,
+        )
+        self._data_visitor_pool = data_visitor_pool
+
+    def _visit_data(self):
+        """Execute the visitors that require access to the full data content of a file, in a worker process."""
+        _visit_data_in_pool(self)
+
+
 class DataScrape(DataVisit):
     """Defines the pipeline step for Collection generation and ingestion of
     operations that require access to the file on disk, with no update to the
@@ -593,6 +953,11 @@ class Store(CaomExecute):
             clients=clients,
         )
         self._transferrer = transferrer
+        if isinstance(transferrer, tc.ScienceTransfer) and transferrer.metadata_reader is None:
+            # an H5MetadataReader checks the retrieved HDF5 files in-process. The transferrer is shared by the
+            # replicas of an OrganizeExecutes, each with its own MetadataReader, so this instance checks with a copy.
+            self._transferrer = copy(transferrer)
+            self._transferrer.metadata_reader = metadata_reader
 
     def execute(self, context):
         super().execute(context)
@@ -713,6 +1078,7 @@ class OrganizeExecutes:
         clients=None,
         observable=None,
         reporter=None,
+        meta_producer=None,
     ):
         """
         Why there is support for two transfer instances:
@@ -731,6 +1097,9 @@ class OrganizeExecutes:
         :param clients ClientCollection instance
         :param metadata_reader client instance for reading headers,
             passed on to to_caom2_client.
+        :param meta_producer str Artifact.metaProducer value set by the
+            meta_visitors. If it is known, INGEST skips the meta_visitors
+            for files with unchanged checksums.
         """
         self.config = config
         self.chooser = chooser
@@ -743,8 +1112,14 @@ class OrganizeExecutes:
         self._store_transfer = store_transfer
         self._clients = clients
         self._metadata_reader = metadata_reader
+        self._meta_producer = meta_producer
+        # (obs_id, Observation) read from the repository ahead of the do_one call for the obs_id
+        self._prefetched = None
         self._log_h = None
         self._executors = []
+        # shared by all the replicas, so there is one set of data visitor
+        # processes, no matter how many worker threads there are
+        self._data_visitor_pool = None
         self._logger = logging.getLogger(self.__class__.__name__)
         self._logger.setLevel(config.logging_level)
 
@@ -806,6 +1181,10 @@ class OrganizeExecutes:
             )
             self._log_h.setLevel(self.config.logging_level)
             self._log_h.setFormatter(formatter)
+            # when entries are processed by several worker threads, keep
+            # only the messages for this entry in this entry's log file
+            thread_id = threading.get_ident()
+            self._log_h.addFilter(lambda record: record.thread == thread_id)
             logging.getLogger().addHandler(self._log_h)
 
     def _unset_file_logging(self):
@@ -861,7 +1240,12 @@ class OrganizeExecutes:
                     )
                     self._executors.append(
                         MetaVisitDeleteCreate(
-                            self.config, self._meta_visitors, self._observable, self._metadata_reader, self._clients
+                            self.config,
+                            self._meta_visitors,
+                            self._observable,
+                            self._metadata_reader,
+                            self._clients,
+                            self._meta_producer,
                         )
                     )
                 else:
@@ -870,7 +1254,12 @@ class OrganizeExecutes:
                     )
                     self._executors.append(
                         MetaVisit(
-                            self.config, self._meta_visitors, self._observable, self._metadata_reader, self._clients
+                            self.config,
+                            self._meta_visitors,
+                            self._observable,
+                            self._metadata_reader,
+                            self._clients,
+                            self._meta_producer,
                         )
                     )
             elif task_type == mc.TaskType.MODIFY:
@@ -881,6 +1270,21 @@ class OrganizeExecutes:
                             f'{task_type}.'
                         )
                         self._executors.append(DataScrape(self.config, self._data_visitors, self._metadata_reader))
+                    elif self.config.modify_processes > 0:
+                        self._logger.debug(
+                            f'Choosing executor LocalProcessDataVisit for '
+                            f'{task_type}.'
+                        )
+                        self._executors.append(
+                            LocalProcessDataVisit(
+                                self.config,
+                                self._data_visitors,
+                                self._observable,
+                                self._clients,
+                                self._metadata_reader,
+                                self._get_data_visitor_pool(),
+                            )
+                        )
                     else:
                         self._logger.debug(
                             f'Choosing executor LocalDataVisit for '
@@ -895,6 +1299,21 @@ class OrganizeExecutes:
                                 self._metadata_reader,
                             )
                         )
+                elif self.config.modify_processes > 0:
+                    self._logger.debug(
+                        f'Choosing executor ProcessDataVisit for {task_type}.'
+                    )
+                    self._executors.append(
+                        ProcessDataVisit(
+                            self.config,
+                            self._data_visitors,
+                            self._observable,
+                            self._modify_transfer,
+                            self._clients,
+                            self._metadata_reader,
+                            self._get_data_visitor_pool(),
+                        )
+                    )
                 else:
                     self._logger.debug(
                         f'Choosing executor DataVisit for {task_type}.'
@@ -925,8 +1344,313 @@ class OrganizeExecutes:
                     f'Do not understand task type {task_type}'
                 )
 
+    def replicate(self, metadata_reader):
+        """Make an OrganizeExecutes instance with the same configuration as
+        this one, but with its own executors and MetadataReader, so that it
+        can be used by a single worker thread.
+
+        :param metadata_reader MetadataReader instance for the exclusive use
+            of the returned instance
+        :return OrganizeExecutes instance, with the executors already chosen
+        """
+        result = OrganizeExecutes(
+            self.config,
+            self._meta_visitors,
+            self._data_visitors,
+            self.chooser,
+            self._store_transfer,
+            self._modify_transfer,
+            metadata_reader,
+            self._clients,
+            self._observable,
+            self._reporter,
+            self._meta_producer,
+        )
+        result._data_visitor_pool = self._get_data_visitor_pool()
+        result.choose()
+        return result
+
+    def _get_data_visitor_pool(self):
+        if self._data_visitor_pool is None and self.config.modify_processes > 0:
+            self._data_visitor_pool = DataVisitorPool(self.config, self._data_visitors)
+        return self._data_visitor_pool
+
+    def shut_down(self):
+        """Stop any worker processes started for the execution of data
+        visitors, and any repository writer threads, once the queued writes
+        are done."""
+        if self._data_visitor_pool is not None:
+            self._data_visitor_pool.shut_down()
+        if self.config.repo_writers > 0 and self._clients is not None:
+            self._clients.shut_down()
+
+    @property
+    def executors(self):
+        return self._executors
+
+    @property
+    def reads_repository(self):
+        """True if any of the chosen executors reads an observation from
+        the repository."""
+        return any(
+            isinstance(executor, (MetaVisitDeleteCreate, MetaVisit, DataVisit))
+            and not isinstance(executor, DataScrape)
+            for executor in self._executors
+        )
+
+    def read_ahead(self, storage_name):
+        """Read the observation for an entry before the entry is processed.
+        This may be called from a thread other than the one that calls
+        do_one.
+
+        :param storage_name: StorageName instance for the entry
+        :return: the Observation, or None if it does not exist yet
+        """
+        self._wait_for_write(storage_name.obs_id)
+        return clc.repo_get(
+            self._clients.metadata_client, storage_name.collection, storage_name.obs_id, self._observable.metrics
+        )
+
+    def use_prefetched(self, obs_id, observation):
+        """Have the next do_one call use an observation from read_ahead,
+        instead of reading it from the repository.
+
+        :param obs_id: str the observation ID of the next do_one call
+        :param observation: Observation, or None if it does not exist yet
+        """
+        self._prefetched = (obs_id, observation)
+
+    def _new_record(self, obs_id):
+        """
+        :return: ObservationRecord, already retrieved if use_prefetched
+            was called for obs_id
+        """
+        record = ObservationRecord()
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is not None and prefetched[0] == obs_id:
+            self._logger.debug(f'Use the prefetched observation for {obs_id}')
+            record.observation = prefetched[1]
+            record.retrieved = True
+            record.update_needed = prefetched[1] is not None
+            record.fingerprint = mc.get_obs_fingerprint(prefetched[1])
+        return record
+
+    def do_stage(self, index, storage_name, start_s, record=None):
+        """Execute one of the chosen executors for an entry. This is the
+        alternative to do_one, for when each executor runs as a pipeline
+        stage, with its own worker threads.
+
+        The first stage checks for rejection and creates the workspace. The
+        last stage writes the record, and reports success. A failure in any
+        stage is reported, and ends the processing of the entry.
+
+        :param index: int which of the chosen executors to execute
+        :param storage_name: instance of StorageName for the collection
+        :param start_s: float timestamp when the first stage started
+        :param record: ObservationRecord that goes along with the entry from
+            stage to stage. If None, each stage reads and writes the
+            observation for itself.
+        :return: None if the entry goes on to the next stage, otherwise 0 for
+            success and -1 for failure
+        """
+        self._logger.debug(f'Begin do_stage {index} for {storage_name}')
+        result = None
+        try:
+            if index == 0 and self.is_rejected(storage_name):
+                self._reporter.capture_failure(storage_name, BaseException('StorageName.is_rejected'), 'Rejected')
+                # successful rejection of the execution case
+                result = 0
+            else:
+                if index == 0:
+                    self._wait_for_write(storage_name.obs_id)
+                    self._create_workspace(storage_name.obs_id)
+                executor = self._executors[index]
+                self._metadata_reader.set(storage_name)
+                self._logger.info(
+                    f'Task with {executor.__class__.__name__} for '
+                    f'{storage_name.obs_id}'
+                )
+                context = {'storage_name': storage_name, 'record': record}
+                executor.execute(context)
+                self._capture_context(storage_name, context)
+                if index == len(self._executors) - 1:
+                    if record is None:
+                        self._reporter.capture_success(storage_name.obs_id, storage_name.file_name, start_s)
+                        result = 0
+                    else:
+                        pending = self._store_record(record, [storage_name], start_s)
+                        result = 0 if pending is None else pending
+        except Exception as e:
+            self._reporter.capture_failure(storage_name, e, traceback.format_exc())
+            self._logger.warning(
+                f'Execution failed for {storage_name.obs_id} with {e}'
+            )
+            self._logger.debug(traceback.format_exc())
+            result = -1
+        if result is not None:
+            self._clean_up_workspace(storage_name.obs_id)
+        self._logger.debug(f'End do_stage {index} with {result}')
+        return result
+
+    def _store_record(self, record, storage_names, start_s):
+        """Write an ObservationRecord to the repository, if an executor
+        left an Observation to be written, and the Observation is not
+        exactly as it was retrieved, then capture the success of the entries.
+
+        With config.repo_writers, the write is queued for the ClientCollection
+        writer threads, and the success, or failure, of the entries is
+        captured once the write is done.
+
+        :param record: ObservationRecord
+        :param storage_names: list of StorageName instances whose processing
+            is complete once the record is written
+        :param start_s: float timestamp when the processing started
+        :return: None if the record is written, or does not need to be, or a
+            Future, with the result 0 or -1 once the queued write is done
+        """
+        action = None
+        if record.store_needed:
+            if record.update_needed and record.fingerprint == mc.get_obs_fingerprint(record.observation):
+                self._logger.info(f'No changes to {record.observation.observation_id}. Skip the write.')
+                self._reporter.capture_unchanged(record.observation.observation_id)
+            elif record.delete_create_needed and record.update_needed:
+                action = 'delete_create'
+            elif record.update_needed:
+                action = 'update'
+            else:
+                action = 'create'
+        if action is not None and self.config.repo_writers > 0:
+            pending = Future()
+            self._clients.queue_write(
+                action, record.observation, partial(self._capture_write, storage_names, start_s, pending)
+            )
+            return pending
+        if action is not None:
+            repo_client = self._clients.metadata_client
+            metrics = self._observable.metrics
+            if action == 'delete_create':
+                clc.repo_delete(
+                    repo_client, record.observation.collection, record.observation.observation_id, metrics
+                )
+                clc.repo_create(repo_client, record.observation, metrics)
+            elif action == 'update':
+                clc.repo_update(repo_client, record.observation, metrics)
+            else:
+                clc.repo_create(repo_client, record.observation, metrics)
+        for storage_name in storage_names:
+            self._reporter.capture_success(storage_name.obs_id, storage_name.file_name, start_s)
+        return None
+
+    def _capture_write(self, storage_names, start_s, pending, e, stack_trace):
+        """The ClientCollection.queue_write callback, called by a writer
+        thread. The entries are finished, by the callbacks of the pending
+        Future, only once the write is done, so an entry whose write fails is
+        neither cleaned up, nor recorded as complete."""
+        for storage_name in storage_names:
+            if e is None:
+                self._reporter.capture_success(storage_name.obs_id, storage_name.file_name, start_s)
+            else:
+                self._reporter.capture_failure(storage_name, e, stack_trace)
+        pending.set_result(0 if e is None else -1)
+
+    def _capture_context(self, storage_name, context):
+        """Report the outcomes the executors left in the context.
+
+        :param storage_name: StorageName instance of the entry
+        :param context: dict passed to the execute calls of the executors
+        """
+        if context.get('unchanged_files'):
+            self._reporter.capture_short_circuit(storage_name.file_name)
+        if context.get('unchanged_observation'):
+            self._reporter.capture_unchanged(context.get('unchanged_observation'))
+
+    def _wait_for_write(self, obs_id):
+        """Make sure a queued write for an observation is done before the
+        observation is read again."""
+        if self.config.repo_writers > 0:
+            self._clients.wait_for_write(obs_id)
+
+    def drain(self):
+        """Block until all the queued repository writes are done."""
+        if self.config.repo_writers > 0 and self._clients is not None:
+            self._clients.drain()
+
+    def do_group(self, storage_names):
+        """Process entries that share an observation ID. The executors for
+        all the entries are applied to one Observation, which is read from,
+        and written to, the repository once.
+
+        An entry that fails leaves the Observation as it was before that
+        entry. If the write fails, all the entries fail.
+
+        :param storage_names: list of StorageName instances with the same
+            obs_id
+        :return: list of int, 0 for success and -1 for failure, in the order
+            of storage_names
+        """
+        obs_id = storage_names[0].obs_id
+        self._logger.debug(f'Begin do_group for {len(storage_names)} entries of {obs_id}')
+        start_s = datetime.utcnow().timestamp()
+        record = ObservationRecord()
+        # None for an entry that succeeds if the write succeeds
+        results = []
+        try:
+            self._wait_for_write(obs_id)
+            self._create_workspace(obs_id)
+            for storage_name in storage_names:
+                self._set_up_file_logging(storage_name)
+                snapshot = record.snapshot()
+                try:
+                    if self.is_rejected(storage_name):
+                        self._reporter.capture_failure(
+                            storage_name, BaseException('StorageName.is_rejected'), 'Rejected'
+                        )
+                        # successful rejection of the execution case
+                        results.append(0)
+                    elif len(self._executors) == 0:
+                        self._logger.info(f'No executors for {storage_name}')
+                        results.append(-1)
+                    else:
+                        context = {'storage_name': storage_name, 'record': record}
+                        for executor in self._executors:
+                            self._metadata_reader.set(storage_name)
+                            self._logger.info(f'Task with {executor.__class__.__name__} for {storage_name.obs_id}')
+                            executor.execute(context)
+                        self._capture_context(storage_name, context)
+                        results.append(None)
+                except Exception as e:
+                    record.restore(snapshot)
+                    self._reporter.capture_failure(storage_name, e, traceback.format_exc())
+                    self._logger.warning(f'Execution failed for {storage_name.file_name} with {e}')
+                    self._logger.debug(traceback.format_exc())
+                    results.append(-1)
+                finally:
+                    self._unset_file_logging()
+            if None in results:
+                try:
+                    pending = self._store_record(
+                        record,
+                        [storage_name for index, storage_name in enumerate(storage_names) if results[index] is None],
+                        start_s,
+                    )
+                    results = [(0 if pending is None else pending) if result is None else result for result in results]
+                except Exception as e:
+                    self._logger.warning(f'Store failed for {obs_id} with {e}')
+                    self._logger.debug(traceback.format_exc())
+                    for index, storage_name in enumerate(storage_names):
+                        if results[index] is None:
+                            self._reporter.capture_failure(storage_name, e, traceback.format_exc())
+                            results[index] = -1
+        finally:
+            self._clean_up_workspace(obs_id)
+        self._logger.debug(f'End do_group with {results}')
+        return results
+
     def do_one(self, storage_name):
-        """Process one entry.
+        """Process one entry. The executors share one ObservationRecord, so
+        the observation is read from, and written to, the repository once,
+        however many executors there are.
+
         :param storage_name instance of StorageName for the collection
         """
         self._logger.debug(f'Begin do_one {storage_name}')
@@ -934,12 +1658,15 @@ class OrganizeExecutes:
         start_s = datetime.utcnow().timestamp()
         try:
             if self.is_rejected(storage_name):
+                self._prefetched = None
                 self._reporter.capture_failure(storage_name, BaseException('StorageName.is_rejected'), 'Rejected')
                 # successful rejection of the execution case
                 result = 0
             else:
+                self._wait_for_write(storage_name.obs_id)
                 self._create_workspace(storage_name.obs_id)
-                context = {'storage_name': storage_name}
+                record = self._new_record(storage_name.obs_id)
+                context = {'storage_name': storage_name, 'record': record}
                 for executor in self._executors:
                     self._metadata_reader.set(storage_name)
                     self._logger.info(
@@ -947,9 +1674,10 @@ class OrganizeExecutes:
                         f'{storage_name.obs_id}'
                     )
                     executor.execute(context)
+                self._capture_context(storage_name, context)
                 if len(self._executors) > 0:
-                    self._reporter.capture_success(storage_name.obs_id, storage_name.file_name, start_s)
-                    result = 0
+                    pending = self._store_record(record, [storage_name], start_s)
+                    result = 0 if pending is None else pending
                 else:
                     self._logger.info(f'No executors for {storage_name}')
                     result = -1  # cover case where file name validation fails
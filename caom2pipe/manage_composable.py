@@ -77,6 +77,7 @@ import stat
 import requests
 import subprocess
 import sys
+import threading
 import traceback
 import yaml
 
@@ -125,6 +126,7 @@ __all__ = [
     'get_endpoint_session',
     'get_file_meta',
     'get_keyword',
+    'get_obs_fingerprint',
     'http_get',
     'increment_time_tz',
     'ISO_8601_FORMAT',
@@ -133,6 +135,7 @@ __all__ = [
     'Metrics',
     'minimize_on_keyword',
     'Observable',
+    'ProgressJournal',
     'query_endpoint',
     'query_endpoint_session',
     'read_as_yaml',
@@ -297,6 +300,85 @@ class State:
         write_as_yaml(bookmark, state_fqn)
 
 
+class ProgressJournal:
+    """Persist the entries that have been completed in the time-box being
+    processed, so that a pipeline invocation that is stopped part way through
+    a time-box does not redo the completed entries when it restarts.
+
+    The journal is an append-only file, with one line per completed entry.
+    Entries at or before the bookmark are dropped from the journal when the
+    bookmark moves.
+    """
+
+    def __init__(self, fqn, key):
+        """
+        :param fqn: str fully-qualified name of the journal file
+        :param key: str the bookmark the journal belongs to
+        """
+        self.fqn = fqn
+        self._key = key
+        # (entry name, entry timestamp) for this bookmark
+        self._completed = set()
+        # lines for other bookmarks, which are kept as they are
+        self._others = []
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        if os.path.exists(fqn):
+            with open(fqn) as f:
+                for line in f:
+                    parts = line.rstrip('\n').split('\t', 2)
+                    if len(parts) != 3:
+                        # a partial line from an interrupted write
+                        continue
+                    if parts[0] == key:
+                        self._completed.add((parts[2], float(parts[1])))
+                    else:
+                        self._others.append(line)
+        self._logger.debug(f'Loaded {len(self._completed)} completed entries for {key} from {fqn}')
+
+    def __len__(self):
+        with self._lock:
+            return len(self._completed)
+
+    def compact(self, bookmark_dt):
+        """Drop the completed entries that are at or before the bookmark.
+
+        :param bookmark_dt: tz-aware datetime the saved bookmark
+        """
+        bookmark_ts = bookmark_dt.timestamp()
+        with self._lock:
+            self._completed = {(name, ts) for name, ts in self._completed if ts > bookmark_ts}
+            with open(self.fqn, 'w') as f:
+                f.writelines(self._others)
+                for name, ts in self._completed:
+                    f.write(f'{self._key}\t{ts!r}\t{name}\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def is_completed(self, entry_name, entry_dt):
+        """
+        :param entry_name: str StateRunnerMeta.entry_name
+        :param entry_dt: tz-aware datetime StateRunnerMeta.entry_dt
+        """
+        with self._lock:
+            return (entry_name, entry_dt.timestamp()) in self._completed
+
+    def record(self, entry_name, entry_dt):
+        """Append a completed entry to the journal, and make sure it's on
+        disk before returning.
+
+        :param entry_name: str StateRunnerMeta.entry_name
+        :param entry_dt: tz-aware datetime StateRunnerMeta.entry_dt
+        """
+        entry_ts = entry_dt.timestamp()
+        with self._lock:
+            self._completed.add((entry_name, entry_ts))
+            with open(self.fqn, 'a') as f:
+                f.write(f'{self._key}\t{entry_ts!r}\t{entry_name}\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+
 class Rejected:
     """Persist information between pipeline invocations about the observation
     IDs that will fail a particular TaskType.
@@ -335,6 +417,8 @@ class Rejected:
         in-memory records to be empty.
         """
         self.fqn = fqn
+        # entries may be recorded from more than one worker thread
+        self._lock = threading.Lock()
         if os.path.exists(fqn):
             try:
                 self.content = read_as_yaml(fqn)
@@ -363,14 +447,16 @@ class Rejected:
 
     def record(self, reason, entry):
         """Keep track of an additional entry."""
-        self.content[reason].append(entry)
+        with self._lock:
+            self.content[reason].append(entry)
 
     def persist_state(self):
         """Write the current state as a YAML file."""
-        for key, value in self.content.items():
-            # ensure unique entries
-            self.content[key] = list(set(value))
-        write_as_yaml(self.content, self.fqn)
+        with self._lock:
+            for key, value in self.content.items():
+                # ensure unique entries
+                self.content[key] = list(set(value))
+            write_as_yaml(self.content, self.fqn)
 
     def get_bad_data(self):
         return self.content[Rejected.BAD_DATA]
@@ -423,6 +509,13 @@ class ExecutionReporter:
         self._report_fqn = config.report_fqn
         self._observable = observable
         self._summary = ExecutionSummary(os.path.basename(config.working_directory), application)
+        # serialize the counting and the progress file writes, when entries are processed by more than one worker
+        # thread
+        self._lock = threading.RLock()
+        # when retries happen in-process, the retries file only receives the entries that fail their final attempt,
+        # so hold on to the retryable source names until the runner decides what to do with them
+        self._defer_retries = False
+        self._deferred_retries = set()
         self.set_log_location(config)
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -430,10 +523,26 @@ class ExecutionReporter:
     def all(self):
         return self._summary.entries
 
+    @property
+    def defer_retries(self):
+        return self._defer_retries
+
+    @defer_retries.setter
+    def defer_retries(self, value):
+        self._defer_retries = value
+
     @property
     def success(self):
         return self._summary.success
 
+    @property
+    def short_circuits(self):
+        return self._summary.short_circuits
+
+    @property
+    def unchanged(self):
+        return self._summary.unchanged
+
     def _count_retries(self):
         result = []
         if os.path.exists(self._retry_fqn):
@@ -490,24 +599,28 @@ class ExecutionReporter:
             level is not set to debug, will be lost for debugging purposes.
         """
         self._logger.debug('Begin capture_failure')
-        self._summary.add_errors(1)
-        self._count_timeouts(stack_trace)
-        with open(self._failure_fqn, 'a') as failure:
-            if e.args is not None and len(e.args) > 1:
-                min_error = e.args[0]
-            else:
-                min_error = str(e)
-            failure.write(f'{datetime.now()} {storage_name.obs_id} {storage_name.file_name} {min_error}\n')
-
+        if e.args is not None and len(e.args) > 1:
+            min_error = e.args[0]
+        else:
+            min_error = str(e)
         # only retry entries that are not permanently marked as rejected
         reason = Rejected.known_failure(stack_trace)
-        if reason == Rejected.NO_REASON:
-            with open(self._retry_fqn, 'a') as retry:
-                for entry in storage_name.source_names:
-                    retry.write(f'{entry}\n')
-        else:
-            self._observable.rejected.record(reason, storage_name.obs_id)
-            self._summary.add_rejections(1)
+        with self._lock:
+            self._summary.add_errors(1)
+            self._count_timeouts(stack_trace)
+            with open(self._failure_fqn, 'a') as failure:
+                failure.write(f'{datetime.now()} {storage_name.obs_id} {storage_name.file_name} {min_error}\n')
+
+            if reason == Rejected.NO_REASON:
+                if self._defer_retries:
+                    self._deferred_retries.update(storage_name.source_names)
+                else:
+                    with open(self._retry_fqn, 'a') as retry:
+                        for entry in storage_name.source_names:
+                            retry.write(f'{entry}\n')
+            else:
+                self._observable.rejected.record(reason, storage_name.obs_id)
+                self._summary.add_rejections(1)
         self._logger.debug('End capture_failure')
 
     def capture_success(self, obs_id, file_name, start_time):
@@ -517,34 +630,77 @@ class ExecutionReporter:
         :param start_time int seconds since beginning of execution.
         """
         self._logger.debug('Begin capture_success')
-        self._summary.add_successes(1)
         execution_s = datetime.utcnow().timestamp() - start_time
-        success = open(self._success_fqn, 'a')
-        try:
-            success.write(f'{datetime.now()} {obs_id} {file_name} {execution_s:.2f}\n')
-        finally:
-            success.close()
-        msg = (
-            f'Progress - record {self._summary.success} of {self._summary.entries} records processed in '
-            f'{execution_s:.2f} s.'
-        )
+        with self._lock:
+            self._summary.add_successes(1)
+            success = open(self._success_fqn, 'a')
+            try:
+                success.write(f'{datetime.now()} {obs_id} {file_name} {execution_s:.2f}\n')
+            finally:
+                success.close()
+            msg = (
+                f'Progress - record {self._summary.success} of {self._summary.entries} records processed in '
+                f'{execution_s:.2f} s.'
+            )
         self._logger.debug('*' * len(msg))
         self._logger.info(msg)
         self._logger.debug('*' * len(msg))
 
     def capture_todo(self, todo, rejected, skipped):
         self._logger.debug(f'Begin capture_todo todo {todo}, rejected {rejected}, skipped {skipped}')
-        self._summary.add_entries(todo + rejected + skipped)
-        self._summary.add_rejections(rejected)
-        self._summary.add_skipped(skipped)
+        with self._lock:
+            self._summary.add_entries(todo + rejected + skipped)
+            self._summary.add_rejections(rejected)
+            self._summary.add_skipped(skipped)
 
     def report(self):
         msg = self._summary.report()
         self._logger.info(msg)
         write_to_file(self._report_fqn, msg)
 
-    def capture_retry(self):
-        self._summary.add_retries(self._summary.entries)
+    def capture_retry(self, count=None):
+        """
+        :param count: int number of entries being retried. The default is all the entries.
+        """
+        with self._lock:
+            self._summary.add_retries(self._summary.entries if count is None else count)
+
+    def take_deferred_retry(self, source_names):
+        """
+        :param source_names: list of str source names for an entry that failed
+        :return: True if the failure was one that can be retried, when defer_retries is set
+        """
+        with self._lock:
+            result = False
+            for source_name in source_names:
+                if source_name in self._deferred_retries:
+                    self._deferred_retries.discard(source_name)
+                    result = True
+            return result
+
+    def capture_deferred_retry(self, source_names):
+        """Write the source names for an entry that failed its final attempt to the retries file."""
+        with self._lock:
+            with open(self._retry_fqn, 'a') as retry:
+                for entry in source_names:
+                    retry.write(f'{entry}\n')
+
+    def capture_unchanged(self, obs_id):
+        """Count an observation that was not written to the CAOM2 repository, because its content did not change."""
+        self._logger.debug(f'Unchanged observation {obs_id}')
+        with self._lock:
+            self._summary.add_unchanged(1)
+
+    def capture_short_circuit(self, file_name):
+        """Count an entry for which INGEST did not run the metadata visitors, because its files are unchanged."""
+        self._logger.debug(f'Short circuit for {file_name}')
+        with self._lock:
+            self._summary.add_short_circuits(1)
+
+    def capture_stage(self, name, workers, busy_s, elapsed_s):
+        """Track the utilisation of a pipeline stage."""
+        with self._lock:
+            self._summary.add_stage(name, workers, busy_s, elapsed_s)
 
 
 class ExecutionSummary:
@@ -571,6 +727,12 @@ class ExecutionSummary:
         - Number of skipped: the number of entries with a checksum that is the same at the data source as it is in
              CADC storage. If the checksum is the same, the pipeline can make no changes to either the data or metdata,
              so it doesn't try.
+        - Number of unchanged: the number of observations that the visitors left exactly as they were retrieved, so
+             the pipeline did not write them back to the CAOM2 repository. The entries for those observations are
+             also counted as successes.
+        - Number of short circuits: the number of entries with files that have the same md5 checksums as the
+             matching Artifacts, so that INGEST did not run the metadata visitors for them. These entries are also
+             counted as successes.
         """
         self._version = '0.0.0' if application == 'DEFAULT' else get_version(application)
         self._location = location
@@ -579,9 +741,13 @@ class ExecutionSummary:
         self._errors_sum = 0
         self._rejected_sum = 0
         self._retry_sum = 0
+        self._short_circuit_sum = 0
         self._skipped_sum = 0
         self._success_sum = 0
         self._timeouts_sum = 0
+        self._unchanged_sum = 0
+        # stage name: [workers, busy seconds, elapsed seconds]
+        self._stages = {}
 
     def __str__(self):
         return self.report()
@@ -598,6 +764,9 @@ class ExecutionSummary:
     def add_retries(self, value):
         self._retry_sum += value
 
+    def add_short_circuits(self, value):
+        self._short_circuit_sum += value
+
     def add_skipped(self, value):
         self._skipped_sum += value
 
@@ -607,6 +776,20 @@ class ExecutionSummary:
     def add_timeouts(self, value):
         self._timeouts_sum += value
 
+    def add_unchanged(self, value):
+        self._unchanged_sum += value
+
+    def add_stage(self, name, workers, busy_s, elapsed_s):
+        """
+        :param name: str pipeline stage name
+        :param workers: int number of worker threads in the stage
+        :param busy_s: float seconds the workers spent processing entries
+        :param elapsed_s: float seconds the stage was running
+        """
+        stage = self._stages.setdefault(name, [workers, 0.0, 0.0])
+        stage[1] += busy_s
+        stage[2] += elapsed_s
+
     @property
     def success(self):
         return self._success_sum
@@ -615,6 +798,14 @@ class ExecutionSummary:
     def entries(self):
         return self._entries_sum
 
+    @property
+    def short_circuits(self):
+        return self._short_circuit_sum
+
+    @property
+    def unchanged(self):
+        return self._unchanged_sum
+
     def report(self):
         msg1 = f'Location: {self._location}'
         msg2 = f'Date: {datetime.isoformat(datetime.utcnow())}'
@@ -628,6 +819,12 @@ class ExecutionSummary:
         msg9 = f'    Number of Errors: {self._errors_sum}'
         msg10 = f'Number of Rejections: {self._rejected_sum}'
         msg11 = f'   Number of Skipped: {self._skipped_sum}'
+        msg12 = f' Number of Unchanged: {self._unchanged_sum}'
+        msg13 = f'Number of Short Circuits: {self._short_circuit_sum}'
+        msg_stages = ''
+        for name, (workers, busy_s, elapsed_s) in self._stages.items():
+            utilisation = 0.0 if elapsed_s == 0 else 100.0 * busy_s / (workers * elapsed_s)
+            msg_stages += f'Stage {name}: {utilisation:.1f}% utilisation of {workers} workers\n'
         max_length = max(
             len(msg1),
             len(msg2),
@@ -640,11 +837,14 @@ class ExecutionSummary:
             len(msg9),
             len(msg10),
             len(msg11),
+            len(msg12),
+            len(msg13),
+            *[len(line) for line in msg_stages.splitlines()],
         )
         msg_highlight = '*' * max_length
         msg = (
             f'\n\n{msg_highlight}\n{msg1}\n{msg2}\n{msg3}\n{msg4}\n{msg5}\n'
-            f'{msg6}\n{msg7}\n{msg8}\n{msg9}\n{msg10}\n{msg11}\n{msg_highlight}\n\n'
+            f'{msg6}\n{msg7}\n{msg8}\n{msg9}\n{msg10}\n{msg11}\n{msg12}\n{msg13}\n{msg_stages}{msg_highlight}\n\n'
         )
         return msg
 
@@ -661,6 +861,7 @@ class Metrics:
 
     def __init__(self, config):
         self.enabled = config.observe_execution
+        self._lock = threading.Lock()
         if self.enabled:
             self.history = {}
             self.failures = {}
@@ -670,35 +871,38 @@ class Metrics:
         if self.enabled:
             elapsed = round(stop - start, 3)
             rate = round(size / (stop - start), 3)
-            if service not in self.history:
-                self.history[service] = {}
-            if action not in self.history[service]:
-                self.history[service][action] = {}
-            self.history[service][action][label] = [elapsed, rate, start]
+            with self._lock:
+                if service not in self.history:
+                    self.history[service] = {}
+                if action not in self.history[service]:
+                    self.history[service][action] = {}
+                self.history[service][action][label] = [elapsed, rate, start]
 
     def observe_failure(self, action, service, label):
         if self.enabled:
-            if service not in self.failures:
-                self.failures[service] = {}
-            if action not in self.failures[service]:
-                self.failures[service][action] = {}
-            if label not in self.failures[service][action]:
-                self.failures[service][action][label] = 1
-            else:
-                self.failures[service][action][label] += 1
+            with self._lock:
+                if service not in self.failures:
+                    self.failures[service] = {}
+                if action not in self.failures[service]:
+                    self.failures[service][action] = {}
+                if label not in self.failures[service][action]:
+                    self.failures[service][action][label] = 1
+                else:
+                    self.failures[service][action][label] += 1
 
     def capture(self):
         if self.enabled:
             create_dir(self.observable_dir)
             now = datetime.utcnow().timestamp()
-            for service in self.history.keys():
-                fqn = os.path.join(
-                    self.observable_dir, f'{now}.{service}.yml'
-                )
-                write_as_yaml(self.history[service], fqn)
+            with self._lock:
+                for service in self.history.keys():
+                    fqn = os.path.join(
+                        self.observable_dir, f'{now}.{service}.yml'
+                    )
+                    write_as_yaml(self.history[service], fqn)
 
-            fqn = os.path.join(self.observable_dir, f'{now}.fail.yml')
-            write_as_yaml(self.failures, fqn)
+                fqn = os.path.join(self.observable_dir, f'{now}.fail.yml')
+                write_as_yaml(self.failures, fqn)
 
 
 def minimize_on_keyword(x, candidate):
@@ -868,6 +1072,7 @@ class Config:
         self._retry_file_name = None
         # the fully qualified name for the file
         self.retry_fqn = None
+        self._retry_backoff = False
         self._retry_failures = False
         self._retry_count = 1
         self._retry_decay = 1
@@ -887,6 +1092,24 @@ class Config:
         self._progress_file_name = None
         self.progress_fqn = None
         self._interval = None
+        self._interval_batch_size = None
+        self._min_interval = 1
+        self._max_interval = 43200
+        self._parallelism = 1
+        self._queue_fqn = None
+        self._queue_lease = 3600
+        self._repo_writers = 0
+        self._prefetch_depth = 0
+        self._metadata_budget_bytes = 536870912
+        self._metadata_cache_directory = None
+        self._metadata_cache_bytes = 10737418240
+        self._metadata_workers = 1
+        self._checkpoint_entries = False
+        self._group_by_obs_id = False
+        self._force_reprocess = False
+        self._stream_work = False
+        self._stage_workers = {}
+        self._modify_processes = 0
         self._observe_execution = False
         self._observable_directory = None
         self._source_host = None
@@ -1145,6 +1368,19 @@ class Config:
                 self._log_file_directory, self._retry_file_name
             )
 
+    @property
+    def retry_backoff(self):
+        """If True, and retry_failures is True, an entry that fails is
+        retried in the same run, after a delay that grows exponentially, with
+        jitter, with each attempt. The first delay is retry_decay minutes.
+        Retried entries are interleaved with the rest of the work, instead of
+        being replayed from the retries.txt file once the run is finished."""
+        return self._retry_backoff
+
+    @retry_backoff.setter
+    def retry_backoff(self, value):
+        self._retry_backoff = value
+
     @property
     def retry_failures(self):
         """Will the application retry the entries in the
@@ -1326,6 +1562,226 @@ class Config:
     def interval(self, value):
         self._interval = value
 
+    @property
+    def interval_batch_size(self):
+        """The target number of entries in a time-box. If set, the
+        StateRunner grows the interval when time-boxes have fewer entries,
+        and shrinks the interval when time-boxes have more entries, within
+        the min_interval and max_interval bounds."""
+        return self._interval_batch_size
+
+    @interval_batch_size.setter
+    def interval_batch_size(self, value):
+        self._interval_batch_size = value
+
+    @property
+    def max_interval(self):
+        """The largest interval, in minutes, when the time-box size is
+        adapted to interval_batch_size."""
+        return self._max_interval
+
+    @max_interval.setter
+    def max_interval(self, value):
+        self._max_interval = value
+
+    @property
+    def min_interval(self):
+        """The smallest interval, in minutes, when the time-box size is
+        adapted to interval_batch_size."""
+        return self._min_interval
+
+    @min_interval.setter
+    def min_interval(self, value):
+        self._min_interval = value
+
+    @property
+    def parallelism(self):
+        """The number of entries that are processed at the same time by
+        the TodoRunner and the StateRunner. A value of 1 means the entries
+        are processed one at a time."""
+        return self._parallelism
+
+    @parallelism.setter
+    def parallelism(self, value):
+        self._parallelism = value
+
+    @property
+    def checkpoint_entries(self):
+        """If True, the StateRunner records each entry as it is completed
+        in a journal beside the state file, so that the entries completed in
+        a time-box are not processed again if the pipeline is stopped before
+        the end of the time-box, and then restarted."""
+        return self._checkpoint_entries
+
+    @checkpoint_entries.setter
+    def checkpoint_entries(self, value):
+        self._checkpoint_entries = value
+
+    @property
+    def force_reprocess(self):
+        """If True, INGEST runs the metadata visitors for every entry, even
+        when the md5 checksums of the files are the same as the content
+        checksums of the matching Artifacts."""
+        return self._force_reprocess
+
+    @force_reprocess.setter
+    def force_reprocess(self, value):
+        self._force_reprocess = value
+
+    @property
+    def group_by_obs_id(self):
+        """If True, the entries of a todo list or a time-box that share an
+        observation ID are processed together, so that the CAOM2 record for
+        the observation is read from, and written to, the repository once for
+        all of them, instead of once for each of them."""
+        return self._group_by_obs_id
+
+    @group_by_obs_id.setter
+    def group_by_obs_id(self, value):
+        self._group_by_obs_id = value
+
+    @property
+    def journal_fqn(self):
+        """The fully-qualified name of the journal used when
+        checkpoint_entries is True."""
+        if self.state_fqn is None:
+            return None
+        return f'{os.path.splitext(self.state_fqn)[0]}_journal.txt'
+
+    @property
+    def queue_fqn(self):
+        """The fully-qualified name of the SQLite database that holds the
+        work to be done, when more than one pipeline instance works through
+        the same backlog. The instances must be on the same host, and the
+        file must be on a local file system, not a network file system. If
+        None, the work file is read directly."""
+        return self._queue_fqn
+
+    @queue_fqn.setter
+    def queue_fqn(self, value):
+        self._queue_fqn = value
+
+    @property
+    def queue_lease(self):
+        """How many seconds an entry from the queue_fqn database belongs to
+        the pipeline instance that is processing it. After that, another
+        instance may process the entry."""
+        return self._queue_lease
+
+    @queue_lease.setter
+    def queue_lease(self, value):
+        self._queue_lease = value
+
+    @property
+    def metadata_budget_bytes(self):
+        """The most memory, in bytes, that the MetadataReader uses for each
+        of the headers and the FileInfo it has retrieved. The least-recently
+        used content is discarded first. The content for the entry being
+        processed is kept, whatever its size."""
+        return self._metadata_budget_bytes
+
+    @metadata_budget_bytes.setter
+    def metadata_budget_bytes(self, value):
+        self._metadata_budget_bytes = value
+
+    @property
+    def metadata_cache_bytes(self):
+        """The most disk space, in bytes, used by the FITS headers in the
+        metadata_cache_directory. The least-recently used headers are removed
+        first."""
+        return self._metadata_cache_bytes
+
+    @metadata_cache_bytes.setter
+    def metadata_cache_bytes(self, value):
+        self._metadata_cache_bytes = value
+
+    @property
+    def metadata_cache_directory(self):
+        """Where FITS headers are kept between pipeline runs, so that they are
+        only retrieved again when the md5sum of the file changes. The default
+        of None means headers are not kept."""
+        return self._metadata_cache_directory
+
+    @metadata_cache_directory.setter
+    def metadata_cache_directory(self, value):
+        self._metadata_cache_directory = value
+
+    @property
+    def metadata_workers(self):
+        """The number of threads that retrieve the headers, and prepare the
+        blueprints, for the files of one entry at the same time. Adding
+        metadata to the Observation is always done by one thread. The default
+        of 1 does everything in the calling thread."""
+        return self._metadata_workers
+
+    @metadata_workers.setter
+    def metadata_workers(self, value):
+        self._metadata_workers = value
+
+    @property
+    def prefetch_depth(self):
+        """The number of entries after the current one for which the
+        metadata and the existing observation are retrieved in background
+        threads, while the current entry is processed. A value of 0 means
+        the retrieval happens when an entry is processed."""
+        return self._prefetch_depth
+
+    @prefetch_depth.setter
+    def prefetch_depth(self, value):
+        self._prefetch_depth = value
+
+    @property
+    def repo_writers(self):
+        """The number of threads that write to the CAOM2 repository, while
+        the pipeline goes on to the next entry. A value of 0 means each write
+        is done before the pipeline goes on to the next entry."""
+        return self._repo_writers
+
+    @repo_writers.setter
+    def repo_writers(self, value):
+        self._repo_writers = value
+
+    @property
+    def stage_workers(self):
+        """A dict of the number of worker threads for each task type,
+        indexed by the task type value, e.g. {'store': 8, 'ingest': 2}. If
+        set, each task type runs as a pipeline stage, with its own workers,
+        and stages are connected by bounded queues. Task types that are not
+        in the dict have one worker. If empty, each entry runs all the task
+        types before the next entry starts."""
+        return self._stage_workers
+
+    @stage_workers.setter
+    def stage_workers(self, value):
+        self._stage_workers = value
+
+    @property
+    def stream_work(self):
+        """If true, the TodoRunner processes entries as the DataSource
+        finds them, instead of after the DataSource has found all the
+        entries. DataSources that move or delete entries in clean_up, like
+        LocalFilesDataSource and VaultCleanupDataSource, still find all the
+        entries first."""
+        return self._stream_work
+
+    @stream_work.setter
+    def stream_work(self, value):
+        self._stream_work = value
+
+    @property
+    def modify_processes(self):
+        """The number of worker processes that execute the data visitors
+        for the MODIFY task type. A value of 0 means the data visitors are
+        executed in the same process as the rest of the pipeline. The worker
+        processes visit copies of the StorageName and the MetadataReader
+        content, so changes the data visitors make to those are lost, and
+        data visitors that make such changes need a value of 0."""
+        return self._modify_processes
+
+    @modify_processes.setter
+    def modify_processes(self, value):
+        self._modify_processes = value
+
     @property
     def observe_execution(self):
         """If true, time and track the CADC service invocations."""
@@ -1386,6 +1842,7 @@ class Config:
         return (
             f'\nFrom {os.getcwd()}/config.yml:\n'
             f'  cache_fqn:: {self.cache_fqn}\n'
+            f'  checkpoint_entries:: {self.checkpoint_entries}\n'
             f'  cleanup_failure_destination:: '
             f'{self.cleanup_failure_destination}\n'
             f'  cleanup_files_when_storing:: '
@@ -1398,23 +1855,40 @@ class Config:
             f'  failure_fqn:: {self.failure_fqn}\n'
             f'  failure_log_file_name:: {self.failure_log_file_name}\n'
             f'  features:: {self.features}\n'
+            f'  force_reprocess:: {self.force_reprocess}\n'
+            f'  group_by_obs_id:: {self.group_by_obs_id}\n'
             f'  interval:: {self.interval}\n'
+            f'  interval_batch_size:: {self.interval_batch_size}\n'
+            f'  journal_fqn:: {self.journal_fqn}\n'
             f'  log_file_directory:: {self.log_file_directory}\n'
             f'  log_to_file:: {self.log_to_file}\n'
             f'  logging_level:: {self.logging_level}\n'
+            f'  max_interval:: {self.max_interval}\n'
+            f'  metadata_budget_bytes:: {self.metadata_budget_bytes}\n'
+            f'  metadata_cache_bytes:: {self.metadata_cache_bytes}\n'
+            f'  metadata_cache_directory:: {self.metadata_cache_directory}\n'
+            f'  metadata_workers:: {self.metadata_workers}\n'
+            f'  min_interval:: {self.min_interval}\n'
+            f'  modify_processes:: {self.modify_processes}\n'
             f'  observable_directory:: {self.observable_directory}\n'
             f'  observe_execution:: {self.observe_execution}\n'
+            f'  parallelism:: {self.parallelism}\n'
+            f'  prefetch_depth:: {self.prefetch_depth}\n'
             f'  preview_scheme:: {self.preview_scheme}\n'
             f'  progress_file_name:: {self.progress_file_name}\n'
             f'  progress_fqn:: {self.progress_fqn}\n'
             f'  proxy_file_name:: {self.proxy_file_name}\n'
             f'  proxy_fqn:: {self.proxy_fqn}\n'
+            f'  queue_fqn:: {self.queue_fqn}\n'
+            f'  queue_lease:: {self.queue_lease}\n'
             f'  recurse_data_sources:: {self.recurse_data_sources}\n'
             f'  rejected_directory:: {self.rejected_directory}\n'
             f'  rejected_file_name:: {self.rejected_file_name}\n'
             f'  rejected_fqn:: {self.rejected_fqn}\n'
             f'  report_fqn:: {self.report_fqn}\n'
+            f'  repo_writers:: {self.repo_writers}\n'
             f'  resource_id:: {self.resource_id}\n'
+            f'  retry_backoff:: {self.retry_backoff}\n'
             f'  retry_count:: {self.retry_count}\n'
             f'  retry_decay:: {self.retry_decay}\n'
             f'  retry_failures:: {self.retry_failures}\n'
@@ -1424,11 +1898,13 @@ class Config:
             f'  slack_channel:: {self.slack_channel}\n'
             f'  slack_token:: secret\n'
             f'  source_host:: {self.source_host}\n'
+            f'  stage_workers:: {self.stage_workers}\n'
             f'  state_file_name:: {self.state_file_name}\n'
             f'  state_fqn:: {self.state_fqn}\n'
             f'  storage_inventory_resource_id:: {self.storage_inventory_resource_id}\n'
             f'  storage_inventory_tap_resource_id:: {self.storage_inventory_tap_resource_id}\n'
             f'  store_modified_files_only:: {self.store_modified_files_only}\n'
+            f'  stream_work:: {self.stream_work}\n'
             f'  success_fqn:: {self.success_fqn}\n'
             f'  success_log_file_name:: {self.success_log_file_name}\n'
             f'  tap_id:: {self.tap_id}\n'
@@ -1550,6 +2026,7 @@ class Config:
             self.retry_file_name = config.get(
                 'retry_file_name', 'retries.txt'
             )
+            self.retry_backoff = config.get('retry_backoff', False)
             self.retry_failures = config.get('retry_failures', False)
             self.retry_count = config.get('retry_count', 1)
             self.retry_decay = config.get('retry_decay', 1)
@@ -1563,10 +2040,26 @@ class Config:
                 'progress_file_name', 'progress.txt'
             )
             self.interval = config.get('interval', 10)
+            self.interval_batch_size = config.get('interval_batch_size', None)
+            self.min_interval = config.get('min_interval', 1)
+            self.max_interval = config.get('max_interval', 43200)
+            self.parallelism = config.get('parallelism', 1)
+            self.modify_processes = config.get('modify_processes', 0)
+            self.queue_fqn = config.get('queue_fqn', None)
+            self.queue_lease = config.get('queue_lease', 3600)
+            self.repo_writers = config.get('repo_writers', 0)
+            self.prefetch_depth = config.get('prefetch_depth', 0)
+            self.metadata_budget_bytes = config.get('metadata_budget_bytes', 536870912)
+            self.metadata_cache_directory = config.get('metadata_cache_directory', None)
+            self.metadata_cache_bytes = config.get('metadata_cache_bytes', 10737418240)
+            self.metadata_workers = config.get('metadata_workers', 1)
             self.features = self._obtain_features(config)
             self.proxy_file_name = config.get('proxy_file_name', None)
             self.state_file_name = config.get('state_file_name', None)
             self.cache_file_name = config.get('cache_file_name', None)
+            self.checkpoint_entries = config.get('checkpoint_entries', False)
+            self.group_by_obs_id = config.get('group_by_obs_id', False)
+            self.force_reprocess = config.get('force_reprocess', False)
             self.observe_execution = config.get('observe_execution', False)
             self.observable_directory = config.get(
                 'observable_directory', None
@@ -1587,6 +2080,8 @@ class Config:
             self.store_modified_files_only = config.get(
                 'store_modified_files_only', False
             )
+            self.stream_work = config.get('stream_work', False)
+            self.stage_workers = config.get('stage_workers', {})
             self.preview_scheme = config.get('preview_scheme', 'cadc')
             self._report_fqn = os.path.join(
                 self.log_file_directory,
@@ -2561,6 +3056,22 @@ def write_obs_to_file(obs, fqn):
     ow.write(obs, fqn)
 
 
+def get_obs_fingerprint(obs):
+    """Common code to summarize the content of a CAOM Observation, so that
+    unchanged content can be recognized without a field-by-field comparison.
+
+    :param obs: Observation, or None
+    :return: str md5 hex digest of the XML serialization of the Observation,
+        or None
+    """
+    if obs is None:
+        return None
+    ow = ObservationWriter()
+    buffer = BytesIO()
+    ow.write(obs, buffer)
+    return md5(buffer.getvalue()).hexdigest()
+
+
 def read_obs_from_file(fqn):
     """Common code to read a CAOM Observation from a file."""
     if not os.path.exists(fqn):
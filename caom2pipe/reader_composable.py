@@ -67,12 +67,27 @@
 # ***********************************************************************
 #
 
+import hashlib
 import logging
-import tempfile
+import mmap
+import os
+import sqlite3
+import sys
+import threading
 import traceback
-
+import zlib
+
+from astropy.io import fits
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from urllib.parse import urlencode
+from collections.abc import MutableMapping
+from cadcdata import FileInfo
 from cadcutils import exceptions
 from caom2utils import data_util
+from caom2pipe import astro_composable as ac
 from caom2pipe import client_composable as clc
 from caom2pipe import manage_composable as mc
 
@@ -80,6 +95,8 @@ from caom2pipe import manage_composable as mc
 __all__ = [
     'DelayedClientReader',
     'FileMetadataReader',
+    'H5MetadataReader',
+    'MetadataCache',
     'MetadataReader',
     'reader_factory',
     'StorageClientReader',
@@ -87,6 +104,263 @@ __all__ = [
 ]
 
 
+# the default MetadataReader memory budget, per kind of metadata
+DEFAULT_BUDGET_BYTES = 512 * 1024 * 1024
+
+
+def _estimate_bytes(value):
+    """
+    :param value: a headers or FileInfo entry from a MetadataReader
+    :return: int an estimate of the memory used by the value, counting the 80-byte cards of FITS headers, which
+        does not parse an ac.CompactHeader
+    """
+    if isinstance(value, fits.Header):
+        return len(value) * 80
+    if isinstance(value, ac.H5Headers):
+        return value.estimate_bytes()
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate_bytes(ii) for ii in value)
+    return sys.getsizeof(value)
+
+
+class _MetadataStats:
+    """Hit, miss and eviction counts for a MetadataReader, shared with its copies, which may be used by other
+    threads."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def add(self, hits=0, misses=0, evictions=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.evictions += evictions
+
+
+class _BoundedStore(MutableMapping):
+    """A least-recently-used dict with a memory budget in bytes. Pinned keys, the ones used by the entry being
+    processed, are never evicted, so the budget may be exceeded while they are in use. Content may be retrieved by
+    several threads at once, so access is locked."""
+
+    def __init__(self, budget_bytes, stats):
+        """
+        :param budget_bytes: int the most memory the values may use, as estimated by _estimate_bytes
+        :param stats: _MetadataStats instance for the eviction count
+        """
+        self._budget_bytes = budget_bytes
+        self._stats = stats
+        self._content = OrderedDict()
+        self._sizes = {}
+        self._pinned = set()
+        self._total_bytes = 0
+        # re-entrant, because _evict deletes
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._content[key]
+
+    def __setitem__(self, key, value):
+        size = _estimate_bytes(value)
+        with self._lock:
+            if key in self._content:
+                self._total_bytes -= self._sizes[key]
+            self._content[key] = value
+            self._content.move_to_end(key)
+            self._sizes[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._content[key]
+            self._total_bytes -= self._sizes.pop(key)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._content))
+
+    def __len__(self):
+        return len(self._content)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._content:
+                return default
+            value = self._content[key]
+            del self[key]
+            return value
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({dict(self._content)})'
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def pin(self, keys):
+        """Replace the pinned keys."""
+        with self._lock:
+            self._pinned = set(keys)
+
+    def touch(self, key):
+        """Make the key the most-recently-used one."""
+        with self._lock:
+            self._content.move_to_end(key)
+
+    def _evict(self):
+        if self._total_bytes <= self._budget_bytes:
+            return
+        evicted = 0
+        for key in list(self._content.keys()):
+            if self._total_bytes <= self._budget_bytes:
+                break
+            if key not in self._pinned:
+                del self[key]
+                evicted += 1
+        self._stats.add(evictions=evicted)
+
+
+class MetadataCache:
+    """A persistent cache of FITS headers, shared by pipeline runs, and by the pipeline instances that use the same
+    directory.
+
+    The headers for a file are kept as a compressed blob in the directory, and are found with an SQLite index keyed
+    by the Artifact URI and the md5sum of the file. The md5sum comes from the FileInfo, so a file that has changed
+    since its headers were cached is a miss. The least-recently-used blobs are removed once the blobs use more than
+    budget_bytes.
+    """
+
+    INDEX_FILE_NAME = 'index.db'
+
+    def __init__(self, directory, budget_bytes):
+        """
+        :param directory: str where the blobs and the index are kept
+        :param budget_bytes: int the most disk space the blobs may use
+        """
+        self._directory = directory
+        self._budget_bytes = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        mc.create_dir(directory)
+        # the connection is shared by the worker threads of this instance, the database handles the other instances
+        self._connection = sqlite3.connect(
+            os.path.join(directory, MetadataCache.INDEX_FILE_NAME),
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS headers ('
+                'uri TEXT PRIMARY KEY, md5sum TEXT NOT NULL, blob TEXT NOT NULL, size INTEGER NOT NULL, '
+                'last_used REAL NOT NULL)'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS headers_last_used ON headers (last_used)')
+            # kept up-to-date by this instance, and re-counted when it's over budget, for the writes of other
+            # instances
+            self._total_bytes = self._count_bytes()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def get_headers(self, uri, md5sum):
+        """
+        :param uri: str Artifact URI
+        :param md5sum: str md5sum of the file, as it is now
+        :return: list of ac.CompactHeader instances, or None if the headers for that version of the file are not
+            cached
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT blob FROM headers WHERE uri = ? AND md5sum = ?', (uri, md5sum)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    'UPDATE headers SET last_used = ? WHERE uri = ?', (datetime.utcnow().timestamp(), uri)
+                )
+        result = None
+        if row is not None:
+            try:
+                with open(os.path.join(self._directory, row[0]), 'rb') as f:
+                    result = _headers_from_cards(zlib.decompress(f.read()).decode('ascii'))
+            except Exception as e:
+                # another instance evicted it, or it's damaged, so retrieve it again
+                self._logger.debug(f'Could not read cached headers for {uri} because {e}')
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def put_headers(self, uri, md5sum, headers):
+        """
+        :param uri: str Artifact URI
+        :param md5sum: str md5sum of the file the headers were retrieved from
+        :param headers: list of fits.Header instances. Anything else is not cached.
+        """
+        if not all(isinstance(header, fits.Header) for header in headers):
+            return
+        content = zlib.compress(''.join(header.tostring(padding=False) for header in headers).encode('ascii'))
+        blob = f'{hashlib.sha1(uri.encode()).hexdigest()}.z'
+        # write then rename, so other instances never read part of a blob
+        temp_fqn = os.path.join(self._directory, f'{blob}.{os.getpid()}.{threading.get_ident()}')
+        with open(temp_fqn, 'wb') as f:
+            f.write(content)
+        os.replace(temp_fqn, os.path.join(self._directory, blob))
+        with self._lock:
+            row = self._connection.execute('SELECT size FROM headers WHERE uri = ?', (uri,)).fetchone()
+            self._connection.execute(
+                'INSERT OR REPLACE INTO headers (uri, md5sum, blob, size, last_used) VALUES (?, ?, ?, ?, ?)',
+                (uri, md5sum, blob, len(content), datetime.utcnow().timestamp()),
+            )
+            self._total_bytes += len(content) - (0 if row is None else row[0])
+            if self._total_bytes > self._budget_bytes:
+                self._evict()
+
+    def _count_bytes(self):
+        return self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM headers').fetchone()[0]
+
+    def _evict(self):
+        """Remove the least-recently-used blobs until the blobs fit in the budget."""
+        self._total_bytes = self._count_bytes()
+        while self._total_bytes > self._budget_bytes:
+            rows = self._connection.execute(
+                'SELECT uri, blob, size FROM headers ORDER BY last_used LIMIT 100'
+            ).fetchall()
+            if len(rows) == 0:
+                break
+            for uri, blob, size in rows:
+                if self._total_bytes <= self._budget_bytes:
+                    break
+                self._connection.execute('DELETE FROM headers WHERE uri = ?', (uri,))
+                try:
+                    os.unlink(os.path.join(self._directory, blob))
+                except FileNotFoundError:
+                    pass
+                self._total_bytes -= size
+                self.evictions += 1
+
+
+def _headers_from_cards(text):
+    """
+    :param text: str the cards of one or more headers, each header ending with an END card, without padding
+    :return: list of ac.CompactHeader instances
+    """
+    headers = []
+    start = 0
+    for offset in range(0, len(text), ac.FITS_CARD_BYTES):
+        if text[offset:offset + ac.FITS_KEYWORD_BYTES].rstrip() == 'END':
+            headers.append(ac.CompactHeader(raw=text[start:offset]))
+            start = offset + ac.FITS_CARD_BYTES
+    return headers
+
+
 class MetadataReader:
     """Wrap the mechanism for retrieving metadata from the data source, that is used to create a
     CAOM2 record, and to make decisions about how to create that record. Use
@@ -108,11 +382,45 @@ class MetadataReader:
     """
 
     def __init__(self):
-        # dicts are indexed by mc.StorageName.destination_uris
-        self._headers = {}  # astropy.io.fits.Headers
-        self._file_info = {}  # cadcdata.FileInfo
+        self._budget_bytes = DEFAULT_BUDGET_BYTES
+        self._stats = _MetadataStats()
+        # dicts are indexed by mc.StorageName.destination_uris, and hold the least-recently-used content that fits in
+        # the budget
+        self._headers = self._new_store()  # astropy.io.fits.Headers
+        self._file_info = self._new_store()  # cadcdata.FileInfo
+        # the content retrieved by set_batch, which lasts until an entry uses it, or until the reset_batch call,
+        # because the reset call happens after each entry. It's held to the budget, for the entries that never use it.
+        self._batch_headers = self._new_store()
+        self._batch_file_info = self._new_store()
+        self._cache = None
+        self._workers = 1
         self._logger = logging.getLogger(self.__class__.__name__)
 
+    @property
+    def budget_bytes(self):
+        """The most memory, in bytes, that each of the headers and the file_info content may use. The content for the
+        entry being processed is kept, whatever its size."""
+        return self._budget_bytes
+
+    @budget_bytes.setter
+    def budget_bytes(self, value):
+        self._budget_bytes = value
+        self.reset()
+        self.reset_batch()
+
+    @property
+    def cache(self):
+        """A MetadataCache instance, checked for headers before they are retrieved, or None."""
+        return self._cache
+
+    @cache.setter
+    def cache(self, value):
+        self._cache = value
+
+    @property
+    def evictions(self):
+        return self._stats.evictions
+
     @property
     def file_info(self):
         return self._file_info
@@ -121,6 +429,25 @@ class MetadataReader:
     def headers(self):
         return self._headers
 
+    @property
+    def hits(self):
+        return self._stats.hits
+
+    @property
+    def misses(self):
+        return self._stats.misses
+
+    @property
+    def workers(self):
+        """The number of threads that retrieve the metadata for the files of one entry. Implementations of
+        _retrieve_headers and _retrieve_file_info must be safe to call from several threads when this is more
+        than 1."""
+        return self._workers
+
+    @workers.setter
+    def workers(self, value):
+        self._workers = value
+
     def _retrieve_file_info(self, key, source_name):
         """
         :param key: Artifact URI
@@ -135,36 +462,259 @@ class MetadataReader:
         """
         raise NotImplementedError
 
+    def _find_headers(self, key, source_name):
+        """Use the cached headers for the file, if there are any, otherwise retrieve, and cache, them. The FileInfo
+        for the file provides the md5sum that the cache is keyed on, so headers are not cached without it.
+
+        :param key: Artifact URI
+        :param source_name: fully-qualified name at the data source
+        """
+        file_info = self._file_info.get(key, self._batch_file_info.get(key))
+        md5sum = None
+        if self._cache is not None and file_info is not None and file_info.md5sum is not None:
+            md5sum = file_info.md5sum.replace('md5:', '')
+            headers = self._cache.get_headers(key, md5sum)
+            if headers is not None:
+                self._headers[key] = headers
+                return
+        self._retrieve_headers(key, source_name)
+        if md5sum is not None and self._headers.get(key) is not None:
+            self._cache.put_headers(key, md5sum, self._headers[key])
+
+    def _is_present(self, key, batch, content):
+        """
+        :param key: Artifact URI
+        :param batch: _BoundedStore of set_batch content, which moves to the content once it's used
+        :param content: _BoundedStore of per-entry content
+        :return: True if the content for the key is in memory, without retrieving it
+        """
+        if key in content:
+            content.touch(key)
+        elif key in batch:
+            content[key] = batch.pop(key)
+        else:
+            self._stats.add(misses=1)
+            return False
+        self._stats.add(hits=1)
+        return True
+
+    def _retrieve_missing(self, retrieve, missing):
+        """
+        :param retrieve: _find_headers or _retrieve_file_info
+        :param missing: list of (Artifact URI, fully-qualified name at the data source) tuples
+        """
+        if self._workers > 1 and len(missing) > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(self._workers, len(missing)), thread_name_prefix='caom2pipe-metadata'
+            ) as pool:
+                futures = [pool.submit(retrieve, key, source_name) for key, source_name in missing]
+                # result re-raises the first failure in the calling thread
+                for future in futures:
+                    future.result()
+        else:
+            for key, source_name in missing:
+                retrieve(key, source_name)
+
+    def _new_store(self):
+        return _BoundedStore(self._budget_bytes, self._stats)
+
+    def pin(self, storage_name):
+        """Keep the content for the storage_name in memory, whatever the budget, until the next pin or set call."""
+        self._headers.pin(storage_name.destination_uris)
+        self._file_info.pin(storage_name.destination_uris)
+
     def set(self, storage_name):
         """Retrieves the Header and FileInfo information to memory."""
         self._logger.debug(f'Begin set for {storage_name.file_name}')
-        self.set_headers(storage_name)
+        # FileInfo first, because it has the md5sum for checking the cached headers
         self.set_file_info(storage_name)
+        self.set_headers(storage_name)
         self._logger.debug('End set')
 
+    def set_batch(self, storage_names):
+        """Retrieves Header and FileInfo information for many entries with
+        as few calls as the data source allows, ahead of the set calls for the
+        individual entries. This is called for each window of
+        run_composable.BATCH_WINDOW entries, as a todo list, or a time-box, is
+        processed.
+
+        Implementations put what they retrieve in _batch_headers and
+        _batch_file_info, indexed by mc.StorageName.destination_uris. The set
+        calls use that content, and retrieve anything that is missing one URI
+        at a time. The default implementation retrieves nothing.
+
+        :param storage_names: list of mc.StorageName instances
+        """
+        pass
+
     def set_file_info(self, storage_name):
         """Retrieves FileInfo information to memory."""
         self._logger.debug(f'Begin set_file_info for {storage_name.file_name}')
+        self._file_info.pin(storage_name.destination_uris)
+        missing = []
         for index, entry in enumerate(storage_name.destination_uris):
-            if entry not in self._file_info:
+            if not self._is_present(entry, self._batch_file_info, self._file_info):
                 self._logger.debug(f'Retrieve FileInfo for {entry}')
-                self._retrieve_file_info(entry, storage_name.source_names[index])
+                missing.append((entry, storage_name.source_names[index]))
+        self._retrieve_missing(self._retrieve_file_info, missing)
         self._logger.debug('End set_file_info')
 
     def set_headers(self, storage_name):
         """Retrieves the Header information to memory."""
         self._logger.debug(f'Begin set_headers for {storage_name.file_name}')
+        self._headers.pin(storage_name.destination_uris)
+        missing = []
         for index, entry in enumerate(storage_name.destination_uris):
-            if entry not in self._headers:
+            if not self._is_present(entry, self._batch_headers, self._headers):
                 self._logger.debug(f'Retrieve headers for {entry}')
-                self._retrieve_headers(entry, storage_name.source_names[index])
+                missing.append((entry, storage_name.source_names[index]))
+        self._retrieve_missing(self._find_headers, missing)
         self._logger.debug('End set_headers')
 
     def reset(self):
-        self._headers = {}
-        self._file_info = {}
+        # new instances, not clear calls, because copies of this instance share the content until they are reset
+        self._headers = self._new_store()
+        self._file_info = self._new_store()
         self._logger.debug('End reset')
 
+    def reset_batch(self):
+        """Discard the set_batch content."""
+        self._batch_headers = self._new_store()
+        self._batch_file_info = self._new_store()
+        self._logger.debug('End reset_batch')
+
+
+def _card_int(cards, keyword, default=None):
+    """
+    :param cards: dict of keyword: raw value str
+    :param keyword: str FITS keyword
+    :param default: value if the keyword is not in the cards
+    :return: the value of the keyword as an int
+    """
+    value = cards.get(keyword)
+    if value is None:
+        return default
+    return int(value.split('/')[0].strip())
+
+
+def _fits_data_bytes(cards):
+    """
+    :param cards: dict of keyword: raw value str, for one HDU
+    :return: int the size of the data of the HDU, including the padding to a whole number of blocks
+    """
+    naxis = _card_int(cards, 'NAXIS', 0)
+    if naxis == 0:
+        return 0
+    axes = [_card_int(cards, f'NAXIS{ii}') for ii in range(1, naxis + 1)]
+    if cards.get('GROUPS', '').split('/')[0].strip() == 'T' and axes[0] == 0:
+        # random groups, NAXIS1 = 0 does not count
+        axes = axes[1:]
+    count = 1
+    for axis in axes:
+        count *= axis
+    data_bytes = (
+        abs(_card_int(cards, 'BITPIX')) // 8 * _card_int(cards, 'GCOUNT', 1) * (_card_int(cards, 'PCOUNT', 0) + count)
+    )
+    return (data_bytes + ac.FITS_BLOCK_BYTES - 1) // ac.FITS_BLOCK_BYTES * ac.FITS_BLOCK_BYTES
+
+
+def _is_scannable(cards, primary):
+    """
+    :param cards: dict of keyword: raw value str, for one HDU, in the order of the header
+    :param primary: bool True if the cards are for the first HDU
+    :return: True if astropy would present the header as it is in the file. astropy presents the image header for
+        tile-compressed images, and re-orders the mandatory keywords, including EXTEND, when they are out of order.
+    """
+    try:
+        naxis = _card_int(cards, 'NAXIS', 0)
+    except ValueError:
+        return False
+    mandatory = ['SIMPLE' if primary else 'XTENSION', 'BITPIX', 'NAXIS'] + [f'NAXIS{ii}' for ii in range(1, naxis + 1)]
+    if not primary:
+        mandatory += ['PCOUNT', 'GCOUNT']
+    elif cards.get('GROUPS', '').split('/')[0].strip() == 'T':
+        return False
+    elif 'EXTEND' in cards:
+        mandatory.append('EXTEND')
+    keywords = list(cards.keys())[:len(mandatory)]
+    return keywords == mandatory and cards.get('ZIMAGE', '').split('/')[0].strip() != 'T'
+
+
+def _scan_fits_headers(fqn):
+    """Find the headers of a FITS file by reading its header blocks, and skipping over the data blocks, without
+    reading them.
+
+    :param fqn: str fully-qualified name of the FITS file on disk
+    :return: list of ac.CompactHeader instances, or None if the file can't be scanned this way (compressed files,
+        text header files, truncated or non-conforming files), in which case the caller falls back to astropy
+    """
+    with open(fqn, 'rb') as f:
+        try:
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # empty files, and file systems that don't support mmap
+            content = f.read()
+        try:
+            return _scan_fits_blocks(content)
+        finally:
+            if isinstance(content, mmap.mmap):
+                content.close()
+
+
+def _scan_fits_blocks(content):
+    """
+    :param content: bytes-like FITS file content
+    :return: list of ac.CompactHeader instances, or None if the content does not conform to the FITS block structure
+    """
+    raw_headers = []
+    offset = 0
+    while offset < len(content):
+        start = offset
+        cards = {}
+        found_end = False
+        while not found_end:
+            block = content[offset:offset + ac.FITS_BLOCK_BYTES]
+            if len(block) < ac.FITS_BLOCK_BYTES:
+                return None
+            offset += ac.FITS_BLOCK_BYTES
+            try:
+                text = block.decode('ascii')
+            except UnicodeDecodeError:
+                return None
+            if not text.isprintable():
+                return None
+            for index in range(0, ac.FITS_BLOCK_BYTES, ac.FITS_CARD_BYTES):
+                keyword = text[index:index + 8].rstrip()
+                if keyword == 'END':
+                    found_end = True
+                    break
+                if text[index + 8:index + 10] == '= ':
+                    cards.setdefault(keyword, text[index + 10:index + ac.FITS_CARD_BYTES])
+        if not _is_scannable(cards, len(raw_headers) == 0):
+            return None
+        raw_headers.append(content[start:offset].decode('ascii'))
+        try:
+            offset += _fits_data_bytes(cards)
+        except (TypeError, ValueError):
+            return None
+    if len(raw_headers) == 0:
+        return None
+    return [ac.CompactHeader.from_blocks(ii) for ii in raw_headers]
+
+
+def _make_headers_from_bytes(content):
+    """The in-memory equivalent of data_util.get_local_file_headers.
+
+    :param content: bytes of either header text, with one card per line, or of the header blocks of a FITS file
+    :return: list of fits.Header instances
+    """
+    try:
+        return ac.make_compact_headers(content.decode('utf-8'))
+    except UnicodeDecodeError:
+        with fits.open(BytesIO(content), lazy_load_hdus=True) as hdulist:
+            hdulist.verify('fix')
+            return [h.header for h in hdulist]
+
 
 class FileMetadataReader(MetadataReader):
     """Use case: FITS files on local disk."""
@@ -178,7 +728,47 @@ class FileMetadataReader(MetadataReader):
     def _retrieve_headers(self, key, source_name):
         self._headers[key] = []
         if '.fits' in source_name:
-            self._headers[key] = data_util.get_local_headers_from_fits(source_name)
+            headers = None
+            try:
+                headers = _scan_fits_headers(source_name)
+            except Exception as e:
+                self._logger.debug(f'Scan of {source_name} failed with {e}')
+            if headers is None:
+                headers = data_util.get_local_headers_from_fits(source_name)
+            self._headers[key] = headers
+
+
+class H5MetadataReader(FileMetadataReader):
+    """Use case: HDF5 files on local disk, as well as FITS files.
+
+    Each HDF5 file is opened once. The headers are an ac.H5Headers, with one entry per group and dataset, and the
+    attributes of each are only read when a mapping asks for them.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._structure_checked = set()
+
+    def check_structure(self, source_name):
+        """An in-process alternative to the h5check of a file. Files that have already been opened for their
+        headers have had their structure walked, so are not opened again.
+
+        :param source_name: str fully-qualified file name on local storage
+        :return: bool True if the structure is readable
+        """
+        if source_name in self._structure_checked:
+            return True
+        result = ac.check_h5_structure(source_name)
+        if result:
+            self._structure_checked.add(source_name)
+        return result
+
+    def _retrieve_headers(self, key, source_name):
+        if mc.StorageName.is_hdf5(source_name):
+            self._headers[key] = ac.make_h5_headers(source_name, check=True)
+            self._structure_checked.add(source_name)
+        else:
+            super()._retrieve_headers(key, source_name)
 
 
 class StorageClientReader(MetadataReader):
@@ -189,16 +779,66 @@ class StorageClientReader(MetadataReader):
     instead of using the source names, which is the default implementation.
     """
 
-    def __init__(self, client):
+    # the number of URIs in one storage inventory query
+    BATCH_SIZE = 500
+
+    def __init__(self, client, query_client=None):
         """
         :param client: StorageClientWrapper instance
+        :param query_client: CadcTapClient instance for the storage inventory,
+            used by set_batch to retrieve the FileInfo for many files with one
+            query. If None, set_batch retrieves nothing.
         """
         super().__init__()
         self._client = client
+        self._query_client = query_client
 
     def _retrieve_file_info(self, key, source_name):
         self._file_info[key] = self._client.info(source_name)
 
+    def set_batch(self, storage_names):
+        """Retrieves the FileInfo for all the entries with one storage
+        inventory query for every BATCH_SIZE files."""
+        if self._query_client is None:
+            return
+        self._logger.debug(f'Begin set_batch for {len(storage_names)} entries')
+        uris = sorted(
+            {
+                uri
+                for storage_name in storage_names
+                for uri in storage_name.destination_uris
+                if uri not in self._file_info and uri not in self._batch_file_info
+            }
+        )
+        for index in range(0, len(uris), StorageClientReader.BATCH_SIZE):
+            chunk = uris[index:index + StorageClientReader.BATCH_SIZE]
+            in_list = ', '.join("'" + uri.replace("'", "''") + "'" for uri in chunk)
+            query = (
+                f'SELECT A.uri, A.contentLength, A.contentChecksum, A.contentLastModified, A.contentType, '
+                f'A.contentEncoding '
+                f'FROM inventory.Artifact AS A '
+                f'WHERE A.uri IN ({in_list})'
+            )
+            try:
+                rows = clc.query_tap_client(query, self._query_client)
+            except Exception as e:
+                # set_file_info retrieves whatever is missing, one URI at a time
+                self._logger.warning(f'Storage inventory query failed with {e}')
+                self._logger.debug(traceback.format_exc())
+                continue
+            for row in rows:
+                # the same types as the FileInfo from StorageClientWrapper.info, so that the FileInfo compares the same
+                # however it was retrieved
+                self._batch_file_info[row['uri']] = FileInfo(
+                    id=row['uri'],
+                    size=int(row['contentLength']),
+                    md5sum=str(row['contentChecksum']).replace('md5:', ''),
+                    lastmod=datetime.fromisoformat(str(row['contentLastModified'])),
+                    file_type=row['contentType'],
+                    encoding=row['contentEncoding'],
+                )
+        self._logger.debug(f'End set_batch with FileInfo for {len(self._batch_file_info)} files')
+
     def _retrieve_headers(self, key, source_name):
         self._headers[key] = []
         if '.fits' in source_name:
@@ -207,17 +847,23 @@ class StorageClientReader(MetadataReader):
     def set_file_info(self, storage_name):
         """Retrieves FileInfo information from CADC storage to memory."""
         self._logger.debug(f'Begin set_file_info for {storage_name.file_name}')
+        self._file_info.pin(storage_name.destination_uris)
+        missing = []
         for entry in storage_name.destination_uris:
-            if entry not in self._file_info:
-                self._retrieve_file_info(entry, entry)
+            if not self._is_present(entry, self._batch_file_info, self._file_info):
+                missing.append((entry, entry))
+        self._retrieve_missing(self._retrieve_file_info, missing)
         self._logger.debug('End set_file_info')
 
     def set_headers(self, storage_name):
         """Retrieves the Header information from CADC storage to memory."""
         self._logger.debug(f'Begin set_headers for {storage_name.file_name}')
+        self._headers.pin(storage_name.destination_uris)
+        missing = []
         for entry in storage_name.destination_uris:
-            if entry not in self._headers:
-                self._retrieve_headers(entry, entry)
+            if not self._is_present(entry, self._batch_headers, self._headers):
+                missing.append((entry, entry))
+        self._retrieve_missing(self._find_headers, missing)
         self._logger.debug('End set_headers')
 
 
@@ -254,6 +900,9 @@ class DelayedClientReader(StorageClientReader):
 class VaultReader(MetadataReader):
     """Use case: vault."""
 
+    # the SODA parameters for the header view of a file
+    HEADER_PARAMS = {'META': 'true'}
+
     def __init__(self, client):
         """
         :param client: vos.Client instance
@@ -266,12 +915,21 @@ class VaultReader(MetadataReader):
         self._file_info[key] = clc.vault_info(self._client, source_name)
 
     def _retrieve_headers(self, key, source_name):
+        """Read the header view of the file into memory, instead of copying it to a temporary file. The vos Client
+        only sends the SODA META parameter from copy, so it's added to the URLs given to open, otherwise the whole file
+        is returned."""
         try:
-            tmp_file = tempfile.NamedTemporaryFile()
-            self._client.copy(source_name, tmp_file.name, head=True)
-            temp_header = data_util.get_local_file_headers(tmp_file.name)
-            tmp_file.close()
-            self._headers[key] = temp_header
+            urls = self._client.get_node_url(source_name, method='GET', view='header')
+            if not isinstance(urls, list):
+                urls = [urls]
+            params = urlencode(VaultReader.HEADER_PARAMS)
+            header_urls = [f'{url}&{params}' if '?' in url else f'{url}?{params}' for url in urls]
+            vo_file = self._client.open(source_name, view='header', url=header_urls)
+            try:
+                content = vo_file.read()
+            finally:
+                vo_file.close()
+            self._headers[key] = _make_headers_from_bytes(content)
         except Exception as e:
             self._logger.debug(traceback.format_exc())
             raise mc.CadcException(f'Did not retrieve {source_name} header because {e}')
@@ -285,6 +943,10 @@ def reader_factory(config, clients):
     elif mc.TaskType.STORE in config.task_types and not config.use_local_files:
         metadata_reader = DelayedClientReader(clients.data_client)
     else:
-        metadata_reader = StorageClientReader(clients.data_client)
+        metadata_reader = StorageClientReader(clients.data_client, clients.storage_query_client)
+    metadata_reader.budget_bytes = config.metadata_budget_bytes
+    metadata_reader.workers = config.metadata_workers
+    if config.metadata_cache_directory is not None:
+        metadata_reader.cache = MetadataCache(config.metadata_cache_directory, config.metadata_cache_bytes)
     logging.debug(f'Returning {metadata_reader.__class__.__name__} metadata_reader.')
     return metadata_reader
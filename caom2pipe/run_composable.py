@@ -76,13 +76,26 @@ On the structure and responsibility of the 'run' methods:
 
 """
 
+import heapq
+import importlib
 import logging
+import multiprocessing
 import os
+import random
+import threading
 import traceback
 
 from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from copy import copy
+from dataclasses import dataclass, field
 from datetime import datetime
+from functools import partial
+from itertools import count as counter, islice
+from queue import Queue
 from time import sleep
+from types import ModuleType
 
 from caom2pipe import client_composable as cc
 from caom2pipe import execute_composable as ec
@@ -93,6 +106,7 @@ from caom2pipe import reader_composable
 from caom2pipe import transfer_composable
 
 __all__ = [
+    'ActorPool',
     'common_runner_init',
     'get_now_tz',
     'run_by_state',
@@ -102,6 +116,219 @@ __all__ = [
     'TodoRunner',
 ]
 
+# the number of locks shared by the observation IDs being processed, so that memory does not grow with the number of
+# observation IDs in a todo list
+OBS_ID_LOCK_STRIPES = 256
+
+# the number of entries given to one MetadataReader.set_batch call, so that the batch metadata is retrieved a window at
+# a time, as the entries are processed, instead of for a whole todo list at once
+BATCH_WINDOW = 500
+
+
+@dataclass
+class _StagedEntry:
+    """An entry as it moves through the pipeline stages."""
+
+    # str entry from the DataSource
+    entry: str
+    storage_name: mc.StorageName = None
+    # timestamp when the first stage started
+    start_s: float = None
+    # the observation ID lock, held from the first stage until the entry is finished
+    lock: object = None
+    # the MetadataReader content for the entry, indexed by the StorageName.destination_uris
+    headers: dict = field(default_factory=dict)
+    file_info: dict = field(default_factory=dict)
+    # the number of times the entry has already been attempted, when retries happen in-process
+    attempt: int = 0
+    # the observation, read by the first stage that needs it, and written by the last stage
+    record: ec.ObservationRecord = field(default_factory=ec.ObservationRecord)
+
+
+@dataclass
+class _EntryGroup:
+    """Entries that share an observation ID, processed together when config.group_by_obs_id is set."""
+
+    # str entries from the DataSource
+    entries: list
+    # the StorageName instances for the entries, in the same order
+    storage_names: list
+
+
+@dataclass
+class _Prefetched:
+    """What the _Prefetcher retrieved for an entry, before the entry is processed."""
+
+    # None if StorageName construction failed, or the name is not valid, in which case _process_entry reports it
+    storage_name: mc.StorageName = None
+    # the MetadataReader content for the entry, indexed by the StorageName.destination_uris
+    headers: dict = field(default_factory=dict)
+    file_info: dict = field(default_factory=dict)
+    # True if the observation was read from the repository, even if there is no observation
+    retrieved: bool = False
+    observation: object = None
+
+
+class _Prefetcher:
+    """
+    Retrieve the StorageName, the MetadataReader content, and the existing observation, for the next
+    config.prefetch_depth entries, in background threads, while the current entry is processed.
+    """
+
+    def __init__(self, depth, builder, metadata_reader, organizer):
+        """
+        :param depth: int how many entries to retrieve ahead of the current entry
+        :param builder: StorageNameBuilder instance
+        :param metadata_reader: MetadataReader instance, copied for each retrieval
+        :param organizer: OrganizeExecutes instance, for reading observations from the repository
+        """
+        self._depth = depth
+        self._builder = builder
+        self._metadata_reader = metadata_reader
+        self._organizer = organizer
+        self._read_observations = organizer.reads_repository
+        self._executor = ThreadPoolExecutor(max_workers=depth, thread_name_prefix='caom2pipe-prefetch')
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _fetch(self, entry):
+        result = _Prefetched()
+        try:
+            storage_name = self._builder.build(entry)
+            if not storage_name.is_valid():
+                return result
+            result.storage_name = storage_name
+            metadata_reader = copy(self._metadata_reader)
+            metadata_reader.reset()
+            metadata_reader.set(storage_name)
+            result.headers = metadata_reader.headers
+            result.file_info = metadata_reader.file_info
+            if self._read_observations:
+                result.observation = self._organizer.read_ahead(storage_name)
+                result.retrieved = True
+        except Exception as e:
+            # the retrieval happens again when the entry is processed, and the failure is reported then
+            self._logger.debug(f'Prefetch failed for {entry} with {e}')
+        return result
+
+    def lookahead(self, entries):
+        """
+        :param entries: iterable of str entries
+        :return: generator of (str entry, _Prefetched) tuples, in the order of entries
+        """
+        entries = iter(entries)
+        window = deque()
+        for entry in entries:
+            window.append((entry, self._executor.submit(self._fetch, entry)))
+            if len(window) > self._depth:
+                break
+        # the observation IDs of the entries processed since the oldest entry in the window was submitted
+        recent = deque(maxlen=self._depth + 1)
+        while len(window) > 0:
+            entry, future = window.popleft()
+            for next_entry in entries:
+                window.append((next_entry, self._executor.submit(self._fetch, next_entry)))
+                break
+            prefetched = future.result()
+            if prefetched.storage_name is not None:
+                if prefetched.storage_name.obs_id in recent:
+                    # an entry with the same observation ID may have changed the observation after it was read
+                    prefetched.retrieved = False
+                    prefetched.observation = None
+                recent.append(prefetched.storage_name.obs_id)
+            yield entry, prefetched
+
+
+class _RetryQueue:
+    """
+    Entries that failed, each waiting until it is due to be attempted again. The delay before an attempt doubles with
+    each failure of the entry, starting from retry_decay minutes, with jitter, so that entries that fail together are
+    not all retried together.
+    """
+
+    def __init__(self, retry_count, retry_decay):
+        """
+        :param retry_count: int how many times an entry is retried
+        :param retry_decay: float minutes before the first retry of an entry
+        """
+        self._retry_count = retry_count
+        self._decay_s = retry_decay * 60
+        # (due timestamp, tie-breaker, entry)
+        self._heap = []
+        self._order = counter()
+        # entry: the number of times the entry has failed
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)
+
+    def attempt(self, entry):
+        """
+        :param entry: str an entry from the DataSource
+        :return: int the number of times the entry has already been attempted, and failed
+        """
+        with self._lock:
+            return self._attempts.get(entry, 0)
+
+    def done(self, entry):
+        """Forget about an entry that will not be attempted again."""
+        with self._lock:
+            self._attempts.pop(entry, None)
+
+    def put(self, entry):
+        """
+        :param entry: str an entry from the DataSource that failed
+        :return: float seconds until the entry is attempted again, or None if the entry has no retries left
+        """
+        with self._lock:
+            attempt = self._attempts.get(entry, 0) + 1
+            if attempt > self._retry_count:
+                self._attempts.pop(entry, None)
+                return None
+            self._attempts[entry] = attempt
+            delay_s = self._decay_s * 2 ** (attempt - 1)
+            delay_s = delay_s / 2 + random.uniform(0, delay_s / 2)
+            heapq.heappush(self._heap, (datetime.utcnow().timestamp() + delay_s, next(self._order), entry))
+            return delay_s
+
+    def interleave(self, entries):
+        """
+        :param entries: iterable of str entries from the DataSource
+        :return: generator of entries, with the entries that are due for a retry ahead of the next of the entries
+        """
+        for entry in entries:
+            yield from self._take_due()
+            yield entry
+        yield from self._take_due()
+
+    def wait(self):
+        """Sleep until the earliest retry is due.
+
+        :return: True if there are entries waiting for a retry, False otherwise
+        """
+        with self._lock:
+            if len(self._heap) == 0:
+                return False
+            delay_s = self._heap[0][0] - datetime.utcnow().timestamp()
+        if delay_s > 0:
+            sleep(delay_s)
+        return True
+
+    def _take_due(self):
+        while True:
+            with self._lock:
+                if len(self._heap) == 0 or self._heap[0][0] > datetime.utcnow().timestamp():
+                    return
+                entry = heapq.heappop(self._heap)[2]
+            yield entry
+
 
 class TodoRunner:
     """
@@ -131,15 +358,88 @@ class TodoRunner:
         self._todo_list = []
         self._observable = observable
         self._reporter = reporter
+        # when config.parallelism > 1, each worker thread has its own
+        # OrganizeExecutes and MetadataReader instances
+        self._worker_state = threading.local()
+        # entries with the same observation ID share a working directory and
+        # a CAOM2 record, so they are never processed at the same time. An
+        # observation ID always uses the same lock of the fixed set.
+        self._obs_id_locks = [threading.Lock() for _ in range(OBS_ID_LOCK_STRIPES)]
+        # when config.retry_backoff is set, failed entries wait here for their next attempt
+        self._retries = self._make_retry_queue()
+        self._reporter.defer_retries = self._retries is not None
+        # with config.repo_writers, an entry is finished by a writer thread, once the write of its record is done, and
+        # the failures of those entries are collected here
+        self._written_result = 0
+        self._written_guard = threading.Lock()
         self._logger = logging.getLogger(self.__class__.__name__)
 
     def _build_todo_list(self):
         self._logger.debug(f'Begin _build_todo_list.')
-        self._todo_list = self._data_source.get_work()
-        self._logger.info(f'Processing {self._reporter.all} records.')
+        if self._config.stream_work:
+            # entries are found as they are processed
+            self._todo_list = self._data_source.stream_work()
+            self._logger.info('Processing records as they are found.')
+        else:
+            self._todo_list = self._data_source.get_work()
+            self._logger.info(f'Processing {self._reporter.all} records.')
         self._logger.debug('End _build_todo_list.')
 
+    def _drain(self):
+        """Wait for the queued repository writes, and so for the entries they finish.
+
+        :return: 0 if all the entries finished by the writes succeeded, -1 otherwise
+        """
+        self._organizer.drain()
+        with self._written_guard:
+            result = self._written_result
+            self._written_result = 0
+        return result
+
+    def _finish_entry(self, entry, source_names, current_count, result):
+        """The part of _process_entry that happens once the processing of an entry, including the write of its
+        record, is done.
+
+        :param entry: str an entry from the DataSource
+        :param source_names: list of str source names of the entry
+        :param current_count: int current retry count
+        :param result: int 0 if the entry succeeded, -1 otherwise
+        :return: int 0 if the entry, and the clean up of the entry, succeeded, -1 otherwise
+        """
+        try:
+            self._data_source.clean_up(entry, result, current_count)
+        except Exception as e:
+            self._logger.info(f'Cleanup failed for {entry} with {e}')
+            self._logger.debug(traceback.format_exc())
+            result = -1
+        if self._retries is not None:
+            self._retry_later(entry, source_names, result)
+        self._record_completion(entry, result)
+        return result
+
+    def _when_written(self, result, finish):
+        """
+        :param result: int 0 or -1, or a Future for the result of a queued repository write
+        :param finish: callable(result) that finishes the entry, and returns its final result
+        :return: int the result of the entry. An entry with a queued write is finished by the writer thread, once the
+            write is done, and its failure is returned by _drain.
+        """
+        if isinstance(result, Future):
+            result.add_done_callback(lambda future: self._capture_written(finish(future.result())))
+            return 0
+        return finish(result)
+
+    def _capture_written(self, result):
+        with self._written_guard:
+            self._written_result |= result
+
     def _finish_run(self):
+        # the queued repository writes report their successes and failures
+        self._organizer.drain()
+        self._logger.debug(
+            f'MetadataReader hits:: {self._metadata_reader.hits} misses:: {self._metadata_reader.misses} '
+            f'evictions:: {self._metadata_reader.evictions}'
+        )
         mc.create_dir(self._config.log_file_directory)
         self._observable.rejected.persist_state()
         self._observable.metrics.capture()
@@ -148,13 +448,47 @@ class TodoRunner:
         self._logger.info(msg)
         self._logger.info('-' * len(msg))
 
-    def _process_entry(self, entry, current_count):
+    def _make_retry_queue(self):
+        if self._config.retry_failures and self._config.retry_backoff:
+            return _RetryQueue(self._config.retry_count, self._config.retry_decay)
+        return None
+
+    def _lock_obs_id(self, obs_id):
+        """
+        :param obs_id: str observation ID of the entry being processed
+        :return: a context manager that serializes the processing of entries with the same observation ID, when
+            entries are processed by more than one worker thread
+        """
+        if self._config.parallelism > 1:
+            return self._obs_id_lock(obs_id)
+        return nullcontext()
+
+    def _obs_id_lock(self, obs_id):
+        """
+        :param obs_id: str observation ID
+        :return: threading.Lock shared by the obs_id, and by the other observation IDs with the same hash stripe
+        """
+        return self._obs_id_locks[hash(obs_id) % OBS_ID_LOCK_STRIPES]
+
+    def _process_entry(self, entry, current_count, organizer=None, storage_name=None):
+        """
+        :param entry: str an entry from the DataSource
+        :param current_count: int current retry count
+        :param organizer: OrganizeExecutes instance, if not the instance
+            provided at construction
+        :param storage_name: StorageName instance for the entry, if it has
+            already been built
+        """
         self._logger.debug(f'Begin _process_entry for {entry}.')
-        storage_name = None
+        organizer = self._organizer if organizer is None else organizer
+        if self._retries is not None:
+            current_count = self._retries.attempt(entry)
         try:
-            storage_name = self._builder.build(entry)
+            if storage_name is None:
+                storage_name = self._builder.build(entry)
             if storage_name.is_valid():
-                result = self._organizer.do_one(storage_name)
+                with self._lock_obs_id(storage_name.obs_id):
+                    result = organizer.do_one(storage_name)
             else:
                 self._logger.error(
                     f'{storage_name.obs_id} failed naming validation check.'
@@ -182,30 +516,405 @@ class TodoRunner:
             # keep processing the rest of the entries, so don't throw
             # this or any other exception at this point
             result = -1
+        result = self._when_written(
+            result, partial(self._finish_entry, entry, storage_name.source_names, current_count)
+        )
+        self._logger.debug(f'End _process_entry.')
+        return result
+
+    def _record_completion(self, entry, result):
+        """Called once the processing of an entry is complete, whether it succeeded or not.
+
+        :param entry: str an entry from the DataSource
+        :param result: int 0 if the entry succeeded, -1 otherwise
+        """
+        pass
+
+    def _retry_later(self, entry, source_names, result):
+        """Put an entry that failed in a way that can be retried back on the retry queue. When the entry has no
+        retries left, it goes in the retries file, as it would at the end of the retries from that file.
+
+        :param entry: str an entry from the DataSource
+        :param source_names: list of str source names of the entry
+        :param result: int the result of the processing of the entry
+        """
+        retryable = result == -1 and self._reporter.take_deferred_retry(source_names)
+        delay_s = self._retries.put(entry) if retryable else None
+        if delay_s is None:
+            if retryable:
+                self._reporter.capture_deferred_retry(source_names)
+            self._retries.done(entry)
+        else:
+            self._reporter.capture_retry(1)
+            self._logger.warning(f'Retry {entry} at {delay_s:.2f} seconds from now.')
+
+    def _process_entry_in_worker(self, entry, current_count, reset_reader):
+        """Process an entry in a worker thread, with that thread's
+        OrganizeExecutes and MetadataReader instances.
+
+        :param entry: str an entry from the DataSource
+        :param current_count: int current retry count
+        :param reset_reader: bool True if the thread's MetadataReader content
+            is discarded after the entry is processed
+        """
+        if not hasattr(self._worker_state, 'organizer'):
+            metadata_reader = copy(self._metadata_reader)
+            metadata_reader.reset()
+            self._worker_state.metadata_reader = metadata_reader
+            self._worker_state.organizer = self._organizer.replicate(metadata_reader)
+        result = self._process_item(entry, current_count, self._worker_state.organizer)
+        if reset_reader:
+            self._worker_state.metadata_reader.reset()
+        return result
+
+    def _process_entries_in_pool(self, entries, current_count, reset_reader):
+        """Spread entries across a pool of config.parallelism worker threads. The number of entries waiting for a
+        worker is bounded, so that the entries are consumed from the iterable as the workers become available.
+
+        :param entries: iterable of str entries from the DataSource
+        :param current_count: int current retry count
+        :param reset_reader: bool True if a worker's MetadataReader content is
+            discarded after each entry is processed
+        :return: 0 if all entries are processed successfully, -1 otherwise
+        """
+        if self._uses_stages():
+            return self._process_entries_in_stages(entries, current_count)
+        self._logger.debug(f'Begin _process_entries_in_pool with {self._config.parallelism} workers.')
+        result = 0
+        self._worker_state = threading.local()
+        with ThreadPoolExecutor(max_workers=self._config.parallelism, thread_name_prefix='caom2pipe') as pool:
+            pending = set()
+            for entry in entries:
+                if len(pending) >= 2 * self._config.parallelism:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result |= future.result()
+                pending.add(pool.submit(self._process_entry_in_worker, entry, current_count, reset_reader))
+            for future in wait(pending).done:
+                result |= future.result()
+        self._logger.debug('End _process_entries_in_pool.')
+        return result
+
+    def _begin_staged_entry(self, item):
+        """The part of _process_entry that happens before the first pipeline stage.
+
+        :param item: _StagedEntry
+        :return: None if the entry goes on to the first stage, -1 otherwise
+        """
+        if self._retries is not None:
+            item.attempt = self._retries.attempt(item.entry)
         try:
-            self._data_source.clean_up(entry, result, current_count)
+            item.storage_name = self._builder.build(item.entry)
         except Exception as e:
-            self._logger.info(f'Cleanup failed for {entry} with {e}')
             self._logger.debug(traceback.format_exc())
-            result = -1
-        self._logger.debug(f'End _process_entry.')
+            self._logger.warning(
+                f'StorageName construction failed. Using a default instance for {item.entry}, for logging only.'
+            )
+            self._reporter.capture_failure(
+                mc.StorageName(obs_id=item.entry, source_names=[item.entry]), e, traceback.format_exc()
+            )
+            return -1
+        if not item.storage_name.is_valid():
+            self._logger.error(f'{item.storage_name.obs_id} failed naming validation check.')
+            self._reporter.capture_failure(
+                item.storage_name, BaseException('Invalid name format'), 'Invalid name format.'
+            )
+            return -1
+        # entries with the same observation ID are never in the pipeline at the same time. The lock is released by
+        # whichever stage finishes the entry.
+        item.lock = self._obs_id_lock(item.storage_name.obs_id)
+        item.lock.acquire()
+        item.start_s = datetime.utcnow().timestamp()
+        return None
+
+    def _process_stage(self, index, item, organizer, metadata_reader):
+        """
+        :param index: int the pipeline stage
+        :param item: _StagedEntry
+        :param organizer: OrganizeExecutes instance for the exclusive use of the stage worker
+        :param metadata_reader: MetadataReader instance used by organizer
+        :return: None if the entry goes on to the next stage, otherwise 0 for success and -1 for failure
+        """
+        if index == 0:
+            result = self._begin_staged_entry(item)
+            if result is not None:
+                return result
+        # the metadata retrieved by the previous stages goes along with the entry
+        metadata_reader.reset()
+        metadata_reader.pin(item.storage_name)
+        metadata_reader.headers.update(item.headers)
+        metadata_reader.file_info.update(item.file_info)
+        result = organizer.do_stage(index, item.storage_name, item.start_s, item.record)
+        for uri in item.storage_name.destination_uris:
+            if uri in metadata_reader.headers:
+                item.headers[uri] = metadata_reader.headers.get(uri)
+            if uri in metadata_reader.file_info:
+                item.file_info[uri] = metadata_reader.file_info.get(uri)
+        return result
+
+    def _finish_staged_entry(self, item, result, current_count):
+        if item.lock is not None:
+            item.lock.release()
+        source_names = [item.entry] if item.storage_name is None else item.storage_name.source_names
+        return self._when_written(
+            result, partial(self._finish_entry, item.entry, source_names, max(current_count, item.attempt))
+        )
+
+    def _process_entries_in_stages(self, entries, current_count):
+        """Run each chosen task type as a pipeline stage, with config.stage_workers worker threads. Stages are
+        connected by bounded queues, so that a slow stage holds back the stages, and the consumption of entries, before
+        it.
+
+        :param entries: iterable of str entries from the DataSource
+        :param current_count: int current retry count
+        :return: 0 if all entries are processed successfully, -1 otherwise
+        """
+        stages = [
+            (task_type.value, self._config.stage_workers.get(task_type.value, 1))
+            for task_type in self._config.task_types
+        ]
+        self._logger.debug(f'Begin _process_entries_in_stages with {stages}.')
+        queues = [Queue(maxsize=2 * workers) for _, workers in stages]
+        busy_s = [0.0] * len(stages)
+        busy_guard = threading.Lock()
+        results = []
+
+        def _run_stage(index):
+            metadata_reader = copy(self._metadata_reader)
+            organizer = self._organizer.replicate(metadata_reader)
+            while True:
+                item = queues[index].get()
+                if item is None:
+                    break
+                start_s = datetime.utcnow().timestamp()
+                try:
+                    result = self._process_stage(index, item, organizer, metadata_reader)
+                except Exception as e:
+                    self._logger.warning(f'Stage {stages[index][0]} failed for {item.entry} with {e}')
+                    self._logger.debug(traceback.format_exc())
+                    result = -1
+                with busy_guard:
+                    busy_s[index] += datetime.utcnow().timestamp() - start_s
+                if result is None:
+                    queues[index + 1].put(item)
+                else:
+                    results.append(self._finish_staged_entry(item, result, current_count))
+
+        begin_s = datetime.utcnow().timestamp()
+        workers = []
+        for index, (name, count) in enumerate(stages):
+            workers.append(
+                [
+                    threading.Thread(target=_run_stage, args=(index,), name=f'caom2pipe-{name}-{ii}')
+                    for ii in range(count)
+                ]
+            )
+            for worker in workers[index]:
+                worker.start()
+        for entry in entries:
+            queues[0].put(_StagedEntry(entry))
+        # stop the stages in order, so that every entry passes through all the stages it needs to
+        for index, (name, count) in enumerate(stages):
+            for _ in range(count):
+                queues[index].put(None)
+            for worker in workers[index]:
+                worker.join()
+            elapsed_s = datetime.utcnow().timestamp() - begin_s
+            self._reporter.capture_stage(name, count, busy_s[index], elapsed_s)
+            self._logger.info(
+                f'Stage {name} was busy {busy_s[index]:.2f} s of {count * elapsed_s:.2f} s available to {count} '
+                f'workers.'
+            )
+        result = 0
+        for entry_result in results:
+            result |= entry_result
+        self._logger.debug('End _process_entries_in_stages.')
         return result
 
+    def _in_batches(self, entries, entry_name=lambda entry: entry):
+        """Give the MetadataReader the chance to retrieve the metadata for BATCH_WINDOW entries at once, before they
+        are processed one at a time. The next window is retrieved once the entries of the current window have been
+        handed out, and the MetadataReader discards the batch content of an entry once the entry uses it.
+
+        :param entries: iterable of entries from the DataSource
+        :param entry_name: function that returns the str entry for the StorageNameBuilder from an entry
+        :return: generator of the entries
+        """
+        entries = iter(entries)
+        while True:
+            window = list(islice(entries, BATCH_WINDOW))
+            if len(window) == 0:
+                break
+            self._set_batch(entry_name(entry) for entry in window)
+            yield from window
+
+    def _set_batch(self, entries):
+        """StorageName construction failures and naming validation failures are reported when the entry is
+        processed, so skip them here.
+
+        :param entries: iterable of str entries from the DataSource
+        """
+        storage_names = []
+        for entry in entries:
+            try:
+                storage_name = self._builder.build(entry)
+            except Exception as e:
+                self._logger.debug(f'StorageName construction failed for {entry} with {e}')
+                continue
+            if storage_name.is_valid():
+                storage_names.append(storage_name)
+        if len(storage_names) > 0:
+            try:
+                self._metadata_reader.set_batch(storage_names)
+            except Exception as e:
+                # the entries retrieve their own metadata
+                self._logger.warning(f'Batch metadata retrieval failed with {e}')
+                self._logger.debug(traceback.format_exc())
+
     def _run_todo_list(self, current_count):
         """
         :param current_count: int - current retry count - needs to be passed
             to _process_entry.
         """
         self._logger.debug('Begin _run_todo_list.')
-        result = 0
-        while len(self._todo_list) > 0:
-            entry = self._todo_list.popleft()
-            result |= self._process_entry(entry, current_count)
-            self._metadata_reader.reset()
+        if isinstance(self._todo_list, deque):
+            entries = (self._todo_list.popleft() for _ in range(len(self._todo_list)))
+        else:
+            entries = self._todo_list
+        if isinstance(self._todo_list, (deque, list)):
+            # the whole list is known, as opposed to streamed, so the metadata can be retrieved ahead of the entries
+            entries = self._in_batches(entries)
+        if self._retries is None:
+            result = self._process_entries(entries, current_count)
+            result |= self._drain()
+        else:
+            # entries that fail are retried as they come due, between the entries from the DataSource, and then
+            # until there are none left waiting. The entries finished by queued writes are on the retry queue once
+            # the writes are drained.
+            result = self._process_entries(self._retries.interleave(entries), current_count)
+            result |= self._drain()
+            while self._retries.wait():
+                result |= self._process_entries(self._retries.interleave([]), current_count)
+                result |= self._drain()
+        self._metadata_reader.reset_batch()
         self._finish_run()
         self._logger.debug('End _run_todo_list.')
         return result
 
+    def _process_entries(self, entries, current_count, reset_reader=True):
+        """
+        :param entries: iterable of str entries
+        :param current_count: int current retry count
+        :param reset_reader: bool True if the MetadataReader content is discarded after each entry is processed
+        :return: 0 if all entries are processed successfully, -1 otherwise
+        """
+        result = 0
+        if self._config.group_by_obs_id and not self._uses_stages():
+            entries = self._group_entries(entries)
+        if self._uses_pool():
+            result |= self._process_entries_in_pool(entries, current_count, reset_reader=reset_reader)
+        elif self._config.prefetch_depth > 0 and not self._config.group_by_obs_id:
+            with _Prefetcher(
+                self._config.prefetch_depth, self._builder, self._metadata_reader, self._organizer
+            ) as prefetcher:
+                for entry, prefetched in prefetcher.lookahead(entries):
+                    if prefetched.storage_name is not None:
+                        self._metadata_reader.pin(prefetched.storage_name)
+                    self._metadata_reader.headers.update(prefetched.headers)
+                    self._metadata_reader.file_info.update(prefetched.file_info)
+                    if prefetched.retrieved:
+                        self._organizer.use_prefetched(prefetched.storage_name.obs_id, prefetched.observation)
+                    result |= self._process_entry(entry, current_count, storage_name=prefetched.storage_name)
+                    if reset_reader:
+                        self._metadata_reader.reset()
+        else:
+            for entry in entries:
+                result |= self._process_item(entry, current_count)
+                if reset_reader:
+                    self._metadata_reader.reset()
+        return result
+
+    def _group_entries(self, entries):
+        """Gather the entries that share an observation ID. All the entries are consumed before the first group is
+        returned.
+
+        :param entries: iterable of str entries
+        :return: generator of str entries, for entries with an observation ID of their own, or that fail StorageName
+            construction, and of _EntryGroup instances, in the order of the first entry of each observation ID
+        """
+        groups = {}
+        for entry in entries:
+            try:
+                storage_name = self._builder.build(entry)
+            except Exception as e:
+                # _process_entry reports the failure
+                self._logger.debug(f'StorageName construction failed for {entry} with {e}')
+                storage_name = None
+            if storage_name is None or not storage_name.is_valid():
+                # keep the entry in its own group, whatever its observation ID
+                groups[('entry', len(groups))] = _EntryGroup([entry], [storage_name])
+            else:
+                group = groups.setdefault(storage_name.obs_id, _EntryGroup([], []))
+                group.entries.append(entry)
+                group.storage_names.append(storage_name)
+        self._logger.info(f'Grouped the entries into {len(groups)} observations.')
+        for group in groups.values():
+            if len(group.entries) == 1:
+                yield group.entries[0]
+            else:
+                yield group
+
+    def _process_item(self, item, current_count, organizer=None):
+        """
+        :param item: str entry, or _EntryGroup
+        :param current_count: int current retry count
+        :param organizer: OrganizeExecutes instance, if not the instance provided at construction
+        """
+        if isinstance(item, _EntryGroup):
+            return self._process_group(item, current_count, organizer)
+        return self._process_entry(item, current_count, organizer)
+
+    def _process_group(self, group, current_count, organizer=None):
+        """The equivalent of _process_entry, for entries that share an observation ID.
+
+        :param group: _EntryGroup
+        :param current_count: int current retry count
+        :param organizer: OrganizeExecutes instance, if not the instance provided at construction
+        """
+        obs_id = group.storage_names[0].obs_id
+        self._logger.debug(f'Begin _process_group for {len(group.entries)} entries of {obs_id}.')
+        organizer = self._organizer if organizer is None else organizer
+        try:
+            with self._lock_obs_id(obs_id):
+                results = organizer.do_group(group.storage_names)
+        except Exception as e:
+            self._logger.info(f'Execution failed for {obs_id} with {e}')
+            self._logger.debug(traceback.format_exc())
+            for storage_name in group.storage_names:
+                self._reporter.capture_failure(storage_name, e, traceback.format_exc())
+            results = [-1] * len(group.entries)
+        result = 0
+        for entry, storage_name, entry_result in zip(group.entries, group.storage_names, results):
+            entry_count = current_count if self._retries is None else self._retries.attempt(entry)
+            result |= self._when_written(
+                entry_result, partial(self._finish_entry, entry, storage_name.source_names, entry_count)
+            )
+        self._logger.debug('End _process_group.')
+        return result
+
+    def _uses_pool(self):
+        """
+        :return: True if the entries are processed by _process_entries_in_pool, False if they are processed one at a
+            time
+        """
+        return self._config.parallelism > 1 or self._uses_stages()
+
+    def _uses_stages(self):
+        """
+        :return: True if the task types run as pipeline stages
+        """
+        return len(self._config.stage_workers) > 0 and len(self._config.task_types) > 0
+
     def _reset_for_retry(self, count):
         self._config.update_for_retry(count)
         # the log location changes for each retry
@@ -224,30 +933,40 @@ class TodoRunner:
     def run(self):
         self._logger.debug('Begin run.')
         self._build_todo_list()
-        # have the choose call here, so that retries don't change the set of tasks to be executed
-        self._organizer.choose()
-        result = self._run_todo_list(current_count=0)
+        try:
+            # have the choose call here, so that retries don't change the set of tasks to be executed
+            self._organizer.choose()
+            result = self._run_todo_list(current_count=0)
+        finally:
+            # the repository writer threads are daemon threads, so the queued writes are lost if they are not
+            # finished here
+            self._organizer.shut_down()
         self._logger.debug('End run.')
         return result
 
     def run_retry(self):
         self._logger.debug('Begin retry run.')
         result = 0
-        if self._config.need_to_retry():
-            for count in range(0, self._config.retry_count):
-                self._logger.warning(
-                    f'Beginning retry {count + 1} in {os.getcwd()}'
-                )
-                self._reset_for_retry(count)
-                # make another file list
-                self._build_todo_list()
-                self._reporter.capture_retry()
-                decay_interval = self._config.retry_decay * (count + 1) * 60
-                self._logger.warning(f'Retry {self._reporter.all} entries at {decay_interval} seconds from now.')
-                sleep(decay_interval)
-                result |= self._run_todo_list(current_count=count + 1)
-                if not self._config.need_to_retry():
-                    break
+        if self._retries is not None:
+            self._logger.info('Failures were retried during the run.')
+        elif self._config.need_to_retry():
+            try:
+                for count in range(0, self._config.retry_count):
+                    self._logger.warning(
+                        f'Beginning retry {count + 1} in {os.getcwd()}'
+                    )
+                    self._reset_for_retry(count)
+                    # make another file list
+                    self._build_todo_list()
+                    self._reporter.capture_retry()
+                    decay_interval = self._config.retry_decay * (count + 1) * 60
+                    self._logger.warning(f'Retry {self._reporter.all} entries at {decay_interval} seconds from now.')
+                    sleep(decay_interval)
+                    result |= self._run_todo_list(current_count=count + 1)
+                    if not self._config.need_to_retry():
+                        break
+            finally:
+                self._organizer.shut_down()
             self._logger.warning(f'Done retry attempts with result {result}.')
         else:
             self._logger.info('No failures to be retried.')
@@ -280,13 +999,71 @@ class StateRunner(TodoRunner):
         self._bookmark_name = bookmark_name
         # end time is a datetime
         self._end_time = (datetime.now(self._data_source.timezone) if max_dt is None else max_dt)
+        # the length of a time-box, in minutes, which changes when config.interval_batch_size is set
+        self._interval = config.interval
+        # when config.checkpoint_entries is set, the completed entries of a time-box are recorded here
+        self._journal = None
+        # entry name: entry datetime, for the entries of the time-box being processed
+        self._entry_dts = {}
+
+    def _make_retry_queue(self):
+        # the bookmark moves past each time-box as it is processed, so failures are retried from the retries file
+        return None
+
+    def _record_completion(self, entry, result):
+        # retries are not from a time-box, so they are not recorded. Failures are not recorded, so that they are
+        # processed again after a restart.
+        if result == 0 and self._journal is not None and entry in self._entry_dts:
+            self._journal.record(entry, self._entry_dts.get(entry))
+
+    def _skip_completed(self, entries):
+        """
+        :param entries: deque or list of StateRunnerMeta instances for a time-box
+        :return: the entries that have not been completed before a restart, in the same kind of collection
+        """
+        if self._journal is None:
+            return entries
+        self._entry_dts = {entry.entry_name: entry.entry_dt for entry in entries}
+        if len(self._journal) == 0:
+            return entries
+        result = type(entries)(
+            entry for entry in entries if not self._journal.is_completed(entry.entry_name, entry.entry_dt)
+        )
+        if len(result) != len(entries):
+            self._logger.info(f'Skipping {len(entries) - len(result)} entries completed before a restart.')
+        return result
+
+    def _adapt_interval(self, count):
+        """Grow the interval when time-boxes have fewer entries than config.interval_batch_size, and shrink it when
+        they have more. The interval stays between config.min_interval and config.max_interval.
+
+        :param count: int number of entries in the most recent time-box
+        """
+        target = self._config.interval_batch_size
+        if target is None:
+            return
+        if count > target:
+            # shrink in proportion to how much bigger the time-box was than the target
+            interval = max(self._interval * target // count, self._config.min_interval)
+        elif count < target // 2:
+            interval = min(self._interval * 2, self._config.max_interval)
+        else:
+            interval = self._interval
+        if interval != self._interval:
+            self._logger.info(f'Change interval from {self._interval} to {interval} minutes after {count} entries.')
+            self._interval = interval
 
     def _record_progress(
-        self, count, cumulative_count, start_time, save_time
+        self, count, cumulative_count, start_time, save_time, interval=None
     ):
+        """
+        :param interval: int length of the time-box, in minutes
+        """
+        interval = self._interval if interval is None else interval
         with open(self._config.progress_fqn, 'a') as progress:
             progress.write(
-                f'{datetime.now()} current:: {save_time} {count} since:: {start_time}:: {cumulative_count}\n'
+                f'{datetime.now()} current:: {save_time} {count} since:: {start_time}:: {cumulative_count} '
+                f'interval:: {interval}\n'
             )
 
     def run(self):
@@ -300,6 +1077,8 @@ class StateRunner(TodoRunner):
             os.makedirs(os.path.dirname(self._config.progress_fqn))
 
         state = mc.State(self._config.state_fqn, self._data_source.timezone)
+        if self._config.checkpoint_entries:
+            self._journal = mc.ProgressJournal(self._config.journal_fqn, self._bookmark_name)
         if self._data_source.start_dt is None:
             start_time = state.get_bookmark(self._bookmark_name)
         else:
@@ -307,62 +1086,93 @@ class StateRunner(TodoRunner):
 
         # make sure prev_exec_time is offset-aware type datetime.timestamp
         prev_exec_time = start_time
-        incremented = mc.increment_time_tz(prev_exec_time, self._config.interval, self._data_source.timezone)
+        incremented = mc.increment_time_tz(prev_exec_time, self._interval, self._data_source.timezone)
         exec_time = min(incremented, self.end_time)
 
         self._logger.info(f'Starting at {start_time}, ending at {self.end_time}')
-        result = 0
-        if prev_exec_time == self.end_time:
-            self._logger.info(f'Start time is the same as end time {start_time}, stopping.')
-            exec_time = prev_exec_time
-        else:
-            cumulative = 0
+        try:
             result = 0
-            self._organizer.choose()
-            while exec_time <= self.end_time:
-                self._logger.info(f'Processing from {prev_exec_time} to {exec_time}')
-                save_time = exec_time
-                self._organizer.success_count = 0
-                self._reporter.set_log_location(self._config)
-                entries = self._data_source.get_time_box_work(prev_exec_time, exec_time)
-                num_entries = len(entries)
-
-                if num_entries > 0:
-                    self._logger.info(f'Processing {self._reporter.all} entries.')
-                    pop_action = entries.pop
-                    if isinstance(entries, deque):
-                        pop_action = entries.popleft
-                    while len(entries) > 0:
-                        entry = pop_action()
-                        result |= self._process_entry(entry.entry_name, 0)
-                        save_time = min(entry.entry_dt, exec_time)
-                    # this reset call is outside the while process_entry loop
-                    # for GEMINI which gets all the metadata for an interval in
-                    # a single call, and it wouldn't be polite to throw away
-                    # all the metadata that will be just need to be retrieved
-                    # again for each record
-                    self._metadata_reader.reset()
-                    self._finish_run()
+            if prev_exec_time == self.end_time:
+                self._logger.info(f'Start time is the same as end time {start_time}, stopping.')
+                exec_time = prev_exec_time
+            else:
+                cumulative = 0
+                result = 0
+                self._organizer.choose()
+                # list the next time-box in the background while the current time-box is processed, if the DataSource
+                # supports it
+                listing = nullcontext()
+                listing_source = None
+                if self._data_source.prefetch_time_box_work:
+                    listing = ThreadPoolExecutor(max_workers=1, thread_name_prefix='caom2pipe-listing')
+                    # the listing thread has its own DataSource, with its own client
+                    listing_source = self._data_source.prefetch_copy()
+                with listing as listing_pool:
+                    get_entries = self._list_time_box(listing_pool, listing_source, prev_exec_time, exec_time)
+                    while exec_time <= self.end_time:
+                        self._logger.info(f'Processing from {prev_exec_time} to {exec_time}')
+                        save_time = exec_time
+                        self._organizer.success_count = 0
+                        self._reporter.set_log_location(self._config)
+                        entries = self._skip_completed(get_entries())
+                        num_entries = len(entries)
+                        interval = self._interval
+                        self._adapt_interval(num_entries)
+                        new_time = mc.increment_time_tz(exec_time, self._interval, self._data_source.timezone)
+                        next_exec_time = min(new_time, self.end_time)
+                        if exec_time != self.end_time:
+                            get_entries = self._list_time_box(listing_pool, listing_source, exec_time, next_exec_time)
 
-                self._record_progress(
-                    num_entries, cumulative, start_time, save_time
-                )
-                state.save_state(self._bookmark_name, save_time)
-
-                if exec_time == self.end_time:
-                    # the last interval will always have the exec time
-                    # equal to the end time, which will fail the while check
-                    # so leave after the last interval has been processed
-                    #
-                    # but the while <= check is required so that an interval
-                    # smaller than exec_time -> end_time will get executed,
-                    # so don't get rid of the '=' in the while loop
-                    # comparison, just because this one exists
-                    break
-                prev_exec_time = exec_time
-                new_time = mc.increment_time_tz(prev_exec_time, self._config.interval, self._data_source.timezone)
-                exec_time = min(new_time, self.end_time)
+                        if num_entries > 0:
+                            self._logger.info(f'Processing {self._reporter.all} entries.')
+                            pop_action = entries.pop
+                            if isinstance(entries, deque):
+                                pop_action = entries.popleft
+                            if self._uses_pool() or self._config.group_by_obs_id or self._config.prefetch_depth > 0:
+                                # the bookmark only moves once the whole time-box has been processed, so it's the latest
+                                # entry time that matters, not the order of completion
+                                save_time = min(max(entry.entry_dt for entry in entries), exec_time)
+                                names = self._in_batches(pop_action().entry_name for _ in range(num_entries))
+                                result |= self._process_entries(names, 0, reset_reader=False)
+                            else:
+                                for entry in self._in_batches(
+                                    (pop_action() for _ in range(num_entries)), lambda entry: entry.entry_name
+                                ):
+                                    result |= self._process_entry(entry.entry_name, 0)
+                                    save_time = min(entry.entry_dt, exec_time)
+                            # the time-box is not done until its queued writes are done
+                            result |= self._drain()
+                            # this reset call is outside the while process_entry loop
+                            # for GEMINI which gets all the metadata for an interval in
+                            # a single call, and it wouldn't be polite to throw away
+                            # all the metadata that will be just need to be retrieved
+                            # again for each record
+                            self._metadata_reader.reset()
+                            self._metadata_reader.reset_batch()
+                            self._finish_run()
+
+                        self._record_progress(num_entries, cumulative, start_time, save_time, interval)
+                        state.save_state(self._bookmark_name, save_time)
+                        if self._journal is not None:
+                            self._journal.compact(save_time)
+                            self._entry_dts = {}
 
+                        if exec_time == self.end_time:
+                            # the last interval will always have the exec time
+                            # equal to the end time, which will fail the while check
+                            # so leave after the last interval has been processed
+                            #
+                            # but the while <= check is required so that an interval
+                            # smaller than exec_time -> end_time will get executed,
+                            # so don't get rid of the '=' in the while loop
+                            # comparison, just because this one exists
+                            break
+                        prev_exec_time = exec_time
+                        exec_time = next_exec_time
+        finally:
+            # the repository writer threads are daemon threads, so the queued writes are lost if they are not
+            # finished here
+            self._organizer.shut_down()
         state.save_state(self._bookmark_name, exec_time)
         msg = f'Done for {self._bookmark_name}, saved state is {exec_time}'
         self._logger.info('=' * len(msg))
@@ -371,6 +1181,28 @@ class StateRunner(TodoRunner):
         self._logger.info('=' * len(msg))
         return result
 
+    def _list_time_box(self, listing_pool, listing_source, prev_exec_time, exec_time):
+        """
+        :param listing_pool: ThreadPoolExecutor for listing time-boxes in the background, or None, if the time-box is
+            listed when its entries are required
+        :param listing_source: DataSource.prefetch_copy used by the listing_pool, or None
+        :param prev_exec_time: tz-aware datetime start of the time-box
+        :param exec_time: tz-aware datetime end of the time-box
+        :return: a callable that returns the entries of the time-box
+        """
+        if listing_pool is None:
+            return lambda: self._data_source.get_time_box_work(prev_exec_time, exec_time)
+        self._logger.debug(f'Prefetch the time-box from {prev_exec_time} to {exec_time}')
+        listing = listing_pool.submit(listing_source.get_time_box_work, prev_exec_time, exec_time)
+
+        def _get_entries():
+            entries = listing.result()
+            # the time-box is counted once it is being processed, not when it is listed
+            listing_source.capture_deferred_todo()
+            return entries
+
+        return _get_entries
+
     @property
     def end_time(self):
         return self._end_time
@@ -400,6 +1232,221 @@ def get_now_tz(zone):
     return datetime.now(tz=zone)
 
 
+# the per-process state of an ActorPool worker, set by _init_actor
+_actor = {}
+
+
+class _ActorReporter(mc.ExecutionReporter):
+    """An ExecutionReporter for an ActorPool worker process. It appends to the progress files started by the process
+    that owns the ActorPool, instead of starting new ones."""
+
+    def set_log_location(self, config):
+        self._set_log_files(config)
+
+
+def _get_meta_producer(application):
+    """
+    :param application: str representation of application name, for retrieving version
+    :return: str Artifact.metaProducer value the application sets, or None if it is not known
+    """
+    return None if application == 'DEFAULT' else mc.get_version(application)
+
+
+def _init_actor(config, meta_visitors, data_visitors, chooser, name_builder, storage_name_attributes, application):
+    """Initialize an ActorPool worker process. The clients, MetadataReader and OrganizeExecutes instances live as long
+    as the worker process, so they are only set up once.
+
+    :param config: mc.Config instance
+    :param meta_visitors: list of metadata visitors, with modules represented by their names
+    :param data_visitors: list of data visitors, with modules represented by their names
+    :param chooser: OrganizeChooser instance, or None
+    :param name_builder: StorageNameBuilder instance, or None
+    :param storage_name_attributes: dict of the mc.StorageName class attributes set by the application
+    :param application: str representation of application name, for retrieving version
+    """
+    for key, value in storage_name_attributes.items():
+        setattr(mc.StorageName, key, value)
+    logging.getLogger().setLevel(config.logging_level)
+    # the result of an entry goes back to the ActorPool when do_one returns, so the repository writes happen before
+    # then, and the actors are the parallel writers
+    config.repo_writers = 0
+    observable = mc.Observable(mc.Rejected(config.rejected_fqn), mc.Metrics(config))
+    reporter = _ActorReporter(config, observable, application)
+    clients = cc.ClientCollection(config)
+    clients.metrics = observable.metrics
+    metadata_reader = reader_composable.reader_factory(config, clients)
+    organizer = ec.OrganizeExecutes(
+        config,
+        [importlib.import_module(visitor) if isinstance(visitor, str) else visitor for visitor in meta_visitors],
+        [importlib.import_module(visitor) if isinstance(visitor, str) else visitor for visitor in data_visitors],
+        chooser,
+        transfer_composable.store_transfer_factory(config, clients),
+        transfer_composable.modify_transfer_factory(config, clients),
+        metadata_reader,
+        clients,
+        observable,
+        reporter,
+        _get_meta_producer(application),
+    )
+    organizer.choose()
+    _actor['builder'] = name_builder_composable.builder_factory(config) if name_builder is None else name_builder
+    _actor['metadata_reader'] = metadata_reader
+    _actor['observable'] = observable
+    _actor['organizer'] = organizer
+    _actor['reporter'] = reporter
+
+
+def _do_one_in_actor(entry):
+    """Process an entry in an ActorPool worker process.
+
+    :param entry: str an entry from the DataSource
+    :return: the entry, the result of the processing, and a dict of the Rejected entries recorded by the processing
+    """
+    rejected = _actor['observable'].rejected
+    before = {reason: len(entries) for reason, entries in rejected.content.items()}
+    storage_name = None
+    try:
+        storage_name = _actor['builder'].build(entry)
+        if storage_name.is_valid():
+            result = _actor['organizer'].do_one(storage_name)
+        else:
+            _actor['reporter'].capture_failure(
+                storage_name, BaseException('Invalid name format'), 'Invalid name format.'
+            )
+            result = -1
+    except Exception as e:
+        if storage_name is None:
+            storage_name = mc.StorageName(obs_id=entry, source_names=[entry])
+        _actor['reporter'].capture_failure(storage_name, e, traceback.format_exc())
+        logging.debug(traceback.format_exc())
+        result = -1
+    _actor['metadata_reader'].reset()
+    recorded = {reason: entries[before.get(reason, 0):] for reason, entries in rejected.content.items()}
+    return entry, result, recorded
+
+
+class ActorPool:
+    """Process entries in a pool of long-lived worker processes. Each worker process, or actor, has its own clients,
+    MetadataReader, and OrganizeExecutes instances, so the clients stay warm from one entry to the next, and CPU-bound
+    work scales across cores.
+
+    The successes and failures are appended to the progress files of the config, and the counts are merged here.
+    Rejected entries recorded by the workers are merged into the observable. Each entry is cleaned up by the
+    data_source in this process, as its result arrives, as it would be by a TodoRunner.
+    """
+
+    def __init__(
+        self,
+        config,
+        actors=None,
+        meta_visitors=None,
+        data_visitors=None,
+        chooser=None,
+        name_builder=None,
+        observable=None,
+        application='DEFAULT',
+        data_source=None,
+    ):
+        """
+        :param config: mc.Config instance
+        :param actors: int number of worker processes, the default is the number of CPUs
+        :param meta_visitors: list of metadata visit methods, which must be modules, or picklable
+        :param data_visitors: list of data visit methods, which must be modules, or picklable
+        :param chooser: OrganizeChooser instance, which must be picklable
+        :param name_builder: StorageNameBuilder instance, which must be picklable
+        :param observable: mc.Observable instance that receives the Rejected entries recorded by the workers
+        :param application: str representation of application name, for retrieving version
+        :param data_source: DataSource instance the entries come from, which cleans up each entry once its result
+            arrives
+        """
+        self._config = config
+        self._actors = os.cpu_count() if actors is None else actors
+        # modules are not picklable, so send the module name, and import the module in the worker process
+        self._meta_visitors = [
+            visitor.__name__ if isinstance(visitor, ModuleType) else visitor for visitor in (meta_visitors or [])
+        ]
+        self._data_visitors = [
+            visitor.__name__ if isinstance(visitor, ModuleType) else visitor for visitor in (data_visitors or [])
+        ]
+        self._chooser = chooser
+        self._name_builder = name_builder
+        self._observable = observable
+        self._application = application
+        self._data_source = data_source
+        self._pool = None
+        self._success = 0
+        self._failure = 0
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.shut_down()
+
+    @property
+    def failure(self):
+        return self._failure
+
+    @property
+    def success(self):
+        return self._success
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._logger.debug(f'Start {self._actors} actor processes.')
+            storage_name_attributes = {
+                'collection': mc.StorageName.collection,
+                'collection_pattern': mc.StorageName.collection_pattern,
+                'preview_scheme': mc.StorageName.preview_scheme,
+                'scheme': mc.StorageName.scheme,
+            }
+            self._pool = multiprocessing.Pool(
+                processes=self._actors,
+                initializer=_init_actor,
+                initargs=(
+                    self._config,
+                    self._meta_visitors,
+                    self._data_visitors,
+                    self._chooser,
+                    self._name_builder,
+                    storage_name_attributes,
+                    self._application,
+                ),
+            )
+        return self._pool
+
+    def map_unordered(self, entries):
+        """
+        :param entries: iterable of str entries from a DataSource
+        :return: generator of (entry, result) tuples, in the order of completion
+        """
+        for entry, result, recorded in self._get_pool().imap_unordered(_do_one_in_actor, entries):
+            if self._data_source is not None:
+                try:
+                    self._data_source.clean_up(entry, result, 0)
+                except Exception as e:
+                    self._logger.info(f'Cleanup failed for {entry} with {e}')
+                    self._logger.debug(traceback.format_exc())
+                    result = -1
+            if result == 0:
+                self._success += 1
+            else:
+                self._failure += 1
+            if self._observable is not None:
+                for reason, rejected_entries in recorded.items():
+                    for rejected_entry in rejected_entries:
+                        self._observable.rejected.record(reason, rejected_entry)
+            yield entry, result
+
+    def shut_down(self):
+        if self._pool is not None:
+            self._logger.debug('Stop the actor processes.')
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
 def common_runner_init(
     config,
     clients,
@@ -483,6 +1530,7 @@ def common_runner_init(
         clients,
         observable,
         reporter,
+        _get_meta_producer(application),
     )
 
     return (
@@ -509,6 +1557,7 @@ def run_by_todo(
     clients=None,
     metadata_reader=None,
     application='DEFAULT',
+    parallelism=None,
 ):
     """A default implementation for using the TodoRunner.
 
@@ -534,6 +1583,7 @@ def run_by_todo(
     :param clients: ClientCollection instance
     :param metadata_reader: MetadataReader instance
     :param application str Name for finding the version
+    :param parallelism int how many entries to process at the same time. Over-rides the config.yml value.
     """
     (
         config,
@@ -559,6 +1609,9 @@ def run_by_todo(
         application,
     )
 
+    if parallelism is not None:
+        config.parallelism = parallelism
+
     runner = TodoRunner(
         config, organizer, name_builder, source, metadata_reader, observable, reporter
     )
@@ -582,6 +1635,7 @@ def run_by_state(
     clients=None,
     metadata_reader=None,
     application='DEFAULT',
+    parallelism=None,
 ):
     """A default implementation for using the StateRunner.
 
@@ -610,6 +1664,7 @@ def run_by_state(
     :param clients instance of ClientsCollection, if one was required
     :param metadata_reader instance of MetadataReader
     :param application str Name for finding the version
+    :param parallelism int how many entries to process at the same time. Over-rides the config.yml value.
     """
     (
         config,
@@ -637,6 +1692,8 @@ def run_by_state(
 
     if end_time is None:
         end_time = get_now_tz(source.timezone)
+    if parallelism is not None:
+        config.parallelism = parallelism
 
     runner = StateRunner(
         config,
@@ -708,9 +1765,16 @@ def run_single(
         clients,
         observable,
         reporter,
+        _get_meta_producer(application),
     )
     organizer.complete_record_count = 1
     organizer.choose()
-    result = organizer.do_one(storage_name)
+    try:
+        result = organizer.do_one(storage_name)
+    finally:
+        organizer.shut_down()
+    if isinstance(result, Future):
+        # the queued write is done once the writer threads are shut down
+        result = result.result()
     logging.debug(f'run_single result is {result}')
     return result
@@ -75,7 +75,10 @@ import test_conf as tc
 from astropy.io import fits
 from astropy.io.votable import parse_single_table
 
+from caom2utils import data_util
 from caom2pipe import astro_composable as ac
+from caom2pipe import caom_composable as cc
+from caom2pipe import manage_composable as mc
 
 
 def test_convert_time():
@@ -274,3 +277,49 @@ def test_check_fitsverify():
     for fqn, expected_result in files.items():
         test_result = ac.check_fits(fqn)
         assert test_result == expected_result, f'wrong astropy verify result {fqn}'
+
+
+def test_compact_header():
+    cards = [
+        "SIMPLE  =                    T / conforms to FITS standard",
+        "BITPIX  =                    8",
+        "NAXIS   =                    0",
+        "OBJECT  = 'M31     '           / target",
+        "EXPTIME =                 12.5",
+        "UNDEF   =",
+        "COMMENT a comment",
+        "FILTER1 = 'r'",
+        "FILTER2 = 'i'",
+        "--- HDU 1",
+        "XTENSION= 'IMAGE   '",
+        "BITPIX  =                  -32",
+        "NAXIS   =                    0",
+        "CONTINUE  'so long'",
+        "EXTNAME = 'SCI     '",
+    ]
+    test_text = '\n'.join(cards)
+    expected = data_util.make_headers_from_string(test_text)
+    test_result = ac.make_compact_headers(test_text)
+    assert len(test_result) == 2, 'wrong HDU count'
+    for actual, expected_header in zip(test_result, expected):
+        assert isinstance(actual, fits.Header), 'wrong type'
+        assert actual.tostring() == expected_header.tostring(), 'wrong cards'
+
+    test_subject = ac.make_compact_headers(test_text)[0]
+    with patch('astropy.io.fits.Header.fromstring') as parse_mock:
+        assert test_subject.get('OBJECT') == 'M31', 'wrong str value'
+        assert test_subject['EXPTIME'] == 12.5, 'wrong float value'
+        assert test_subject.get('UNDEF') is None, 'wrong undefined value'
+        assert test_subject.get('object') == 'M31', 'keywords are case-insensitive'
+        assert test_subject.get('NOPE', 'default') == 'default', 'wrong default'
+        assert 'FILTER1' in test_subject and 'NOPE' not in test_subject, 'wrong contains'
+        assert len(test_subject) == 9, 'wrong length'
+        assert mc.get_keyword([test_subject], 'EXPTIME') == 12.5, 'wrong get_keyword'
+        assert cc.find_keywords_in_headers([test_subject], ['FILTER']) == ['r', 'i'], 'wrong find'
+        assert not parse_mock.called, 'keyword lookups should not parse the cards'
+
+    # anything else parses the cards, and lookups continue to work
+    test_subject['OBJECT'] = 'M33'
+    assert test_subject.get('OBJECT') == 'M33', 'wrong value after change'
+    assert test_subject.comments['EXPTIME'] == '', 'wrong comment'
+    assert len(test_subject) == 9, 'wrong length after change'
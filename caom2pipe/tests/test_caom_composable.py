@@ -69,9 +69,12 @@
 import os
 import pytest
 import shutil
+import threading
 
 no_footprintfinder = False
+from astropy.io import fits
 from astropy.table import Table
+from cadcdata import FileInfo
 from caom2 import ValueCoord2D
 from caom2pipe import caom_composable as cc
 from caom2pipe import manage_composable as mc
@@ -213,3 +216,99 @@ def test_build_temporal_wcs(query_mock):
     assert test_result.axis is not None, 'expect axis'
     assert test_result.axis.bounds is not None, 'expect bounds'
     assert len(test_result.axis.bounds.samples) == 2, 'expect two samples'
+
+
+def test_fits2caom2_visitor_workers(test_config):
+    # each blueprint waits for the others, so this only completes if the blueprints for the files are
+    # prepared at the same time
+    test_barrier = threading.Barrier(3, timeout=10)
+    test_threads = set()
+    test_updates = []
+
+    class TMapping(cc.TelescopeMapping):
+        def accumulate_blueprint(self, bp, application=None):
+            super().accumulate_blueprint(bp, application)
+            test_barrier.wait()
+            test_threads.add(threading.current_thread().name)
+            bp.set('Plane.dataProductType', 'image')
+            bp.set('Plane.calibrationLevel', '1')
+            bp.set('Artifact.productType', 'science')
+            bp.set('Artifact.releaseType', 'data')
+            bp.configure_time_axis(1)
+
+        def update(self, observation, file_info):
+            test_updates.append(self._headers[0].get('FILENAME'))
+            return super().update(observation, file_info)
+
+    class TVisitor(cc.Fits2caom2Visitor):
+        def _get_mapping(self, headers):
+            return TMapping(self._storage_name, headers, self._clients, self._observable)
+
+    test_reader = Mock(autospec=True)
+    test_reader.workers = 4
+    test_reader.headers = {}
+    test_reader.file_info = {}
+    mc.StorageName.collection = 'TEST'
+    test_storage_name = mc.StorageName(
+        obs_id='obs', file_name='v0.fits', source_names=[f'cadc:TEST/v{ii}.fits' for ii in range(3)]
+    )
+    for uri in test_storage_name.destination_uris:
+        header = fits.PrimaryHDU().header
+        header['FILENAME'] = uri
+        test_reader.headers[uri] = [header]
+        test_reader.file_info[uri] = FileInfo(id=uri, md5sum='md5:abc', size=1, file_type='application/fits')
+    test_subject = TVisitor(None, storage_name=test_storage_name, metadata_reader=test_reader)
+    test_result = test_subject.visit()
+    assert test_result is not None, 'expect an observation'
+    test_artifact_uris = list(test_result.planes['v0'].artifacts.keys())
+    assert test_artifact_uris == test_storage_name.destination_uris, 'wrong artifacts'
+    assert test_updates == test_storage_name.destination_uris, 'updates are in destination_uris order'
+    assert len(test_threads) == 3, 'expect a thread per file'
+    assert all(ii.startswith('caom2pipe-visit') for ii in test_threads), 'wrong threads'
+
+
+def test_fits2caom2_visitor_serial(test_config):
+    # test that, with one worker, each file is prepared after the files before it have updated the Observation
+    test_calls = []
+
+    class TMapping(cc.TelescopeMapping):
+        def accumulate_blueprint(self, bp, application=None):
+            super().accumulate_blueprint(bp, application)
+            test_calls.append(('prepare', self._headers[0].get('FILENAME'), threading.current_thread().name))
+            bp.set('Plane.dataProductType', 'image')
+            bp.set('Plane.calibrationLevel', '1')
+            bp.set('Artifact.productType', 'science')
+            bp.set('Artifact.releaseType', 'data')
+            bp.configure_time_axis(1)
+
+        def update(self, observation, file_info):
+            test_calls.append(('update', self._headers[0].get('FILENAME'), threading.current_thread().name))
+            return super().update(observation, file_info)
+
+    class TVisitor(cc.Fits2caom2Visitor):
+        def _get_mapping(self, headers):
+            return TMapping(self._storage_name, headers, self._clients, self._observable)
+
+    test_reader = Mock(autospec=True)
+    test_reader.workers = 1
+    test_reader.headers = {}
+    test_reader.file_info = {}
+    mc.StorageName.collection = 'TEST'
+    test_storage_name = mc.StorageName(
+        obs_id='obs', file_name='s0.fits', source_names=[f'cadc:TEST/s{ii}.fits' for ii in range(2)]
+    )
+    for uri in test_storage_name.destination_uris:
+        header = fits.PrimaryHDU().header
+        header['FILENAME'] = uri
+        test_reader.headers[uri] = [header]
+        test_reader.file_info[uri] = FileInfo(id=uri, md5sum='md5:abc', size=1, file_type='application/fits')
+    test_subject = TVisitor(None, storage_name=test_storage_name, metadata_reader=test_reader)
+    test_result = test_subject.visit()
+    assert test_result is not None, 'expect an observation'
+    test_thread = threading.current_thread().name
+    assert test_calls == [
+        ('prepare', 'cadc:TEST/s0.fits', test_thread),
+        ('update', 'cadc:TEST/s0.fits', test_thread),
+        ('prepare', 'cadc:TEST/s1.fits', test_thread),
+        ('update', 'cadc:TEST/s1.fits', test_thread),
+    ], 'expect prepare and update interleaved on the calling thread'
@@ -69,8 +69,11 @@
 import os
 import pytest
 
+from astropy.io import fits
 from cadcutils import exceptions
 from cadcdata import FileInfo
+from caom2 import Algorithm, SimpleObservation
+from caom2pipe import astro_composable as ac
 from caom2pipe import client_composable as clc
 from caom2pipe import manage_composable as mc
 
@@ -340,6 +343,48 @@ def test_repo_delete(mock_client):
     assert len(test_metrics.failures) == 1, 'should have failure counts'
 
 
+def test_repo_write_behind(test_config):
+    test_config.task_types = [mc.TaskType.SCRAPE]
+    test_config.repo_writers = 2
+    test_subject = clc.ClientCollection(test_config)
+    repo_client_mock = Mock()
+    test_subject._metadata_client = repo_client_mock
+    test_subject.metrics = Mock()
+
+    def _mock_update(observation):
+        if observation.observation_id == 'bad':
+            raise Exception('update failed')
+
+    repo_client_mock.update.side_effect = _mock_update
+    done = {}
+
+    def _on_done(obs_id):
+        def _record(e, stack_trace):
+            done[obs_id] = e
+        return _record
+
+    for obs_id in ['a', 'bad', 'c']:
+        test_observation = SimpleObservation(collection='TEST', observation_id=obs_id, algorithm=Algorithm('exposure'))
+        action = 'create' if obs_id == 'a' else 'update'
+        test_subject.queue_write(action, test_observation, _on_done(obs_id))
+        # changes after the write is queued are not written
+        test_observation.algorithm = Algorithm('changed')
+    test_observation = SimpleObservation(collection='TEST', observation_id='d', algorithm=Algorithm('exposure'))
+    test_subject.queue_write('delete_create', test_observation, _on_done('d'))
+    test_subject.wait_for_write('d')
+    assert 'd' in done, 'wait for the write of d'
+    test_subject.drain()
+    assert sorted(done.keys()) == ['a', 'bad', 'c', 'd'], 'expect all the writes done'
+    assert done['a'] is None and done['c'] is None and done['d'] is None, 'expect write success'
+    assert isinstance(done['bad'], mc.CadcException), 'expect write failure'
+    assert repo_client_mock.create.call_count == 2, 'wrong create count'
+    assert repo_client_mock.update.call_count == 2, 'wrong update count'
+    repo_client_mock.delete.assert_called_with('TEST', 'd'), 'wrong delete args'
+    assert repo_client_mock.create.call_args_list[0][0][0].algorithm.name == 'exposure', 'serialized when queued'
+    test_subject.shut_down()
+    assert test_subject._write_queue is None, 'expect the writers to stop'
+
+
 @patch('cadcdata.storageinv.StorageInventoryClient')
 @patch('caom2pipe.manage_composable.Metrics')
 def test_si_client_get(mock_metrics, mock_client):
@@ -368,3 +413,31 @@ def test_si_client_get(mock_metrics, mock_client):
     assert args[3] == 'cadcget', 'wrong endpoint'
     assert args[4] == 'si', 'wrong service'
     assert args[5] == 'TEST.fits', 'wrong id'
+
+
+@patch('caom2utils.data_util.StorageInventoryClient')
+def test_compact_storage_client_get_head(si_client_mock):
+    test_text = (
+        "SIMPLE  =                    T\nBITPIX  =                   16\nEND\n"
+        "XTENSION= 'IMAGE   '\nEXTNAME = 'SCI'\nEND\n"
+    )
+
+    def _mock_cadcget(uri, dest, fhead=False):
+        assert fhead, 'expect the header request'
+        dest.write(test_text.encode('ascii'))
+
+    si_client_mock.return_value.cadcget.side_effect = _mock_cadcget
+    test_metrics = Mock()
+    test_subject = clc.CompactStorageClientWrapper(subject=None, metrics=test_metrics)
+    with patch('caom2utils.data_util.make_headers_from_string') as make_headers_mock, \
+            patch.object(ac.CompactHeader, '_parse', autospec=True, side_effect=ac.CompactHeader._parse) as parse_mock:
+        test_result = test_subject.get_head('cadc:TEST/test_file.fits')
+        assert not make_headers_mock.called, 'no astropy parse of the header text'
+        assert len(test_result) == 2, 'wrong number of headers'
+        assert all(isinstance(header, ac.CompactHeader) for header in test_result), 'wrong header type'
+        assert test_result[0].get('BITPIX') == 16, 'wrong BITPIX'
+        assert test_result[1].get('EXTNAME') == 'SCI', 'wrong EXTNAME'
+        assert not parse_mock.called, 'keyword lookups do not parse the header'
+        assert len(test_result[1].cards) == 2, 'wrong cards'
+        assert parse_mock.call_count == 1, 'the cards are parsed once they are used'
+    assert test_metrics.observe.called, 'expect the retrieval metrics'
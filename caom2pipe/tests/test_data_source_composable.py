@@ -70,6 +70,7 @@ import os
 import pytest
 import shutil
 
+from astropy.io import fits
 from astropy.table import Table
 from cadctap import CadcTapClient
 from cadcutils import exceptions
@@ -140,6 +141,116 @@ def test_todo_file(test_config, tmpdir):
     assert test_reporter.all == 2, 'wrong report'
 
 
+def test_todo_file_stream(test_config, tmpdir):
+    todo_fqn = os.path.join(tmpdir, 'todo.txt')
+    with open(todo_fqn, 'w') as f:
+        f.write('file1\n')
+        f.write('\n')
+        f.write('file2\n')
+        f.write('file3\n')
+
+    test_config.work_fqn = todo_fqn
+    test_reporter = mc.ExecutionReporter(test_config, observable=Mock(autospec=True), application='DEFAULT')
+    test_subject = dsc.TodoFileDataSource(test_config)
+    test_subject.reporter = test_reporter
+    test_result = test_subject.stream_work()
+    assert test_reporter.all == 0, 'nothing found before the first entry is requested'
+    assert next(test_result) == 'file1', 'wrong first entry'
+    assert test_reporter.all == 1, 'wrong first report'
+    assert list(test_result) == ['file2', 'file3'], 'wrong remaining entries'
+    assert test_reporter.all == 3, 'wrong final report'
+
+
+@patch('caom2pipe.data_source_composable.LocalFilesDataSource._verify_file')
+def test_local_files_stream(verify_mock, test_config, tmp_path):
+    verify_mock.return_value = True
+    # clean_up moves files out of the directory being listed, so all the entries are found before the first one is
+    # processed
+    for ii in range(3):
+        fits.HDUList([fits.PrimaryHDU()]).writeto(f'{tmp_path}/stream{ii}.fits')
+    test_config.data_sources = [tmp_path.as_posix()]
+    test_config.data_source_extensions = ['.fits']
+    test_config.task_types = [mc.TaskType.STORE]
+    test_config.cleanup_files_when_storing = False
+    test_reporter = mc.ExecutionReporter(test_config, observable=Mock(autospec=True), application='DEFAULT')
+    test_subject = dsc.LocalFilesDataSource(test_config, Mock(autospec=True), rdc.FileMetadataReader())
+    test_subject.reporter = test_reporter
+    test_result = test_subject.stream_work()
+    test_first = next(test_result)
+    assert test_reporter.all == 3, 'all entries found before the first entry is processed'
+    os.unlink(test_first)
+    assert sorted([test_first] + list(test_result)) == [
+        f'{tmp_path}/stream{ii}.fits' for ii in range(3)
+    ], 'wrong entries'
+
+
+def test_queue(test_config, tmpdir):
+    todo_fqn = os.path.join(tmpdir, 'todo.txt')
+    with open(todo_fqn, 'w') as f:
+        f.write('file1\n')
+        f.write('\n')
+        f.write('file2\n')
+        f.write('file3\n')
+
+    test_config.work_fqn = todo_fqn
+    test_config.queue_fqn = os.path.join(tmpdir, 'queue.db')
+    test_config.queue_lease = 60
+    test_config.retry_failures = False
+    test_reporter = mc.ExecutionReporter(test_config, observable=Mock(autospec=True), application='DEFAULT')
+    # two instances working through the same backlog
+    test_subject = dsc.QueueDataSource(test_config)
+    test_subject.reporter = test_reporter
+    test_other = dsc.QueueDataSource(test_config)
+    test_other.reporter = test_reporter
+    test_other._owner = 'other:1'
+
+    test_result = test_subject.get_work()
+    assert next(test_result) == 'file1', 'wrong first entry'
+    # the other instance also loads the work file, without adding the entries again
+    test_other_result = test_other.get_work()
+    assert next(test_other_result) == 'file2', 'leased entries are not shared'
+    test_subject.clean_up('file1', 0, 0)
+    test_other.clean_up('file2', -1, 0)
+    assert list(test_result) == ['file3'], 'wrong remaining entries'
+    assert list(test_other_result) == [], 'expect no entries left'
+    assert test_reporter.all == 3, 'wrong report'
+
+    # an instance that stopped without acknowledging its lease
+    with patch('caom2pipe.data_source_composable.datetime') as dt_mock:
+        dt_mock.utcnow.return_value = datetime.utcnow() + timedelta(seconds=120)
+        assert test_other.lease() == 'file3', 'expired leases go back to the queue'
+        assert test_subject.lease() is None, 'expect no entries left'
+    # a failure only applies to the instance that holds the lease, a success applies whoever holds the lease
+    test_subject.clean_up('file3', -1, 0)
+    assert test_subject._connection.execute(
+        'SELECT owner, status FROM work WHERE entry = ?', ('file3',)
+    ).fetchone() == ('other:1', dsc.QueueDataSource.LEASED), 'lease lost'
+    test_subject.clean_up('file3', 0, 0)
+    test_other.clean_up('file3', 0, 0)
+
+    # an entry whose lease keeps expiring is eventually marked as failed
+    test_subject.add_work(['file5'])
+    with patch('caom2pipe.data_source_composable.datetime') as dt_mock:
+        for ii in range(1, dsc.QueueDataSource.MAX_ATTEMPTS + 1):
+            dt_mock.utcnow.return_value = datetime.utcnow() + timedelta(seconds=120 * ii)
+            assert test_subject.lease() == 'file5', 'expired lease should be leased again'
+        dt_mock.utcnow.return_value = datetime.utcnow() + timedelta(seconds=120 * (ii + 1))
+        assert test_subject.lease() is None, 'too many attempts'
+
+    test_subject.add_work(['file1', 'file4'])
+    assert list(test_subject.get_work()) == ['file4'], 'acknowledged entries stay acknowledged'
+    content = dict(
+        test_subject._connection.execute('SELECT entry, status FROM work').fetchall()
+    )
+    assert content == {
+        'file1': dsc.QueueDataSource.DONE,
+        'file2': dsc.QueueDataSource.FAILED,
+        'file3': dsc.QueueDataSource.DONE,
+        'file4': dsc.QueueDataSource.LEASED,
+        'file5': dsc.QueueDataSource.FAILED,
+    }, 'wrong queue content'
+
+
 @patch('caom2pipe.client_composable.query_tap_client')
 def test_storage_time_box_query(query_mock, test_config, tmpdir):
     def _mock_query(arg1, arg2):
@@ -338,6 +449,30 @@ def test_vault_list_dir_time_box_data_source(test_config):
     )
 
 
+def test_vault_prefetch_copy(test_config):
+    # test that a prefetch_copy lists with its own client, and holds its reporter counts until they are captured
+    test_vos_client = Mock(vospace_certfile='/tmp/cadcproxy.pem', vospace_token=None)
+    test_config.data_sources = ['vos:goliaths/wrong']
+    test_config.data_source_extensions = ['.fits']
+    test_reporter = mc.ExecutionReporter(test_config, observable=Mock(autospec=True), application='DEFAULT')
+    test_subject = dsc.VaultDataSource(test_vos_client, test_config)
+    test_subject.reporter = test_reporter
+    test_copy = test_subject.prefetch_copy()
+    assert test_copy._vault_client is not test_vos_client, 'expect a client for the listing thread'
+    assert test_copy._vault_client.vospace_certfile == '/tmp/cadcproxy.pem', 'wrong credentials'
+    test_copy._vault_client.get_node.side_effect = _create_vault_listing()
+    test_prev_exec_dt = datetime(year=2020, month=9, day=15, hour=10, minute=0, second=0, tzinfo=timezone.utc)
+    test_exec_dt = datetime(year=2020, month=9, day=16, hour=10, minute=0, second=0, tzinfo=timezone.utc)
+    test_result = test_copy.get_time_box_work(test_prev_exec_dt, test_exec_dt)
+    assert len(test_result) == 1, 'wrong number of results'
+    assert not test_vos_client.get_node.called, 'the original client is not used'
+    assert test_reporter.all == 0, 'counts held until the time-box is processed'
+    test_copy.capture_deferred_todo()
+    assert test_reporter.all == 1, 'wrong report'
+    test_copy.capture_deferred_todo()
+    assert test_reporter.all == 1, 'counts captured once'
+
+
 def test_transfer_check_fits_verify(test_config, tmpdir):
     # how things should probably work at CFHT
     delta = timedelta(minutes=30)
@@ -74,11 +74,12 @@ import sys
 from unittest.mock import Mock, patch, ANY
 
 from astropy.io import fits
+from copy import deepcopy
 from hashlib import md5
 from shutil import copy
 
 from cadcdata import FileInfo
-from caom2 import SimpleObservation, Algorithm
+from caom2 import SimpleObservation, Algorithm, Plane, Artifact, ProductType, ReleaseType, ChecksumURI
 
 from caom2pipe.client_composable import ClientCollection
 from caom2pipe import execute_composable as ec
@@ -104,6 +105,8 @@ class TestVisit:
         z = kwargs['log_file_directory']
         assert z is not None, 'log file directory'
         assert observation is not None, 'undefined observation'
+        # a change, so that the observation is written back
+        observation.meta_producer = 'test_visit/1.0'
         return observation
 
 
@@ -124,6 +127,28 @@ class LocalTestVisit:
         assert z is not None, 'log file directory'
         assert z == tc.TEST_DATA_DIR, 'wrong log dir'
         assert observation is not None, 'undefined observation'
+        # a change, so that the observation is written back
+        observation.meta_producer = 'test_visit/1.0'
+        return observation
+
+
+class ChangeTestVisit:
+    @staticmethod
+    def visit(observation, **kwargs):
+        assert observation is not None, 'undefined observation'
+        observation.meta_producer = 'change_visit/1.0'
+        return observation
+
+
+class ProcessTestVisit:
+    @staticmethod
+    def visit(observation, **kwargs):
+        assert kwargs['metadata_reader'] is not None, 'metadata reader'
+        assert (
+            kwargs['metadata_reader'].file_info.get('cadc:TEST/test_file.fits').md5sum == 'md5:abc'
+        ), 'metadata reader content'
+        observation.type = f'{os.getpid()}'
+        kwargs['observable'].rejected.record(mc.Rejected.BAD_DATA, 'test_file.fits')
         return observation
 
 
@@ -167,6 +192,7 @@ def test_client_visit(access_mock, test_config):
 
     with patch('caom2pipe.manage_composable.write_obs_to_file') as write_mock:
         mc.StorageName.collection = 'TEST'
+        repo_client_mock.read.side_effect = tc.mock_read
         test_executor = ec.MetaVisit(
             test_config,
             meta_visitors=None,
@@ -179,6 +205,16 @@ def test_client_visit(access_mock, test_config):
         repo_client_mock.read.assert_called_with(
             'TEST', 'test_obs_id'
         ), 'read call missed'
+        assert not repo_client_mock.update.called, 'no update for an unchanged observation'
+
+        test_executor = ec.MetaVisit(
+            test_config,
+            meta_visitors=[ChangeTestVisit],
+            observable=test_observer,
+            metadata_reader=metadata_reader_mock,
+            clients=clients,
+        )
+        test_executor.execute({'storage_name': tc.TStorageName()})
         assert repo_client_mock.update.called, 'update call missed'
         assert test_observer.metrics.observe.called, 'observe not called'
         assert write_mock.called, 'write mock not called'
@@ -321,6 +357,50 @@ def test_data_local_execute(access_mock, test_config):
     assert os.path.exists(test_model_fqn), 'observation not written to disk'
 
 
+@patch('cadcutils.net.ws.WsCapabilities.get_access_url')
+def test_data_local_process_execute(access_mock, test_config, tmpdir):
+    access_mock.return_value = 'https://localhost:2022'
+    mc.StorageName.collection = 'TEST'
+    test_config.change_working_directory(tmpdir)
+    test_config.task_types = [mc.TaskType.MODIFY]
+    test_config.use_local_files = True
+    test_config.modify_processes = 1
+    os.mkdir(os.path.join(tmpdir, 'test_obs_id'))
+
+    repo_client_mock = Mock()
+    repo_client_mock.read.return_value = _read_obs(None)
+    clients = ClientCollection(test_config)
+    clients._data_client = Mock()
+    clients._metadata_client = repo_client_mock
+    test_observable = mc.Observable(mc.Rejected(test_config.rejected_fqn), Mock())
+    test_reader = FileMetadataReader()
+    test_reader._file_info['cadc:TEST/test_file.fits'] = FileInfo(id='cadc:TEST/test_file.fits', md5sum='md5:abc')
+    test_oe = ec.OrganizeExecutes(
+        test_config,
+        [],
+        [ProcessTestVisit],
+        metadata_reader=test_reader,
+        clients=clients,
+        observable=test_observable,
+    )
+    test_oe.choose()
+    assert len(test_oe._executors) == 1, 'wrong executor count'
+    test_executor = test_oe._executors[0]
+    assert isinstance(test_executor, ec.LocalProcessDataVisit), 'wrong executor'
+    assert test_oe.replicate(test_reader)._data_visitor_pool is test_oe._data_visitor_pool, 'pool not shared'
+    try:
+        test_executor.execute({'storage_name': tc.TStorageName(
+            source_names=[f'{tc.TEST_DATA_DIR}/test_file.fits.gz'],
+        )})
+    finally:
+        test_oe.shut_down()
+
+    assert repo_client_mock.update.called, 'update call missed'
+    observation = repo_client_mock.update.call_args.args[0]
+    assert observation.type != f'{os.getpid()}', 'not visited in a worker process'
+    assert test_observable.rejected.get_bad_data() == ['test_file.fits'], 'rejected entry not returned'
+
+
 @patch('cadcutils.net.ws.WsCapabilities.get_access_url')
 @patch('caom2pipe.execute_composable.FitsForCADCDecompressor.fix_compression')
 def test_data_store(fix_mock, access_mock, test_config, tmpdir):
@@ -463,6 +543,223 @@ def test_organize_executes_client_visit(test_config):
     clients_mock.return_value.metadata_client.read.assert_not_called(), 'mock should not be called?'
 
 
+class GroupTestVisit:
+    """Add a Plane for each file, except for bad.fits, which fails part way through."""
+
+    @staticmethod
+    def visit(observation, **kwargs):
+        storage_name = kwargs.get('storage_name')
+        if observation is None:
+            observation = SimpleObservation(
+                collection='TEST', observation_id=storage_name.obs_id, algorithm=Algorithm('exposure')
+            )
+        observation.planes.add(Plane(product_id=storage_name.file_id))
+        if storage_name.file_name == 'bad.fits':
+            raise mc.CadcException('bad visit')
+        return observation
+
+
+def test_organize_executes_group(test_config, tmpdir):
+    mc.StorageName.collection = 'TEST'
+    test_config.change_working_directory(tmpdir)
+    test_config.task_types = [mc.TaskType.VISIT]
+    test_config.log_to_file = False
+    clients_mock = Mock()
+    clients_mock.metadata_client.read.return_value = None
+    test_observable = mc.Observable(mc.Rejected(test_config.rejected_fqn), Mock())
+    test_reporter = mc.ExecutionReporter(test_config, test_observable, 'DEFAULT')
+    test_oe = ec.OrganizeExecutes(
+        test_config,
+        [GroupTestVisit],
+        [],
+        metadata_reader=Mock(),
+        clients=clients_mock,
+        observable=test_observable,
+        reporter=test_reporter,
+    )
+    test_oe.choose()
+    test_storage_names = [
+        mc.StorageName(obs_id='grp', file_name=f_name, source_names=[f_name])
+        for f_name in ['a.fits', 'bad.fits', 'b.fits']
+    ]
+    test_result = test_oe.do_group(test_storage_names)
+    assert test_result == [0, -1, 0], 'wrong results'
+    assert clients_mock.metadata_client.read.call_count == 1, 'one read for the group'
+    assert clients_mock.metadata_client.create.call_count == 1, 'one write for the group'
+    assert not clients_mock.metadata_client.update.called, 'the observation is new'
+    test_observation = clients_mock.metadata_client.create.call_args[0][0]
+    assert sorted(test_observation.planes.keys()) == ['a', 'b'], 'the failed entry should leave no trace'
+    assert test_reporter.success == 2, 'wrong success count'
+    with open(test_config.retry_fqn) as f:
+        assert f.read().split() == ['bad.fits'], 'wrong retries'
+
+    # a failed write fails all the entries
+    clients_mock.metadata_client.read.return_value = test_observation
+    clients_mock.metadata_client.update.side_effect = mc.CadcException('update failed')
+    test_result = test_oe.do_group(test_storage_names[:1] + test_storage_names[2:])
+    assert test_result == [-1, -1], 'wrong results after write failure'
+    assert clients_mock.metadata_client.update.call_count == 1, 'one update attempt for the group'
+
+
+def test_organize_executes_stage_unchanged(test_config, tmpdir):
+    # without an ObservationRecord, the executor skips the write itself, and the skip is still counted
+    mc.StorageName.collection = 'TEST'
+    test_config.change_working_directory(tmpdir)
+    test_config.task_types = [mc.TaskType.VISIT]
+    test_config.log_to_file = False
+    clients_mock = Mock()
+    clients_mock.metadata_client.read.return_value = SimpleObservation(
+        collection='TEST', observation_id='stage', algorithm=Algorithm('exposure')
+    )
+    test_observable = mc.Observable(mc.Rejected(test_config.rejected_fqn), Mock())
+    test_reporter = mc.ExecutionReporter(test_config, test_observable, 'DEFAULT')
+    test_oe = ec.OrganizeExecutes(
+        test_config,
+        [],
+        [],
+        metadata_reader=Mock(),
+        clients=clients_mock,
+        observable=test_observable,
+        reporter=test_reporter,
+    )
+    test_oe.choose()
+    test_storage_name = mc.StorageName(obs_id='stage', file_name='stage.fits', source_names=['stage.fits'])
+    test_result = test_oe.do_stage(0, test_storage_name, 0.0, record=None)
+    assert test_result == 0, 'expect success'
+    assert not clients_mock.metadata_client.update.called, 'unchanged observations are not written'
+    assert test_reporter._summary._unchanged_sum == 1, 'wrong unchanged count'
+
+
+def test_observation_record_snapshot():
+    test_subject = ec.ObservationRecord()
+    test_subject.observation = SimpleObservation(
+        collection='TEST', observation_id='snap', algorithm=Algorithm('exposure')
+    )
+    test_subject.retrieved = True
+    with patch('caom2pipe.execute_composable.deepcopy', side_effect=deepcopy) as deepcopy_mock:
+        test_snapshot = test_subject.snapshot()
+        test_subject.store_needed = True
+        test_subject.restore(test_snapshot)
+        assert not deepcopy_mock.called, 'no copy if the Observation is not checked out'
+        assert not test_subject.store_needed, 'wrong restored state'
+
+        test_snapshot = test_subject.snapshot()
+        test_subject.checkout().planes.add(Plane(product_id='changed'))
+        test_subject.checkout()
+        assert deepcopy_mock.call_count == 1, 'one copy per snapshot'
+        test_subject.restore(test_snapshot)
+        assert len(test_subject.observation.planes) == 0, 'changes should be undone'
+
+
+@pytest.mark.parametrize('test_chooser', [None, tc.TChooser()])
+def test_organize_executes_one_read_one_write(test_chooser, test_config, tmpdir):
+    mc.StorageName.collection = 'TEST'
+    test_config.change_working_directory(tmpdir)
+    test_config.task_types = [mc.TaskType.INGEST, mc.TaskType.MODIFY]
+    test_config.use_local_files = True
+    test_config.modify_processes = 0
+    test_config.log_to_file = False
+    clients_mock = Mock()
+    clients_mock.metadata_client.read.return_value = None
+    test_observable = mc.Observable(mc.Rejected(test_config.rejected_fqn), Mock())
+    test_oe = ec.OrganizeExecutes(
+        test_config,
+        [GroupTestVisit],
+        [ChangeTestVisit],
+        chooser=test_chooser,
+        metadata_reader=Mock(),
+        clients=clients_mock,
+        observable=test_observable,
+        reporter=mc.ExecutionReporter(test_config, test_observable, 'DEFAULT'),
+    )
+    test_oe.choose()
+    test_storage_name = mc.StorageName(obs_id='one', file_name='one.fits', source_names=['one.fits'])
+    assert test_oe.do_one(test_storage_name) == 0, 'expect success'
+    assert clients_mock.metadata_client.read.call_count == 1, 'one read for the executor chain'
+    assert clients_mock.metadata_client.create.call_count == 1, 'one write for the executor chain'
+    assert not clients_mock.metadata_client.update.called, 'no update for a new observation'
+    assert not clients_mock.metadata_client.delete.called, 'nothing to delete for a new observation'
+    test_observation = clients_mock.metadata_client.create.call_args[0][0]
+    assert test_observation.meta_producer == 'change_visit/1.0', 'expect the data visitor changes'
+
+    # the observation exists
+    clients_mock.reset_mock()
+    clients_mock.metadata_client.read.return_value = test_observation
+    assert test_oe.do_one(test_storage_name) == 0, 'expect success the second time'
+    assert clients_mock.metadata_client.read.call_count == 1, 'one read for the executor chain the second time'
+    if test_chooser is None:
+        assert clients_mock.metadata_client.update.call_count == 1, 'one update'
+        assert not clients_mock.metadata_client.create.called, 'no create'
+    else:
+        assert clients_mock.metadata_client.delete.call_count == 1, 'one delete'
+        assert clients_mock.metadata_client.create.call_count == 1, 'one create'
+        assert not clients_mock.metadata_client.update.called, 'no update'
+
+
+def test_organize_executes_short_circuit(test_config, tmpdir):
+    mc.StorageName.collection = 'TEST'
+    mc.StorageName.scheme = 'cadc'
+    test_config.change_working_directory(tmpdir)
+    test_config.task_types = [mc.TaskType.INGEST]
+    test_config.log_to_file = False
+    test_storage_name = mc.StorageName(obs_id='sc', file_name='sc.fits', source_names=['sc.fits'])
+    test_uri = test_storage_name.destination_uris[0]
+    test_observation = SimpleObservation(collection='TEST', observation_id='sc', algorithm=Algorithm('exposure'))
+    test_plane = Plane(product_id='sc')
+    test_artifact = Artifact(test_uri, ProductType.SCIENCE, ReleaseType.DATA)
+    test_artifact.content_checksum = ChecksumURI('md5:abc')
+    test_artifact.meta_producer = 'test2caom2/1.0'
+    test_plane.artifacts.add(test_artifact)
+    test_observation.planes.add(test_plane)
+    clients_mock = Mock()
+    clients_mock.metadata_client.read.return_value = test_observation
+    metadata_reader_mock = Mock()
+    metadata_reader_mock.file_info = {test_uri: FileInfo(id=test_uri, md5sum='md5:abc')}
+    visitor_mock = Mock()
+    visitor_mock.visit.side_effect = lambda observation, **kwargs: observation
+    test_observable = mc.Observable(mc.Rejected(test_config.rejected_fqn), Mock())
+    test_reporter = mc.ExecutionReporter(test_config, test_observable, 'DEFAULT')
+
+    def _do_one():
+        test_oe = ec.OrganizeExecutes(
+            test_config,
+            [visitor_mock],
+            [],
+            metadata_reader=metadata_reader_mock,
+            clients=clients_mock,
+            observable=test_observable,
+            reporter=test_reporter,
+            meta_producer='test2caom2/1.0',
+        )
+        test_oe.choose()
+        assert test_oe.do_one(test_storage_name) == 0, 'expect success'
+
+    _do_one()
+    assert not visitor_mock.visit.called, 'same checksum, same producer, no visit'
+    assert test_reporter.short_circuits == 1, 'wrong short circuit count'
+    assert test_reporter.success == 1, 'a short circuit is a success'
+    assert not clients_mock.metadata_client.update.called, 'nothing to write'
+
+    # a different checksum
+    metadata_reader_mock.file_info[test_uri] = FileInfo(id=test_uri, md5sum='md5:def')
+    _do_one()
+    assert visitor_mock.visit.call_count == 1, 'different checksum, expect a visit'
+    assert test_reporter.short_circuits == 1, 'no new short circuit'
+
+    # a different producer
+    metadata_reader_mock.file_info[test_uri] = FileInfo(id=test_uri, md5sum='md5:abc')
+    test_artifact.meta_producer = 'test2caom2/0.9'
+    _do_one()
+    assert visitor_mock.visit.call_count == 2, 'different producer, expect a visit'
+    test_artifact.meta_producer = 'test2caom2/1.0'
+
+    # forced
+    test_config.force_reprocess = True
+    _do_one()
+    assert visitor_mock.visit.call_count == 3, 'forced, expect a visit'
+    assert test_reporter.short_circuits == 1, 'wrong short circuit count at the end'
+
+
 def test_storage_name():
     mc.StorageName.collection = 'TEST'
     mc.StorageName.collection_pattern = 'T[\\w+-]+'
@@ -723,6 +1020,20 @@ def test_store(compressor_mock, access_mock, file_info_mock, test_config, tmpdir
     test_data_client.put.assert_called_with(f'{tmpdir}/test_obs_id', 'cadc:TEST/test_file.fits')
 
 
+def test_store_transferrer_per_reader(test_config):
+    # test that the transferrer shared by the replicas of an OrganizeExecutes is not changed, and that each Store
+    # checks with its own MetadataReader
+    test_transferrer = transfer_composable.HttpTransfer()
+    test_readers = [Mock(), Mock()]
+    test_subjects = [
+        ec.Store(test_config, Mock(), test_transferrer, Mock(), metadata_reader=test_reader)
+        for test_reader in test_readers
+    ]
+    assert test_transferrer.metadata_reader is None, 'shared transferrer unchanged'
+    for test_subject, test_reader in zip(test_subjects, test_readers):
+        assert test_subject._transferrer.metadata_reader is test_reader, 'wrong reader for the check'
+
+
 @patch('caom2pipe.execute_composable.get_local_file_info')
 @patch('cadcutils.net.ws.WsCapabilities.get_access_url')
 @patch('caom2pipe.execute_composable.FitsForCADCDecompressor.fix_compression')
@@ -139,6 +139,7 @@ def test_query_endpoint_session():
 def test_config_class(tmp_path):
     config_content = f"""cache_file_name: cache.yml
 cache_fqn: {tmp_path}/cache.yml
+checkpoint_entries: True
 cleanup_files_when_storing: False
 collection: NEOSSAT
 data_source_extensions: ['.fits']
@@ -150,31 +151,51 @@ features:
   supports_catalog: True
   supports_composite: False
   supports_multiple_files: True
+force_reprocess: True
+group_by_obs_id: True
 interval: 10
+interval_batch_size: 1000
 is_connected: True
 log_file_directory: {tmp_path}
 log_to_file: False
 logging_level: DEBUG
+max_interval: 1440
+metadata_budget_bytes: 1048576
+metadata_cache_bytes: 2097152
+metadata_cache_directory: {tmp_path}/metadata_cache
+metadata_workers: 3
+min_interval: 2
+modify_processes: 2
 observe_execution: False
+parallelism: 4
+prefetch_depth: 3
 progress_file_name: progress.txt
 progress_fqn: {tmp_path}/progress.txt
 proxy_file_name: test_proxy.pem
 proxy_fqn: {tmp_path}/test_proxy.pem
+queue_fqn: {tmp_path}/queue.db
+queue_lease: 600
 recurse_data_sources: False
 rejected_directory: {tmp_path}/test_config_dir
 rejected_file_name: rejected.yml
 rejected_fqn: {tmp_path}/test_config_dir/rejected.yml
 report_fqn: {tmp_path}/data_report.txt
+repo_writers: 3
 resource_id: ivo://cadc.nrc.ca/sc2repo
+retry_backoff: True
 retry_count: 1
 retry_failures: False
 retry_file_name: retries.txt
 retry_fqn: {tmp_path}/retries.txt
+stage_workers:
+  visit: 2
+  modify: 4
 state_file_name: state.yml
 state_fqn: {tmp_path}/state.yml
 storage_inventory_resource_id: raven
 store_modified_files_only: False
 stream: raw
+stream_work: True
 success_fqn: {tmp_path}/success_log.txt
 success_log_file_name: success_log.txt
 tap_id: ivo://cadc.nrc.ca/sc2tap
@@ -208,17 +229,37 @@ working_directory: {tmp_path}
         assert test_config.failure_fqn == f'{tmp_path}/failure_log.txt', 'failure fqn'
         assert test_config.failure_log_file_name == 'failure_log.txt', 'failure file'
         assert test_config.retry_file_name == 'retries.txt', 'retry file'
+        assert test_config.retry_backoff is True, 'retry backoff'
         assert test_config.retry_fqn == f'{tmp_path}/retries.txt', 'retry fqn'
         assert test_config.proxy_file_name == 'test_proxy.pem', 'proxy file name'
         assert test_config.proxy_fqn == f'{tmp_path}/test_proxy.pem', 'proxy fqn'
+        assert test_config.queue_fqn == f'{tmp_path}/queue.db', 'queue fqn'
+        assert test_config.queue_lease == 600, 'queue lease'
+        assert test_config.repo_writers == 3, 'repo writers'
+        assert test_config.prefetch_depth == 3, 'prefetch depth'
+        assert test_config.metadata_budget_bytes == 1048576, 'metadata budget'
+        assert test_config.metadata_cache_bytes == 2097152, 'metadata cache bytes'
+        assert test_config.metadata_cache_directory == f'{tmp_path}/metadata_cache', 'metadata cache directory'
+        assert test_config.metadata_workers == 3, 'metadata workers'
+        assert test_config.stage_workers == {'visit': 2, 'modify': 4}, 'stage workers'
         assert test_config.state_file_name == 'state.yml', 'state file name'
         assert test_config.state_fqn == f'{tmp_path}/state.yml', 'state fqn'
+        assert test_config.checkpoint_entries is True, 'checkpoint entries'
+        assert test_config.journal_fqn == f'{tmp_path}/state_journal.txt', 'journal fqn'
         assert test_config.rejected_directory == f'{tmp_path}/test_config_dir', 'wrong rejected dir'
         assert test_config.rejected_file_name == 'rejected.yml', 'wrong rejected file'
         assert test_config.rejected_fqn == f'{tmp_path}/test_config_dir/rejected.yml', 'wrong rejected fqn'
         assert test_config.features.run_in_airflow is True, 'wrong runs in airflow'
         assert test_config.features.supports_catalog is True, 'wrong supports catalog'
         assert test_config.data_source_extensions == ['.fits'], 'extensions'
+        assert test_config.parallelism == 4, 'parallelism'
+        assert test_config.modify_processes == 2, 'modify processes'
+        assert test_config.interval_batch_size == 1000, 'interval batch size'
+        assert test_config.min_interval == 2, 'min interval'
+        assert test_config.max_interval == 1440, 'max interval'
+        assert test_config.stream_work is True, 'stream work'
+        assert test_config.group_by_obs_id is True, 'group by obs id'
+        assert test_config.force_reprocess is True, 'force reprocess'
     finally:
         os.chdir(orig_cwd)
 
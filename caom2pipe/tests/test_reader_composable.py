@@ -67,12 +67,32 @@
 # ***********************************************************************
 #
 
-from mock import Mock
+import glob
+import numpy as np
+import os
+import pytest
+import threading
+
+from astropy.io import fits
+from astropy.table import Table
+from cadcdata import FileInfo
+from datetime import datetime
+from io import BytesIO
+from mock import Mock, patch
 from os.path import basename
+from caom2utils import data_util
+from caom2pipe import astro_composable as ac
 from caom2pipe import manage_composable as mc
 from caom2pipe import reader_composable
 import test_conf as tc
 
+try:
+    import h5py
+
+    no_h5py = False
+except ImportError:
+    no_h5py = True
+
 
 def test_file_reader(test_config):
     test_subject = reader_composable.FileMetadataReader()
@@ -130,3 +150,272 @@ def test_factory(test_config):
     }.items():
         result = reader_composable.reader_factory(test_cfg, Mock())
         assert isinstance(result, expected_type), f'got {result} type instead'
+
+
+@patch('caom2pipe.client_composable.query_tap_client')
+def test_storage_client_reader_batch(query_mock, test_config):
+    test_uri = 'cadc:TEST/batch1.fits'
+    query_mock.return_value = Table(
+        rows=[(test_uri, 123, 'md5:abc', '2023-03-01T00:00:00.000', 'application/fits', None)],
+        names=['uri', 'contentLength', 'contentChecksum', 'contentLastModified', 'contentType', 'contentEncoding'],
+    )
+    client_mock = Mock()
+    client_mock.info.return_value = FileInfo(id='cadc:TEST/batch2.fits', size=456, md5sum='def')
+    client_mock.get_head.return_value = []
+    test_subject = reader_composable.StorageClientReader(client_mock, query_client=Mock())
+    mc.StorageName.collection = 'TEST'
+    test_storage_names = [
+        mc.StorageName(file_name='batch1.fits', source_names=[test_uri]),
+        mc.StorageName(file_name='batch2.fits', source_names=['cadc:TEST/batch2.fits']),
+    ]
+    test_subject.set_batch(test_storage_names)
+    assert query_mock.call_count == 1, 'one query for all the entries'
+    assert "'cadc:TEST/batch1.fits', 'cadc:TEST/batch2.fits'" in query_mock.call_args.args[0], 'wrong query'
+
+    for storage_name in test_storage_names:
+        test_subject.set(storage_name)
+        test_subject.reset()
+    assert client_mock.info.call_count == 1, 'only the entry missing from the batch is retrieved'
+    assert len(test_subject._batch_file_info) == 0, 'batch content discarded once it is used'
+    assert client_mock.info.call_args.args[0] == 'cadc:TEST/batch2.fits', 'wrong info retrieval'
+    assert client_mock.get_head.call_count == 2, 'headers are not part of the batch'
+
+    test_subject.set_batch(test_storage_names)
+    test_subject.set(test_storage_names[0])
+    test_file_info = test_subject.file_info.get(test_uri)
+    assert test_file_info.size == 123, 'wrong size'
+    assert type(test_file_info.size) is int, 'wrong size type'
+    assert test_file_info.lastmod == datetime(2023, 3, 1), 'wrong lastmod'
+    assert test_file_info.md5sum == 'abc', 'wrong md5sum'
+    assert test_file_info.file_type == 'application/fits', 'wrong type'
+
+    test_subject.reset()
+    test_subject.reset_batch()
+    query_mock.side_effect = Exception('query failure')
+    test_subject.set_batch(test_storage_names)
+    test_subject.set(test_storage_names[0])
+    assert client_mock.info.call_count == 2, 'fall back to retrieval by entry'
+
+
+class TBudgetReader(reader_composable.MetadataReader):
+    """Each file has one header of ten cards."""
+
+    def _retrieve_file_info(self, key, source_name):
+        self._file_info[key] = FileInfo(id=key)
+
+    def _retrieve_headers(self, key, source_name):
+        header = fits.Header()
+        for ii in range(10):
+            header[f'KEY{ii}'] = ii
+        self._headers[key] = [header]
+
+
+def test_metadata_reader_budget(test_config):
+    test_subject = TBudgetReader()
+    # room for the headers of two files
+    test_subject.budget_bytes = 2 * 10 * 80
+    mc.StorageName.collection = 'TEST'
+    test_storage_names = [
+        mc.StorageName(file_name=f'budget{ii}.fits', source_names=[f'cadc:TEST/budget{ii}.fits']) for ii in range(3)
+    ]
+    for storage_name in test_storage_names:
+        test_subject.set(storage_name)
+    assert test_subject.misses == 6, 'headers and FileInfo retrieved for each file'
+    assert test_subject.evictions == 1, 'the least-recently-used headers are evicted'
+    assert list(test_subject.headers.keys()) == [
+        'cadc:TEST/budget1.fits', 'cadc:TEST/budget2.fits'
+    ], 'wrong headers kept'
+    assert len(test_subject.file_info) == 3, 'FileInfo fits in the budget'
+
+    test_subject.set(test_storage_names[1])
+    assert test_subject.hits == 2, 'headers and FileInfo are in memory'
+
+    # the headers for the entry being processed are kept, whatever the budget
+    test_subject.budget_bytes = 10 * 80 - 1
+    test_subject.set(test_storage_names[0])
+    assert list(test_subject.headers.keys()) == ['cadc:TEST/budget0.fits'], 'pinned headers evicted'
+    test_subject.set(test_storage_names[1])
+    assert list(test_subject.headers.keys()) == ['cadc:TEST/budget1.fits'], 'unpinned headers kept'
+    assert test_subject.evictions == 2, 'wrong eviction count'
+
+
+def test_metadata_reader_workers(test_config):
+    # each retrieval waits for the others, so this only completes if the files of an entry are retrieved at the
+    # same time
+    test_barrier = threading.Barrier(3, timeout=10)
+    test_threads = set()
+
+    class TWorkersReader(TBudgetReader):
+        def _retrieve_headers(self, key, source_name):
+            test_barrier.wait()
+            test_threads.add(threading.current_thread().name)
+            if 'fail' in key:
+                raise mc.CadcException('retrieval failure')
+            super()._retrieve_headers(key, source_name)
+
+    test_subject = TWorkersReader()
+    test_subject.workers = 4
+    mc.StorageName.collection = 'TEST'
+    test_storage_name = mc.StorageName(
+        file_name='workers0.fits', source_names=[f'cadc:TEST/workers{ii}.fits' for ii in range(3)]
+    )
+    test_subject.set(test_storage_name)
+    assert len(test_subject.headers) == 3, 'wrong headers count'
+    assert len(test_subject.file_info) == 3, 'wrong file_info count'
+    assert len(test_threads) == 3, 'expect a thread per file'
+    assert all(ii.startswith('caom2pipe-metadata') for ii in test_threads), 'wrong threads'
+
+    test_subject.reset()
+    test_storage_name = mc.StorageName(
+        file_name='workers0.fits', source_names=[f'cadc:TEST/{ii}.fits' for ii in ['ok0', 'fail', 'ok1']]
+    )
+    with pytest.raises(mc.CadcException):
+        test_subject.set_headers(test_storage_name)
+
+
+def test_file_reader_scan(test_config, tmp_path):
+    test_fqn = f'{tmp_path}/scan.fits'
+    primary = fits.PrimaryHDU(data=np.arange(100, dtype=np.int16).reshape(10, 10))
+    primary.header['OBJECT'] = 'M31'
+    image = fits.ImageHDU(data=np.zeros((3, 7), dtype=np.float64), name='SCI')
+    table = fits.BinTableHDU.from_columns([fits.Column(name='A', format='J', array=np.arange(5))], name='CAT')
+    fits.HDUList([primary, image, table]).writeto(test_fqn)
+    test_subject = reader_composable.FileMetadataReader()
+    mc.StorageName.collection = 'TEST'
+    test_storage_name = mc.StorageName(file_name='scan.fits', source_names=[test_fqn])
+    with patch('caom2utils.data_util.get_local_headers_from_fits') as astropy_mock:
+        test_subject.set_headers(test_storage_name)
+        assert not astropy_mock.called, 'expect the scan to be used'
+    test_result = test_subject.headers.get('cadc:TEST/scan.fits')
+    expected = data_util.get_local_headers_from_fits(test_fqn)
+    assert len(test_result) == 3, 'wrong HDU count'
+    for actual, expected_header in zip(test_result, expected):
+        assert list(actual.keys()) == list(expected_header.keys()), 'wrong keywords'
+    assert test_result[0].get('OBJECT') == 'M31', 'wrong primary value'
+    assert test_result[1].get('EXTNAME') == 'SCI', 'wrong extension'
+    assert test_result[-1].get('NAXIS2') == 5, 'wrong table'
+
+    # a gzip'd file is not laid out in FITS blocks
+    test_gz_fqn = f'{tmp_path}/gzip.fits.gz'
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(name='SCI')]).writeto(test_gz_fqn)
+    test_gz_storage_name = mc.StorageName(file_name='gzip.fits.gz', source_names=[test_gz_fqn])
+    test_subject.set_headers(test_gz_storage_name)
+    test_result = test_subject.headers.get(test_gz_storage_name.destination_uris[0])
+    assert len(test_result) == 2, 'expect the fall back to astropy'
+    assert test_result[1].get('EXTNAME') == 'SCI', 'wrong fall back extension'
+
+
+def test_vault_reader_headers(test_config):
+    test_text = "SIMPLE  =                    T\nOBJECT  = 'M31'\nEND\nXTENSION= 'IMAGE   '\nEXTNAME = 'SCI'\nEND\n"
+    binary = BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(data=np.full((2, 2), -1.5), name='SCI')]).writeto(binary)
+    test_client = Mock()
+    test_client.get_node_url.return_value = 'https://localhost/files/vault/test/vault.fits'
+    mc.StorageName.collection = 'TEST'
+    test_subject = reader_composable.VaultReader(test_client)
+    for content in [test_text.encode('utf-8'), binary.getvalue()]:
+        test_client.open.return_value.read.return_value = content
+        test_storage_name = mc.StorageName(file_name='vault.fits', source_names=['vos:goliaths/test/vault.fits'])
+        test_subject.set_headers(test_storage_name)
+        test_result = test_subject.headers.get('cadc:TEST/vault.fits')
+        assert len(test_result) == 2, 'wrong HDU count'
+        assert test_result[1].get('EXTNAME') == 'SCI', 'wrong extension'
+        assert test_client.open.call_args.kwargs.get('view') == 'header', 'retrieve the header view'
+        assert test_client.open.call_args.kwargs.get('url') == [
+            'https://localhost/files/vault/test/vault.fits?META=true'
+        ], 'expect the SODA header parameter'
+        assert test_client.open.return_value.close.called, 'expect close'
+        assert not test_client.copy.called, 'no temporary file'
+        test_subject.reset()
+
+    test_client.open.side_effect = OSError('vault failure')
+    with pytest.raises(mc.CadcException):
+        test_subject.set_headers(test_storage_name)
+
+
+@pytest.mark.skipif(no_h5py, reason='h5py must be installed')
+def test_h5_reader(test_config, tmp_path):
+    test_fqn = f'{tmp_path}/test.h5'
+    with h5py.File(test_fqn, 'w') as f:
+        f.attrs['OBJECT'] = b'M31'
+        f.attrs['EXPTIME'] = np.float32(2.5)
+        group = f.create_group('sci')
+        group.attrs['FILTER'] = 'r'
+        group.create_dataset('data', data=np.zeros((2, 3)))
+    mc.StorageName.collection = 'TEST'
+    test_storage_name = mc.StorageName(file_name='test.h5', source_names=[test_fqn])
+    test_subject = reader_composable.H5MetadataReader()
+    test_subject.set_headers(test_storage_name)
+    test_result = test_subject.headers.get('cadc:TEST/test.h5')
+    assert isinstance(test_result, ac.H5Headers), 'wrong headers type'
+    assert [ii.name for ii in test_result] == ['/', '/sci', '/sci/data'], 'wrong structure'
+    assert test_result[0].get('OBJECT') == 'M31', 'bytes should be str'
+    assert test_result[0].get('EXPTIME') == 2.5, 'numpy should be python'
+    assert test_result[1].get('FILTER') == 'r', 'wrong group attribute'
+    assert test_result[2].get('FILTER') is None, 'no dataset attribute'
+    assert test_result.h5_file.filename == test_fqn, 'wrong file'
+    assert test_subject.check_structure(test_fqn), 'checked when the headers were read'
+
+    assert reader_composable._estimate_bytes(test_result) >= 3 * 80, 'count the attributes'
+
+    with ac.make_h5_headers(test_fqn) as test_headers:
+        assert test_headers[1]._attributes is None, 'attributes should not be read until they are used'
+        assert 'FILTER' in test_headers[1], 'wrong lazy attributes'
+    assert test_headers.h5_file is None, 'expect the file to be closed'
+
+    # FITS files are still handled
+    test_fits_fqn = f'{tmp_path}/test.fits'
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(name='SCI')]).writeto(test_fits_fqn)
+    test_subject.set_headers(mc.StorageName(file_name='test.fits', source_names=[test_fits_fqn]))
+    assert len(test_subject.headers.get('cadc:TEST/test.fits')) == 2, 'wrong FITS headers'
+
+    test_bad_fqn = f'{tmp_path}/bad.h5'
+    with open(test_bad_fqn, 'wb') as f:
+        f.write(b'not an hdf5 file')
+    assert not test_subject.check_structure(test_bad_fqn), 'expect structure failure'
+    with pytest.raises(mc.CadcException):
+        test_subject.set_headers(mc.StorageName(file_name='bad.h5', source_names=[test_bad_fqn]))
+
+
+def test_metadata_cache(test_config, tmp_path):
+    mc.StorageName.collection = 'TEST'
+    test_storage_names = [
+        mc.StorageName(file_name=f'cache{ii}.fits', source_names=[f'cadc:TEST/cache{ii}.fits']) for ii in range(3)
+    ]
+
+    def _get_head(uri):
+        return ac.make_compact_headers(
+            f"SIMPLE  =                    T\nFILENAME= '{uri}'\nEND\nEXTNAME = 'SCI'\nEND\n"
+        )
+
+    client_mock = Mock()
+    client_mock.get_head.side_effect = _get_head
+    client_mock.info.side_effect = lambda uri: FileInfo(id=uri, md5sum='md5:abc')
+    # the first run retrieves and caches the headers, later runs, with their own MetadataCache instance, don't
+    # retrieve them again
+    for run in range(2):
+        test_subject = reader_composable.StorageClientReader(client_mock)
+        test_subject.cache = reader_composable.MetadataCache(f'{tmp_path}/cache', 1024 * 1024)
+        test_subject.set(test_storage_names[0])
+        test_result = test_subject.headers.get('cadc:TEST/cache0.fits')
+        assert len(test_result) == 2, 'wrong HDU count'
+        assert test_result[0].get('FILENAME') == 'cadc:TEST/cache0.fits', 'wrong header'
+        assert client_mock.get_head.call_count == 1, f'wrong retrieval count for run {run}'
+        assert test_subject.cache.hits == run, 'wrong hit count'
+
+    # a changed file is retrieved again
+    test_subject.reset()
+    client_mock.info.side_effect = lambda uri: FileInfo(id=uri, md5sum='md5:def')
+    test_subject.set(test_storage_names[0])
+    assert client_mock.get_head.call_count == 2, 'changed file'
+    assert test_subject.cache.misses == 1, 'wrong miss count'
+
+    # the least-recently-used headers are removed once the budget is used
+    blob_bytes = max(os.path.getsize(ii) for ii in glob.glob(f'{tmp_path}/cache/*.z'))
+    test_subject.cache = reader_composable.MetadataCache(f'{tmp_path}/cache', 2 * blob_bytes + blob_bytes // 2)
+    for storage_name in test_storage_names[1:]:
+        test_subject.set(storage_name)
+    assert test_subject.cache.evictions == 1, 'wrong eviction count'
+    test_subject.reset()
+    test_subject.set(test_storage_names[0])
+    assert client_mock.get_head.call_count == 5, 'evicted headers are retrieved again'
@@ -68,6 +68,8 @@
 
 import glob
 import os
+import pytest
+import threading
 
 from astropy.table import Table
 from collections import deque
@@ -86,6 +88,7 @@ from caom2pipe import execute_composable as ec
 from caom2pipe import manage_composable as mc
 from caom2pipe import name_builder_composable as nbc
 from caom2pipe.reader_composable import FileMetadataReader
+from caom2pipe import reader_composable
 from caom2pipe import run_composable as rc
 from caom2pipe import name_builder_composable as b
 
@@ -204,6 +207,357 @@ def test_run_todo_file_data_source(clients_mock, test_config, tmpdir):
     clients_mock.return_value.metadata_client.read.assert_called_with('OMM', 'def'), 'wrong e args'
 
 
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+def test_run_todo_file_data_source_parallel(clients_mock, test_config, tmpdir):
+    test_config.change_working_directory(tmpdir)
+    test_config.proxy_fqn = 'test_proxy.pem'
+    clients_mock.return_value.metadata_client.read.side_effect = tc.mock_read
+
+    test_config.work_fqn = f'{tmpdir}/todo.txt'
+    test_obs_ids = [f'def{ii}' for ii in range(10)]
+    with open(test_config.work_fqn, 'w') as f:
+        for obs_id in test_obs_ids:
+            f.write(f'{obs_id}.fits.gz\n')
+        # an entry that shares an observation ID with another entry
+        f.write('def0.fits\n')
+
+    test_config.task_types = [mc.TaskType.VISIT]
+    test_config.log_to_file = True
+    test_chooser = ec.OrganizeChooser()
+    test_result = rc.run_by_todo(config=test_config, chooser=test_chooser, parallelism=4)
+    assert test_result is not None, 'expect a result'
+    assert test_result == 0, 'expect success'
+    assert test_config.parallelism == 4, 'parallelism over-ride'
+
+    with open(test_config.success_fqn) as f:
+        content = f.readlines()
+    assert len(content) == 11, 'wrong number of successes'
+    for obs_id in test_obs_ids:
+        assert any(f' {obs_id} {obs_id}.fits' in line for line in content), f'missing {obs_id}'
+    assert mc.get_file_size(test_config.failure_fqn) == 0, 'expect no failures'
+    assert mc.get_file_size(test_config.retry_fqn) == 0, 'expect no retries'
+    assert clients_mock.return_value.metadata_client.read.call_count == 11, 'wrong read count'
+    # there are no visitors, so there are no changes to write
+    assert not clients_mock.return_value.metadata_client.update.called, 'no updates for unchanged observations'
+    with open(test_config.report_fqn) as f:
+        assert 'Number of Unchanged: 11' in f.read(), 'wrong unchanged count'
+
+
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+def test_run_todo_file_data_source_stages(clients_mock, test_config, tmpdir):
+    test_config.change_working_directory(tmpdir)
+    test_config.proxy_fqn = 'test_proxy.pem'
+    test_config.stage_workers = {'visit': 2, 'modify': 3}
+    clients_mock.return_value.metadata_client.read.side_effect = tc.mock_read
+
+    test_config.work_fqn = f'{tmpdir}/todo.txt'
+    test_obs_ids = [f'def{ii}' for ii in range(10)]
+    with open(test_config.work_fqn, 'w') as f:
+        for obs_id in test_obs_ids:
+            f.write(f'{obs_id}.fits.gz\n')
+
+    test_config.task_types = [mc.TaskType.VISIT, mc.TaskType.MODIFY]
+    test_chooser = ec.OrganizeChooser()
+    stage_calls = []
+    orig_do_stage = ec.OrganizeExecutes.do_stage
+
+    def _mock_do_stage(self, index, storage_name, start_s, record=None):
+        stage_calls.append((index, storage_name.obs_id, threading.current_thread().name))
+        return orig_do_stage(self, index, storage_name, start_s, record)
+
+    with patch('caom2pipe.execute_composable.OrganizeExecutes.do_stage', autospec=True,
+               side_effect=_mock_do_stage):
+        test_result = rc.run_by_todo(config=test_config, chooser=test_chooser)
+    assert test_result == 0, 'expect success'
+    assert len(stage_calls) == 20, 'wrong number of stage executions'
+    for obs_id in test_obs_ids:
+        indices = [index for index, stage_obs_id, _ in stage_calls if stage_obs_id == obs_id]
+        assert indices == [0, 1], f'wrong stage order for {obs_id}'
+    assert all(
+        name.startswith('caom2pipe-visit') for index, _, name in stage_calls if index == 0
+    ), 'visit stage threads'
+    assert all(
+        name.startswith('caom2pipe-modify') for index, _, name in stage_calls if index == 1
+    ), 'modify stage threads'
+
+    with open(test_config.success_fqn) as f:
+        content = f.readlines()
+    assert len(content) == 10, 'wrong number of successes'
+    assert mc.get_file_size(test_config.failure_fqn) == 0, 'expect no failures'
+    with open(test_config.report_fqn) as f:
+        report = f.read()
+    assert 'Stage visit:' in report, f'expect visit utilisation {report}'
+    assert 'of 3 workers' in report, f'expect modify utilisation {report}'
+
+
+class ChangeVisit:
+    @staticmethod
+    def visit(observation, **kwargs):
+        observation.meta_producer = 'change_visit/1.0'
+        return observation
+
+
+def test_run_todo_write_behind(test_config, tmpdir):
+    test_config.change_working_directory(tmpdir)
+    test_config.repo_writers = 2
+    test_config.task_types = [mc.TaskType.SCRAPE]
+    test_clients = ClientCollection(test_config)
+    test_config.task_types = [mc.TaskType.VISIT]
+    repo_client_mock = Mock()
+    repo_client_mock.read.side_effect = tc.mock_read
+
+    def _mock_update(observation):
+        if observation.observation_id == 'def2':
+            raise exceptions.InternalServerException('update failed')
+
+    repo_client_mock.update.side_effect = _mock_update
+    test_clients._metadata_client = repo_client_mock
+    test_config.work_fqn = f'{tmpdir}/todo.txt'
+    with open(test_config.work_fqn, 'w') as f:
+        for ii in range(5):
+            f.write(f'def{ii}.fits.gz\n')
+
+    clean_ups = []
+
+    def _mock_clean_up(data_source, entry, result, current_count):
+        # the entry is cleaned up once the write is done, with the result of the write
+        written = [call.args[0].observation_id for call in repo_client_mock.update.call_args_list]
+        clean_ups.append((entry, result, entry.replace('.fits.gz', '') in written))
+
+    with patch.object(ClientCollection, 'drain', autospec=True, side_effect=ClientCollection.drain) as drain_mock, \
+            patch.object(dsc.TodoFileDataSource, 'clean_up', autospec=True, side_effect=_mock_clean_up):
+        test_result = rc.run_by_todo(
+            config=test_config, clients=test_clients, meta_visitors=[ChangeVisit], metadata_reader=Mock()
+        )
+        assert drain_mock.called, 'expect the queue to be drained'
+    assert test_result == -1, 'expect the write failure to be the result'
+    assert repo_client_mock.update.call_count == 5, 'wrong update count'
+    assert sorted(clean_ups) == [
+        ('def0.fits.gz', 0, True),
+        ('def1.fits.gz', 0, True),
+        ('def2.fits.gz', -1, True),
+        ('def3.fits.gz', 0, True),
+        ('def4.fits.gz', 0, True),
+    ], 'expect each entry cleaned up after its write'
+    assert test_clients._write_queue is None, 'expect the writers to stop'
+    with open(test_config.success_fqn) as f:
+        content = f.read()
+    assert 'def2' not in content and len(content.splitlines()) == 4, 'wrong successes'
+    with open(test_config.failure_fqn) as f:
+        assert 'def2' in f.read(), 'expect the write failure'
+    with open(test_config.retry_fqn) as f:
+        assert f.read().split() == ['def2.fits.gz'], 'expect a retry for the write failure'
+
+
+class TPrefetchReader(reader_composable.MetadataReader):
+    """Record which threads retrieve the metadata."""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def _retrieve_file_info(self, key, source_name):
+        self.threads.append(threading.current_thread().name)
+        self._file_info[key] = FileInfo(id=key, md5sum='md5:abc')
+
+    def _retrieve_headers(self, key, source_name):
+        self.threads.append(threading.current_thread().name)
+        self._headers[key] = []
+
+
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+def test_run_todo_prefetch(clients_mock, test_config, tmpdir):
+    test_config.change_working_directory(tmpdir)
+    test_config.prefetch_depth = 2
+    test_config.task_types = [mc.TaskType.VISIT]
+    clients_mock.return_value.metadata_client.read.side_effect = tc.mock_read
+    test_config.work_fqn = f'{tmpdir}/todo.txt'
+    with open(test_config.work_fqn, 'w') as f:
+        # def1.fits shares an observation with the entry before it, so what was read ahead for it may be out-of-date
+        for entry in ['def0.fits.gz', 'def1.fits.gz', 'def1.fits', 'def2.fits.gz']:
+            f.write(f'{entry}\n')
+    test_reader = TPrefetchReader()
+    test_result = rc.run_by_todo(config=test_config, metadata_reader=test_reader)
+    assert test_result == 0, 'expect success'
+    with open(test_config.success_fqn) as f:
+        assert len(f.readlines()) == 4, 'wrong number of successes'
+    assert len(test_reader.threads) == 8, 'headers and FileInfo, once for each entry'
+    assert all(name.startswith('caom2pipe-prefetch') for name in test_reader.threads), 'retrieved ahead'
+    assert clients_mock.return_value.metadata_client.read.call_count == 5, 'read ahead, plus a read for def1.fits'
+
+
+class GroupBuilder(nbc.StorageNameBuilder):
+    """Entries look like obs_id-part.fits."""
+
+    def build(self, entry):
+        return mc.StorageName(obs_id=entry.split('-')[0], file_name=entry, source_names=[entry])
+
+
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_group')
+def test_run_todo_group_by_obs_id(do_group_mock, do_one_mock, clients_mock, test_config, tmpdir):
+    test_config.change_working_directory(tmpdir)
+    test_config.group_by_obs_id = True
+    test_config.task_types = [mc.TaskType.VISIT]
+    test_config.work_fqn = f'{tmpdir}/todo.txt'
+    with open(test_config.work_fqn, 'w') as f:
+        for entry in ['abc-1.fits', 'def-1.fits', 'abc-2.fits', 'abc-3.fits']:
+            f.write(f'{entry}\n')
+    do_one_mock.return_value = 0
+    do_group_mock.side_effect = lambda storage_names: [0, -1, 0]
+    test_result = rc.run_by_todo(config=test_config, name_builder=GroupBuilder())
+    assert test_result == -1, 'expect the failure to be reported'
+    assert do_group_mock.call_count == 1, 'one group'
+    assert [ii.file_name for ii in do_group_mock.call_args[0][0]] == [
+        'abc-1.fits', 'abc-2.fits', 'abc-3.fits'
+    ], 'wrong group membership'
+    assert do_one_mock.call_count == 1, 'one singleton'
+    assert do_one_mock.call_args[0][0].file_name == 'def-1.fits', 'wrong singleton'
+
+
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
+@patch('caom2pipe.run_composable.BATCH_WINDOW', 2)
+def test_run_todo_set_batch(do_one_mock, clients_mock, test_config, tmpdir):
+    # test that the MetadataReader is given the entries a window at a time, before the first entry of each window is
+    # processed
+    test_config.change_working_directory(tmpdir)
+    test_config.task_types = [mc.TaskType.VISIT]
+    test_config.work_fqn = f'{tmpdir}/todo.txt'
+    with open(test_config.work_fqn, 'w') as f:
+        for ii in range(3):
+            f.write(f'abc{ii}.fits\n')
+    test_reader = Mock()
+    test_batches = []
+
+    def _set_batch(storage_names):
+        test_batches.append([ii.file_name for ii in storage_names])
+
+    def _do_one(storage_name):
+        return 0 if any(storage_name.file_name in batch for batch in test_batches) else -1
+
+    test_reader.set_batch.side_effect = _set_batch
+    do_one_mock.side_effect = _do_one
+    test_result = rc.run_by_todo(config=test_config, metadata_reader=test_reader)
+    assert test_result == 0, 'expect success'
+    assert test_batches == [['abc0.fits', 'abc1.fits'], ['abc2.fits']], 'wrong batches'
+    assert [ii.args[0].file_name for ii in do_one_mock.call_args_list] == [
+        'abc0.fits', 'abc1.fits', 'abc2.fits'
+    ], 'wrong processing order'
+    assert test_reader.reset_batch.call_count == 1, 'batch discarded at the end'
+
+
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
+def test_run_todo_stream_work(do_one_mock, clients_mock, test_config, tmpdir):
+    # test that entries are processed as they are read from the todo file
+    test_config.change_working_directory(tmpdir)
+    test_config.stream_work = True
+    test_config.work_fqn = f'{tmpdir}/todo.txt'
+    with open(test_config.work_fqn, 'w') as f:
+        for ii in range(5):
+            f.write(f'abc{ii}.fits\n')
+    found_counts = []
+
+    def _mock_do_one(storage_name):
+        found_counts.append(test_reporter.all)
+        return 0
+
+    do_one_mock.side_effect = _mock_do_one
+    (
+        test_config, _, test_builder, test_source, test_reader, test_organizer, test_observable, test_reporter,
+    ) = rc.common_runner_init(
+        test_config, None, None, None, None, None, False, None, [], [], None, 'DEFAULT'
+    )
+    test_subject = rc.TodoRunner(
+        test_config, test_organizer, test_builder, test_source, test_reader, test_observable, test_reporter
+    )
+    test_result = test_subject.run()
+    assert test_result == 0, 'expect success'
+    assert found_counts == [1, 2, 3, 4, 5], 'entries should be processed as they are found'
+    assert test_reporter.all == 5, 'wrong number of entries'
+
+
+def test_obs_id_locks(test_config):
+    test_config.parallelism = 2
+    test_subject = rc.TodoRunner(test_config, Mock(), Mock(), Mock(), Mock(), Mock(), Mock())
+    test_locks = set(id(test_subject._lock_obs_id(f'obs{ii}')) for ii in range(rc.OBS_ID_LOCK_STRIPES * 4))
+    assert len(test_locks) <= rc.OBS_ID_LOCK_STRIPES, 'the number of locks is fixed'
+    assert len(test_subject._obs_id_locks) == rc.OBS_ID_LOCK_STRIPES, 'no locks are added'
+    assert test_subject._lock_obs_id('obs0') is test_subject._lock_obs_id('obs0'), 'same lock for an obs_id'
+
+
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
+def test_run_todo_parallel_failures(do_one_mock, clients_mock, test_config, tmpdir):
+    test_config.change_working_directory(tmpdir)
+    test_config.parallelism = 3
+    test_config.work_fqn = f'{tmpdir}/todo.txt'
+    with open(test_config.work_fqn, 'w') as f:
+        for ii in range(20):
+            f.write(f'abc{ii}.fits\n')
+
+    def _mock_do_one_odd_fail(storage_name):
+        if int(storage_name.obs_id.replace('abc', '')) % 2 == 1:
+            raise mc.CadcException('odd failure')
+        return 0
+
+    do_one_mock.side_effect = _mock_do_one_odd_fail
+    test_result = rc.run_by_todo(config=test_config)
+    assert test_result == -1, 'expect failure'
+    assert do_one_mock.call_count == 20, 'wrong number of calls'
+    with open(test_config.retry_fqn) as f:
+        retries = sorted(f.read().split())
+    assert retries == sorted(f'abc{ii}.fits' for ii in range(1, 20, 2)), 'wrong retry content'
+    with open(test_config.failure_fqn) as f:
+        assert len(f.readlines()) == 10, 'wrong failure content'
+
+
+@patch('caom2pipe.data_source_composable.TodoFileDataSource.clean_up')
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
+def test_run_todo_retry_backoff(do_one_mock, clients_mock, clean_up_mock, test_config, tmpdir):
+    test_config.change_working_directory(tmpdir)
+    test_config.log_to_file = True
+    test_config.retry_failures = True
+    test_config.retry_backoff = True
+    test_config.retry_count = 2
+    # 6 ms before the first retry
+    test_config.retry_decay = 0.0001
+    test_config.work_fqn = f'{tmpdir}/todo.txt'
+    with open(test_config.work_fqn, 'w') as f:
+        for ii in range(6):
+            f.write(f'abc{ii}.fits\n')
+
+    attempts = []
+
+    def _mock_do_one_transient(storage_name):
+        # odd entries fail the first time, abc5 always fails
+        attempts.append(storage_name.obs_id)
+        if storage_name.obs_id == 'abc5' or (
+            int(storage_name.obs_id.replace('abc', '')) % 2 == 1 and attempts.count(storage_name.obs_id) == 1
+        ):
+            raise mc.CadcException('transient failure')
+        return 0
+
+    do_one_mock.side_effect = _mock_do_one_transient
+    test_result = rc.run_by_todo(config=test_config)
+    assert test_result == -1, 'expect failure'
+    assert do_one_mock.call_count == 10, 'wrong number of calls'
+    assert attempts[:6] == [f'abc{ii}' for ii in range(6)], 'retries come after the fresh entries'
+    assert attempts.count('abc5') == 3, 'abc5 retries'
+    assert attempts.count('abc1') == 2, 'abc1 retries'
+    assert not os.path.exists(f'{tmpdir}/logs_0'), 'no retry from the retries file'
+    with open(test_config.retry_fqn) as f:
+        assert f.read().split() == ['abc5.fits'], 'only final failures are in the retries file'
+    # the final attempt is the only one with a count that allows clean up of a failure
+    clean_up_mock.assert_has_calls(
+        [call('abc5.fits', -1, 0), call('abc5.fits', -1, 1), call('abc5.fits', -1, 2)], any_order=True
+    )
+    clean_up_mock.assert_any_call('abc1.fits', 0, 1)
+
+
 @patch('caom2pipe.client_composable.ClientCollection', autospec=True)
 @patch('caom2pipe.data_source_composable.CadcTapClient')
 @patch('caom2pipe.client_composable.query_tap_client')
@@ -396,6 +750,46 @@ def test_run_todo_list_dir_data_source_exception(
     ), 'scrape, should be no data client call'
 
 
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+def test_actor_pool(clients_mock, test_config, tmpdir):
+    # the worker processes are forked, so they have the ClientCollection mock
+    test_config.change_working_directory(tmpdir)
+    test_config.task_types = [mc.TaskType.VISIT]
+    test_config.log_to_file = False
+
+    def _mock_read(collection, obs_id):
+        if obs_id == 'bad':
+            raise mc.CadcException('bad read')
+        return tc.mock_read(collection, obs_id)
+
+    clients_mock.return_value.metadata_client.read.side_effect = _mock_read
+    (
+        test_config, _, test_builder, _, _, _, test_observable, _,
+    ) = rc.common_runner_init(
+        test_config, None, None, None, None, None, False, None, [], [], None, 'DEFAULT'
+    )
+    test_entries = [f'def{ii}.fits.gz' for ii in range(6)] + ['bad.fits.gz']
+    test_data_source = Mock()
+    with rc.ActorPool(
+        test_config, actors=2, name_builder=test_builder, observable=test_observable, data_source=test_data_source
+    ) as test_subject:
+        # the entries are a generator, as from DataSource.stream_work
+        results = dict(test_subject.map_unordered(entry for entry in test_entries))
+        assert test_subject._pool is not None, 'expect long-lived workers'
+    assert test_subject._pool is None, 'expect workers to be stopped'
+    assert sorted(results.keys()) == sorted(test_entries), 'wrong entries'
+    assert results['bad.fits.gz'] == -1, 'expect failure'
+    assert test_subject.success == 6, 'wrong success count'
+    assert test_subject.failure == 1, 'wrong failure count'
+    assert sorted(ii.args for ii in test_data_source.clean_up.call_args_list) == sorted(
+        (entry, -1 if entry == 'bad.fits.gz' else 0, 0) for entry in test_entries
+    ), 'expect each entry cleaned up with its result'
+    with open(test_config.success_fqn) as f:
+        assert len(f.readlines()) == 6, 'workers append to the success file'
+    with open(test_config.retry_fqn) as f:
+        assert f.read().split() == ['bad.fits.gz'], 'workers append to the retry file'
+
+
 @patch('caom2pipe.data_source_composable.TodoFileDataSource.clean_up')
 @patch('caom2pipe.client_composable.ClientCollection', autospec=True)
 @patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
@@ -553,6 +947,204 @@ def test_time_box(clients_mock, test_config, tmpdir):
         assert test_work.todo_call_count == 3, 'wrong todo call count'
 
 
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
+def test_time_box_parallel(do_one_mock, clients_mock, test_config, tmpdir):
+    # test that all the entries in a time-box are processed, and the bookmark is the latest entry time in a box
+    test_config.change_working_directory(tmpdir)
+    test_config.interval = 60
+    test_start_time = datetime(2019, 7, 23, 9, 0, tzinfo=tz.UTC)
+    test_end_time = datetime(2019, 7, 23, 11, 0, tzinfo=tz.UTC)
+    _write_state(test_start_time, test_config.state_fqn)
+    do_one_mock.return_value = 0
+
+    class MakeWork(dsc.DataSource):
+
+        def __init__(self):
+            super().__init__(test_config)
+            self.bookmarks = []
+
+        def get_time_box_work(self, prev_exec_dt, exec_dt):
+            state = mc.State(test_config.state_fqn, tz.UTC)
+            self.bookmarks.append(state.get_bookmark(TEST_BOOKMARK))
+            temp = deque()
+            for ii in range(5):
+                temp.append(dsc.StateRunnerMeta(f'{exec_dt.hour}_{ii}.fits', prev_exec_dt + timedelta(minutes=ii)))
+            return temp
+
+    test_work = MakeWork()
+    test_result = rc.run_by_state(
+        test_config,
+        bookmark_name=TEST_BOOKMARK,
+        end_time=test_end_time,
+        source=test_work,
+        parallelism=3,
+    )
+    assert test_result == 0, 'expect success'
+    assert do_one_mock.call_count == 10, 'wrong number of entries processed'
+    assert test_work.bookmarks == [test_start_time, datetime(2019, 7, 23, 9, 4, tzinfo=tz.UTC)], 'bookmarks'
+    test_state = mc.State(test_config.state_fqn, tz.UTC)
+    assert test_state.get_bookmark(TEST_BOOKMARK) == test_end_time, 'final bookmark'
+
+
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
+def test_time_box_prefetch(do_one_mock, clients_mock, test_config, tmpdir):
+    # test that the next time-box is listed while the current time-box is processed, and that the bookmark only
+    # moves once a time-box has been processed
+    test_config.change_working_directory(tmpdir)
+    test_config.interval = 60
+    test_start_time = datetime(2019, 7, 23, 9, 0, tzinfo=tz.UTC)
+    test_end_time = datetime(2019, 7, 23, 12, 0, tzinfo=tz.UTC)
+    _write_state(test_start_time, test_config.state_fqn)
+    listed = {}
+    listers = set()
+    found_counts = []
+
+    class MakeWork(dsc.DataSource):
+
+        def __init__(self):
+            super().__init__(test_config)
+            self._prefetch_time_box_work = True
+            self.bookmarks = []
+
+        def get_time_box_work(self, prev_exec_dt, exec_dt):
+            listers.add(id(self))
+            state = mc.State(test_config.state_fqn, tz.UTC)
+            self.bookmarks.append(state.get_bookmark(TEST_BOOKMARK))
+            self._work = deque()
+            for ii in range(2):
+                self._work.append(
+                    dsc.StateRunnerMeta(f'{exec_dt.hour}_{ii}.fits', prev_exec_dt + timedelta(minutes=ii))
+                )
+            self._capture_todo()
+            listed.setdefault(exec_dt.hour, threading.Event()).set()
+            return self._work
+
+    def _mock_do_one(storage_name):
+        # the entries for a time-box are processed while the next time-box is listed
+        hour = int(storage_name.obs_id.split('_')[0])
+        if hour < 12:
+            assert listed.setdefault(hour + 1, threading.Event()).wait(10), f'{hour + 1} not prefetched'
+        found_counts.append(test_work.reporter.all)
+        return 0
+
+    do_one_mock.side_effect = _mock_do_one
+    test_work = MakeWork()
+    test_result = rc.run_by_state(test_config, bookmark_name=TEST_BOOKMARK, end_time=test_end_time, source=test_work)
+    assert test_result == 0, 'expect success'
+    assert do_one_mock.call_count == 6, 'wrong number of entries processed'
+    # a time-box is listed before the previous time-box has been processed, so the bookmark is one time-box behind
+    assert test_work.bookmarks == [
+        test_start_time, test_start_time, datetime(2019, 7, 23, 9, 1, tzinfo=tz.UTC)
+    ], 'bookmarks'
+    assert id(test_work) not in listers, 'the listing thread has its own DataSource'
+    assert found_counts == [2, 2, 4, 4, 6, 6], 'a prefetched time-box is counted once it is processed'
+    test_state = mc.State(test_config.state_fqn, tz.UTC)
+    assert test_state.get_bookmark(TEST_BOOKMARK) == test_end_time, 'final bookmark'
+
+
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
+def test_time_box_adaptive(do_one_mock, clients_mock, test_config, tmpdir):
+    # test that the interval grows over empty time-boxes, and shrinks over busy time-boxes
+    test_config.change_working_directory(tmpdir)
+    test_config.interval = 10
+    test_config.interval_batch_size = 4
+    test_config.min_interval = 5
+    test_config.max_interval = 80
+    test_start_time = datetime(2019, 7, 23, 0, 0, tzinfo=tz.UTC)
+    test_end_time = datetime(2019, 7, 23, 9, 0, tzinfo=tz.UTC)
+    # one entry every minute after 05:00
+    test_busy_time = datetime(2019, 7, 23, 5, 0, tzinfo=tz.UTC)
+    _write_state(test_start_time, test_config.state_fqn)
+    do_one_mock.return_value = 0
+
+    class MakeWork(dsc.DataSource):
+
+        def __init__(self):
+            super().__init__(test_config)
+            self.intervals = []
+
+        def get_time_box_work(self, prev_exec_dt, exec_dt):
+            self.intervals.append(int((exec_dt - prev_exec_dt).total_seconds() / 60))
+            temp = deque()
+            entry_dt = max(prev_exec_dt, test_busy_time)
+            while entry_dt < exec_dt:
+                temp.append(dsc.StateRunnerMeta(f'{entry_dt.hour}_{entry_dt.minute}.fits', entry_dt))
+                entry_dt += timedelta(minutes=1)
+            return temp
+
+    test_work = MakeWork()
+    test_result = rc.run_by_state(test_config, bookmark_name=TEST_BOOKMARK, end_time=test_end_time, source=test_work)
+    assert test_result == 0, 'expect success'
+    assert test_work.intervals[:5] == [10, 20, 40, 80, 80], 'interval should grow to the maximum'
+    assert min(test_work.intervals[:-1]) == 5, 'interval should shrink to the minimum'
+    assert sum(test_work.intervals) == 9 * 60, 'time-boxes should cover the whole time span'
+    assert do_one_mock.call_count == 4 * 60, 'wrong number of entries processed'
+    with open(test_config.progress_fqn) as f:
+        content = f.readlines()
+    assert len(content) == len(test_work.intervals), 'one progress record per time-box'
+    assert content[0].strip().endswith('interval:: 10'), 'wrong first interval'
+    assert content[3].strip().endswith('interval:: 80'), 'wrong fourth interval'
+    test_state = mc.State(test_config.state_fqn, tz.UTC)
+    assert test_state.get_bookmark(TEST_BOOKMARK) == test_end_time, 'final bookmark'
+
+
+@patch('caom2pipe.client_composable.ClientCollection', autospec=True)
+@patch('caom2pipe.execute_composable.OrganizeExecutes.do_one')
+def test_time_box_checkpoint(do_one_mock, clients_mock, test_config, tmpdir):
+    # the entries completed before a time-box is interrupted are not processed again on restart, the entries that
+    # failed are
+    test_config.change_working_directory(tmpdir)
+    test_config.interval = 60
+    test_config.checkpoint_entries = True
+    test_start_time = datetime(2019, 7, 23, 9, 0, tzinfo=tz.UTC)
+    test_end_time = datetime(2019, 7, 23, 10, 0, tzinfo=tz.UTC)
+    _write_state(test_start_time, test_config.state_fqn)
+    processed = []
+
+    def _mock_do_one_interrupted(storage_name):
+        if len(processed) == 4:
+            # e.g. the node is preempted
+            raise SystemExit('interrupted')
+        processed.append(storage_name.obs_id)
+        return -1 if storage_name.obs_id == 'entry_1' else 0
+
+    class MakeWork(dsc.DataSource):
+
+        def __init__(self):
+            super().__init__(test_config)
+
+        def get_time_box_work(self, prev_exec_dt, exec_dt):
+            return deque(
+                dsc.StateRunnerMeta(f'entry_{ii}.fits', prev_exec_dt + timedelta(minutes=ii)) for ii in range(10)
+            )
+
+    do_one_mock.side_effect = _mock_do_one_interrupted
+    with pytest.raises(SystemExit):
+        rc.run_by_state(test_config, bookmark_name=TEST_BOOKMARK, end_time=test_end_time, source=MakeWork())
+    test_state = mc.State(test_config.state_fqn, tz.UTC)
+    assert test_state.get_bookmark(TEST_BOOKMARK) == test_start_time, 'bookmark does not move mid-box'
+    test_journal = mc.ProgressJournal(test_config.journal_fqn, TEST_BOOKMARK)
+    assert len(test_journal) == 3, 'wrong number of completed entries'
+
+    do_one_mock.reset_mock()
+    do_one_mock.side_effect = None
+    do_one_mock.return_value = 0
+    test_result = rc.run_by_state(
+        test_config, bookmark_name=TEST_BOOKMARK, end_time=test_end_time, source=MakeWork()
+    )
+    assert test_result == 0, 'expect success'
+    assert do_one_mock.call_count == 7, 'completed entries should be skipped'
+    assert sorted(call_args[0][0].obs_id for call_args in do_one_mock.call_args_list) == [
+        f'entry_{ii}' for ii in [1] + list(range(4, 10))
+    ], 'wrong entries processed'
+    test_state = mc.State(test_config.state_fqn, tz.UTC)
+    assert test_state.get_bookmark(TEST_BOOKMARK) == test_end_time, 'final bookmark'
+    assert len(mc.ProgressJournal(test_config.journal_fqn, TEST_BOOKMARK)) == 0, 'journal should be compacted'
+
+
 @patch('caom2pipe.client_composable.ClientCollection', autospec=True)
 def test_time_box_equal(clients_mock, test_config, tmpdir):
     # test that if the end datetime is the same as the start datetime, there are no calls
@@ -642,7 +1234,7 @@ def test_time_box_once_through(clients_mock, test_config, tmpdir):
 @patch('caom2pipe.data_source_composable.LocalFilesDataSource._move_action')
 @patch('caom2pipe.data_source_composable.LocalFilesDataSource.get_work')
 @patch('caom2pipe.client_composable.CAOM2RepoClient')
-@patch('caom2pipe.client_composable.StorageClientWrapper')
+@patch('caom2pipe.client_composable.CompactStorageClientWrapper')
 def test_run_store_ingest_failure(
     data_client_mock,
     repo_client_mock,
@@ -739,7 +1331,7 @@ def test_run_store_ingest_failure(
 @patch('cadcutils.net.ws.WsCapabilities.get_access_url')
 @patch('caom2pipe.data_source_composable.LocalFilesDataSource._move_action')
 @patch('caom2pipe.client_composable.CAOM2RepoClient')
-@patch('caom2pipe.client_composable.StorageClientWrapper')
+@patch('caom2pipe.client_composable.CompactStorageClientWrapper')
 def test_run_store_get_work_failures(
     data_client_mock,
     repo_client_mock,
@@ -849,7 +1441,7 @@ def test_run_store_get_work_failures(
 @patch('caom2pipe.execute_composable.CaomExecute._visit_meta')
 @patch('caom2pipe.data_source_composable.TodoFileDataSource.get_work')
 @patch('caom2pipe.client_composable.CAOM2RepoClient')
-@patch('caom2pipe.client_composable.StorageClientWrapper')
+@patch('caom2pipe.client_composable.CompactStorageClientWrapper')
 def test_run_ingest(
     data_client_mock,
     repo_client_mock,
@@ -216,6 +216,12 @@ def test_run_state(client_mock, tmpdir):
                 elif 'Skipped' in bits[0]:
                     assert bits[1].strip() == '0', 'wrong skipped'
                     found = True
+                elif 'Unchanged' in bits[0]:
+                    assert bits[1].strip() == '1', 'wrong unchanged'
+                    found = True
+                elif 'Short Circuits' in bits[0]:
+                    assert bits[1].strip() == '0', 'wrong short circuits'
+                    found = True
                 assert found, f'{line}'
     assert pass_through_test, 'found a report file and checked it'
 
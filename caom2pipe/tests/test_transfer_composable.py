@@ -72,6 +72,7 @@ import shutil
 from unittest.mock import patch, Mock
 
 from caom2pipe import manage_composable as mc
+from caom2pipe import reader_composable
 from caom2pipe import transfer_composable as tc
 
 import test_conf
@@ -230,3 +231,23 @@ def test_vo_fits_cleanup_transfer():
         for p in ['/tmp/abc.fits', '/tmp/abc.fits.gz']:
             if os.path.exists(p):
                 os.unlink(p)
+
+
+@patch('caom2pipe.astro_composable.check_h5')
+@patch('caom2pipe.manage_composable.http_get')
+def test_http_transfer_h5_structure(get_mock, check_h5_mock, tmp_path):
+    test_source = 'http://localhost/test_file.h5'
+    test_destination = f'{tmp_path}/test_file.h5'
+    with open(test_destination, 'w') as f:
+        f.write('test content')
+    test_subject = tc.HttpTransfer()
+    test_subject.metadata_reader = Mock(spec=reader_composable.H5MetadataReader)
+    test_subject.metadata_reader.check_structure.return_value = True
+    test_subject.get(test_source, test_destination)
+    test_subject.metadata_reader.check_structure.assert_called_with(test_destination)
+    assert not check_h5_mock.called, 'expect the in-process check'
+
+    test_subject.metadata_reader.check_structure.return_value = False
+    with pytest.raises(mc.CadcException):
+        test_subject.get(test_source, test_destination)
+    assert not os.path.exists(test_destination), 'expect the failed file to be removed'
@@ -72,6 +72,7 @@ import traceback
 
 from caom2pipe import astro_composable as ac
 from caom2pipe import manage_composable as mc
+from caom2pipe import reader_composable
 
 
 __all__ = [
@@ -179,6 +180,17 @@ class ScienceTransfer(Transfer):
 
     def __init__(self):
         super().__init__()
+        self._metadata_reader = None
+
+    @property
+    def metadata_reader(self):
+        """A MetadataReader instance. If it is an H5MetadataReader, HDF5
+        files are checked in-process, instead of by h5check."""
+        return self._metadata_reader
+
+    @metadata_reader.setter
+    def metadata_reader(self, value):
+        self._metadata_reader = value
 
     def check(self, dest_fqn, original_fqn):
         result = True
@@ -187,8 +199,12 @@ class ScienceTransfer(Transfer):
             result = ac.check_fitsverify(dest_fqn)
             msg = f'fitsverify error when reading {dest_fqn}'
         elif dest_fqn.endswith('.h5') or dest_fqn.endswith('.hdf5'):
-            result = ac.check_h5(dest_fqn)
-            msg = f'h5check error when reading {dest_fqn}'
+            if isinstance(self._metadata_reader, reader_composable.H5MetadataReader):
+                result = self._metadata_reader.check_structure(dest_fqn)
+                msg = f'HDF5 structure error when reading {dest_fqn}'
+            else:
+                result = ac.check_h5(dest_fqn)
+                msg = f'h5check error when reading {dest_fqn}'
 
         if not result:
             self.failure_action(original_fqn, dest_fqn, msg)
@@ -3,7 +3,7 @@
 # ******************  CANADIAN ASTRONOMY DATA CENTRE  *******************
 # *************  CENTRE CANADIEN DE DONNÉES ASTRONOMIQUES  **************
 #
-#  (c) 2021.                            (c) 2021.
+#  (c) 2026.                            (c) 2026.
 #  Government of Canada                 Gouvernement du Canada
 #  National Research Council            Conseil national de recherches
 #  Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
@@ -65,82 +65,46 @@
 #  : 4 $
 #
 # ***********************************************************************
-#
 
-import ray
+import sys
 import time
 
-from ray.util import ActorPool
-
-from caom2pipe.client_composable import ClientCollection
-from caom2pipe.data_source_composable import DecompressionDataSource
-from caom2pipe.execute_composable import OrganizeExecutes
-from caom2pipe.manage_composable import Config, StorageName
-from caom2pipe.name_builder_composable import GuessingBuilder
-from caom2pipe.reader_composable import StorageClientReader
-from caom2pipe.transfer_composable import CadcTransfer
-
+from caom2pipe.run_composable import ActorPool, common_runner_init
 
-@ray.remote
-class SessionActor:
-    def __init__(self):
-        StorageName.scheme = scheme
-        StorageName.collection = config.collection
-        self._client = ClientCollection(config)
-        self._builder = GuessingBuilder(StorageName)
-        self._store_transfer = CadcTransfer()
-        self._metadata_reader = StorageClientReader(self._client)
-        self._organizer = OrganizeExecutes(
-            config,
-            [],
-            [],
-            store_transfer=self._store_transfer,
-            clients=self._client,
-            metadata_reader=self._metadata_reader,
-        )
-
-    def do_one(self, entry):
-        # _set_logging(config)
-        storage_name = self._builder.build(entry)
-        self._organizer.choose(storage_name)
-        return self._organizer.do_one(storage_name)
 
+MAX_ACTORS = 2
 
-start = time.time()
-# uncomment the following to get a glimpse at what ray is doing
-# environ['RAY_LOG_TO_STDERR'] = '1'
-ray.init()
-config = Config()
-config.get_executors()
-# work_to_do = TodoFileDataSource(config).get_work()
-scheme = 'gemini' if config.collection == 'GEMINI' else 'cadc'
-work_to_do = DecompressionDataSource(
-    config, config.collection, scheme
-).get_cleanup_work()
-print(f'{len(work_to_do)} records to process')
 
-MAX_ACTORS = 2
-x = list()
-for ii in range(MAX_ACTORS):
-    y = SessionActor.remote()
-    x.append(y)
-actor_pool = ActorPool(x)
+def run():
+    start = time.time()
+    (
+        config, _, name_builder, source, _, _, observable, reporter,
+    ) = common_runner_init(
+        None, None, None, None, None, None, False, None, [], [], None, 'DEFAULT'
+    )
+    # the work may be a generator, as from a QueueDataSource, or from stream_work, so count the entries as their
+    # results arrive
+    work_to_do = source.stream_work() if config.stream_work else source.get_work()
+    count = 0
+    with ActorPool(
+        config, actors=MAX_ACTORS, name_builder=name_builder, observable=observable, data_source=source
+    ) as actor_pool:
+        for entry, result in actor_pool.map_unordered(work_to_do):
+            count += 1
+            if result != 0:
+                print(f'{entry} failed')
+    observable.rejected.persist_state()
 
-gen = actor_pool.map_unordered(
-    lambda a, v: a.do_one.remote(v), work_to_do
-)
+    end = time.time()
+    print(f'per task overhead (ms) ={(end - start)*1000/max(count, 1)}')
+    print(f'duration is {end-start}')
+    print(f'{actor_pool.success} successes')
+    print(f'{actor_pool.failure} failures')
+    print(f'{count} total')
+    return 0 if actor_pool.failure == 0 else -1
 
-success = 0
-failure = 0
-for gg in gen:
-    if gg == 0:
-        success += 1
-    else:
-        failure += 1
-end = time.time()
-print(f'per task overhead (ms) ={(end - start)*1000/len(work_to_do)}')
-print(f'duration is {end-start}')
-print(f'{success} successes')
-print(f'{failure} failures')
-print(f'{len(work_to_do)} total')
 
+if __name__ == '__main__':
+    # the guard keeps the worker processes, which import this module under the spawn and forkserver start methods,
+    # from running the pool again
+    sys.exit(run())